@@ -0,0 +1,411 @@
+# bench_data.py
+"""
+Measure how the data layer and the Data-Visualization page scale with the size of the store.
+
+Every dataset seeds a fresh local stand-in for the database (a SQLite file in a
+temporary directory, or the in-memory backend) with synthetic users and periods, then
+times each operation the app performs. The measured user owns ``--share`` of the
+periods and the others are spread over the remaining users, so per-user operations
+grow with the history while lookups still have to find one user among many.
+
+For every operation the suite reports latency percentiles, the round trips to the
+backend per call (storage method calls, and the SQL statements they ran on SQLite)
+and the peak memory allocated by one call under tracemalloc. Read caches are emptied
+before every call, so the numbers are those of a cold page load. Writes go straight
+to the backend, the write-behind journal is bypassed. AppTest adds a fixed cost to
+every run of the page, so an empty script is timed as well and subtracted to give the
+net cost of plug().
+
+Results can be saved as JSON and compared with an earlier run: every operation whose
+median latency grew by more than ``--threshold`` times is reported and the exit status
+is 1, so the suite can gate a change.
+
+Usage:
+    python benchmarks/bench_data.py [--backend sqlite|memory] [--periods 1000 10000 ...]
+        [--users 10 100 ...] [--runs 50] [--budget 30] [--page-runs 5] [--json data.json]
+        [--compare previous.json] [--threshold 1.25]
+"""
+
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from collections import Counter
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from cryptography.fernet import Fernet
+from streamlit.testing.v1 import AppTest
+from logic import authenticator, database, tracker
+from logic.memory_storage import MemoryStorage
+from logic.sqlite_storage import SQLiteStorage
+from logic.storage import set_storage
+from logic.util import MONTHS
+
+# Datasets, paired in order: (periods, users)
+PERIODS = [1_000, 10_000, 100_000, 1_000_000]
+USERS = [10, 100, 10_000, 100_000]
+
+# The user whose operations are timed, and the password every synthetic user shares
+USER = 'bench'
+PASSWORD = 'benchmark'
+
+INCOME_CATEGORIES = ['Salary', 'Bonus', 'Rent income', 'Dividends']
+EXPENSE_CATEGORIES = ['Rent', 'Food', 'Transport', 'Utilities', 'Fun', 'Health', 'Savings']
+
+# The Data-Visualization page, run headless by AppTest against the same storage
+PAGE = f'''
+import sys
+sys.path.insert(0, {ROOT!r})
+from logic.data_plug import plug
+plug()
+'''
+
+# Empty script used to measure the fixed cost of an AppTest run
+BASELINE = 'import streamlit as st'
+
+
+class CountingStorage:
+    """
+    Forwards every call to a backend and counts them, one round trip per call.
+
+    On SQLite the statements each call runs are counted as well, through the trace
+    callback of the backend's connection.
+    """
+
+    def __init__(self, storage):
+        self.storage = storage
+        self.calls = Counter()
+        self.statements = 0
+        connection = getattr(storage, '_connection', None)
+        if connection is not None:
+            connection.set_trace_callback(self._trace)
+
+    def _trace(self, statement: str) -> None:
+        self.statements += 1
+
+    def __getattr__(self, name):
+        attribute = getattr(self.storage, name)
+        if not callable(attribute):
+            return attribute
+
+        def call(*args, **kwargs):
+            self.calls[name] += 1
+            return attribute(*args, **kwargs)
+        return call
+
+    def reset(self) -> None:
+        self.calls.clear()
+        self.statements = 0
+
+
+def synthetic_period(rng: random.Random, index: int) -> dict:
+    """
+    Build the index-th consecutive month of a synthetic history.
+    """
+    incomes = {category: round(rng.uniform(100, 5000), 2) for category in rng.sample(INCOME_CATEGORIES, 2)}
+    expenses = {category: round(rng.uniform(10, 1500), 2) for category in rng.sample(EXPENSE_CATEGORIES, 5)}
+    return {'period': f'{MONTHS[index % 12]} {2000 + index // 12}', 'incomes': incomes, 'expenses': expenses,
+            'comment': f'Synthetic month {index}'}
+
+def seed(storage, periods: int, users: int, share: float, rng: random.Random) -> dict:
+    """
+    Fill an empty backend with one dataset.
+
+    Args:
+        storage (Storage): The backend to fill.
+        periods (int): The number of periods across every user.
+        users (int): The number of registered users, the measured one included.
+        share (float): The fraction of the periods owned by the measured user.
+        rng (random.Random): The source of the synthetic amounts.
+
+    Returns:
+        dict: The periods of the measured user, the usernames and the seeding time.
+    """
+    started = time.perf_counter()
+    password = authenticator.encrypt_password(PASSWORD)
+    usernames = [USER] + [f'user{index}' for index in range(1, users)]
+    for username in usernames:
+        storage.insert_user(f'{username}@example.com', username, password, '2024-01-01 00:00:00')
+
+    own = max(1, int(periods * share)) if users > 1 else periods
+    entries = [synthetic_period(rng, index) for index in range(own)]
+    storage.save_periods(USER, entries)
+
+    # The rest of the periods, spread as evenly as possible over the other users
+    others = usernames[1:]
+    for position, username in enumerate(others):
+        count = (periods - own) // len(others) + (position < (periods - own) % len(others))
+        if count:
+            storage.save_periods(username, (synthetic_period(rng, index) for index in range(count)))
+
+    # Three instalment accounts, for save_data
+    storage.save_accounts(USER, [dict(id=None, name=name, principal=20000.0, rate=6.5, term_months=60,
+                                      payment=400.0, opening_paid=0.0) for name in ('ING', 'CEC', 'Orange')])
+    return {'periods': [entry['period'] for entry in entries], 'usernames': usernames,
+            'seed_s': time.perf_counter() - started}
+
+
+def operations(context: dict, rng: random.Random) -> dict:
+    """
+    Build the timed operations of a dataset.
+
+    Each operation is a function that prepares one call outside the timing and returns
+    the call to time.
+    """
+    periods, usernames = context['periods'], context['usernames']
+    year = 2024
+    accounts = tracker.load_accounts(USER, year)
+    inserted = iter(range(len(periods), sys.maxsize))
+
+    def login():
+        username = rng.choice(usernames)
+
+        def call():
+            # The same steps as the login form of main.py
+            assert authenticator.validate_username(username)
+            user = authenticator.get_user(username)
+            assert user and authenticator.verify_password(user, PASSWORD)
+        return call
+
+    def insert_period():
+        entry = synthetic_period(rng, next(inserted))
+        return lambda: database.insert_period(entry['period'], entry['incomes'], entry['expenses'],
+                                              entry['comment'], username=USER)
+
+    def get_period():
+        period = rng.choice(periods)
+        database.invalidate_user(USER)
+        return lambda: database.get_period(period, username=USER)
+
+    def get_all_periods():
+        database.invalidate_user(USER)
+        return lambda: database.get_all_periods(username=USER)
+
+    def load_all_data():
+        return lambda: database.load_all_data(username=USER)
+
+    def save_data():
+        previous = tracker.load_data(accounts, year, USER)
+        grid = previous.copy()
+        month = rng.randrange(12)
+        grid.amounts[month] = [rng.uniform(100, 500) for _ in accounts]
+        grid.salary[month] = rng.uniform(4000, 6000)
+        return lambda: tracker.save_data(grid, previous, USER)
+
+    return {
+        'login': login,
+        'insert_period': insert_period,
+        'get_period': get_period,
+        'get_all_periods': get_all_periods,
+        'load_all_data': load_all_data,
+        'save_data': save_data,
+    }
+
+def page_operation(context: dict, rng: random.Random):
+    """
+    Build the timed operation of the Data-Visualization page: plug() after a period is
+    picked and "Plug Data" is pressed, which lists the periods, loads the chosen one
+    and renders its metrics and Sankey figure.
+    """
+    at = AppTest.from_string(PAGE, default_timeout=600)
+    at.session_state['username'] = USER
+    database.invalidate_user(USER)
+    at.run()
+    if at.exception:
+        raise RuntimeError(at.exception[0].message)
+
+    def plug():
+        at.selectbox[0].select(rng.choice(context['periods']))
+        at.button[0].click()
+        database.invalidate_user(USER)
+
+        def call():
+            at.run()
+            if at.exception:
+                raise RuntimeError(at.exception[0].message)
+        return call
+    return plug
+
+
+def percentiles(samples: list) -> dict:
+    """
+    Summarize latencies in milliseconds.
+    """
+    cuts = statistics.quantiles(samples, n=100, method='inclusive') if len(samples) > 1 else samples * 99
+    return {'p50': cuts[49], 'p90': cuts[89], 'p99': cuts[98], 'max': max(samples),
+            'mean': statistics.fmean(samples)}
+
+def measure(prepare, runs: int, counter: CountingStorage, budget: float) -> dict:
+    """
+    Time one operation.
+
+    Args:
+        prepare (callable): Prepares one call and returns it.
+        runs (int): The number of timed calls.
+        counter (CountingStorage): The backend wrapper counting round trips.
+        budget (float): Seconds after which no further call is timed, once three were.
+
+    Returns:
+        dict: Latency percentiles, round trips per call and the peak memory of one call.
+    """
+    timings, calls, statements = [], [], []
+    deadline = time.perf_counter() + budget
+    for _ in range(runs):
+        if len(timings) >= 3 and time.perf_counter() > deadline:
+            break
+        call = prepare()
+        counter.reset()
+        started = time.perf_counter()
+        call()
+        timings.append((time.perf_counter() - started) * 1000)
+        calls.append(sum(counter.calls.values()))
+        statements.append(counter.statements)
+    breakdown = dict(counter.calls)
+
+    # One more call under tracemalloc, which would slow the timed ones down
+    call = prepare()
+    tracemalloc.start()
+    try:
+        call()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {
+        'runs': len(timings),
+        'latency_ms': percentiles(timings),
+        'roundtrips': {'calls': statistics.median(calls), 'statements': statistics.median(statements),
+                       'by_method': breakdown},
+        'peak_kib': peak / 1024,
+    }
+
+
+def run_dataset(backend: str, periods: int, users: int, args, directory: str) -> dict:
+    """
+    Seed a fresh backend with one dataset and time every operation against it.
+    """
+    rng = random.Random(args.seed)
+    if backend == 'sqlite':
+        storage = SQLiteStorage(os.path.join(directory, f'bench_{periods}_{users}.db'))
+    else:
+        storage = MemoryStorage()
+    context = seed(storage, periods, users, args.share, rng)
+    counter = CountingStorage(storage)
+    set_storage(counter)
+    database.invalidate_user(USER)
+
+    results = {}
+    for name, prepare in operations(context, rng).items():
+        results[name] = measure(prepare, args.runs, counter, args.budget)
+    if args.page_runs:
+        results['plug'] = measure(page_operation(context, rng), args.page_runs, counter, args.budget)
+        results['plug']['net_p50_ms'] = max(results['plug']['latency_ms']['p50'] - args.baseline_ms, 0.0)
+
+    if backend == 'sqlite':
+        storage._connection.close()
+    return {'periods': periods, 'users': users, 'user_periods': len(context['periods']),
+            'seed_s': context['seed_s'], 'operations': results}
+
+
+def compare(results: dict, previous: dict, threshold: float) -> list:
+    """
+    List the operations whose median latency grew by more than ``threshold`` times.
+
+    Args:
+        results (dict): The results of this run.
+        previous (dict): The results of an earlier run, loaded from its JSON file.
+        threshold (float): The tolerated ratio of the medians.
+
+    Returns:
+        list: (periods, users, operation, previous p50, p50) tuples.
+    """
+    earlier = {(dataset['periods'], dataset['users'], name): result['latency_ms']['p50']
+               for dataset in previous['datasets'] for name, result in dataset['operations'].items()}
+    regressions = []
+    for dataset in results['datasets']:
+        for name, result in dataset['operations'].items():
+            before = earlier.get((dataset['periods'], dataset['users'], name))
+            after = result['latency_ms']['p50']
+            if before and after > before * threshold:
+                regressions.append((dataset['periods'], dataset['users'], name, before, after))
+    return regressions
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Benchmark the data layer and page handlers on synthetic datasets.')
+    parser.add_argument('--backend', choices=['sqlite', 'memory'], default='sqlite', help='the local database stand-in')
+    parser.add_argument('--periods', type=int, nargs='+', default=PERIODS, help='periods of every dataset')
+    parser.add_argument('--users', type=int, nargs='+', default=USERS, help='users of every dataset, paired with --periods')
+    parser.add_argument('--share', type=float, default=0.5, help='fraction of the periods owned by the measured user')
+    parser.add_argument('--runs', type=int, default=50, help='timed calls per data operation')
+    parser.add_argument('--budget', type=float, default=30, help='seconds spent timing one operation at most')
+    parser.add_argument('--page-runs', type=int, default=5, help='timed runs of plug(), 0 to skip the page')
+    parser.add_argument('--seed', type=int, default=0, help='seed of the synthetic data')
+    parser.add_argument('--json', help='also write the results to this file')
+    parser.add_argument('--compare', help='results of an earlier run to check for regressions')
+    parser.add_argument('--threshold', type=float, default=1.25, help='median slowdown reported as a regression')
+    args = parser.parse_args()
+    if len(args.periods) != len(args.users):
+        parser.error('--periods and --users need the same number of values')
+
+    # Direct writes only, and a key for the synthetic passwords when .env has none
+    database.WRITE_BEHIND = False
+    if not authenticator.KEY:
+        authenticator.KEY = Fernet.generate_key()
+
+    # The fixed cost of an AppTest run, left out of the net cost of the page
+    args.baseline_ms = 0.0
+    if args.page_runs:
+        empty = AppTest.from_string(BASELINE)
+        empty.run()
+        timings = []
+        for _ in range(max(args.page_runs, 5)):
+            started = time.perf_counter()
+            empty.run()
+            timings.append((time.perf_counter() - started) * 1000)
+        args.baseline_ms = statistics.median(timings)
+
+    datasets = []
+    with tempfile.TemporaryDirectory() as directory:
+        for periods, users in zip(args.periods, args.users):
+            print(f'Seeding {periods} periods and {users} users ({args.backend})...', flush=True)
+            dataset = run_dataset(args.backend, periods, users, args, directory)
+            datasets.append(dataset)
+            print(f'{"operation":<17}{"p50 ms":>10}{"p90 ms":>10}{"p99 ms":>10}{"calls":>7}{"stmts":>7}{"peak KiB":>11}')
+            for name, result in dataset['operations'].items():
+                latency, roundtrips = result['latency_ms'], result['roundtrips']
+                print(f'{name:<17}{latency["p50"]:>10.2f}{latency["p90"]:>10.2f}{latency["p99"]:>10.2f}'
+                      f'{roundtrips["calls"]:>7g}{roundtrips["statements"]:>7g}{result["peak_kib"]:>11.1f}')
+            if 'plug' in dataset['operations']:
+                print(f'plug net of the {args.baseline_ms:.1f} ms AppTest baseline: '
+                      f'{dataset["operations"]["plug"]["net_p50_ms"]:.2f} ms')
+            print(f'seeded in {dataset["seed_s"]:.1f} s, {dataset["user_periods"]} periods of the measured user\n')
+
+    results = {'python': sys.version.split()[0], 'backend': args.backend, 'share': args.share,
+               'seed': args.seed, 'apptest_baseline_ms': args.baseline_ms, 'datasets': datasets}
+    if args.json:
+        with open(args.json, 'w') as fp:
+            json.dump(results, fp, indent=2)
+        print(f'Wrote {args.json}')
+
+    if args.compare:
+        with open(args.compare) as fp:
+            previous = json.load(fp)
+        if previous.get('backend') != args.backend:
+            print(f'Note: {args.compare} was measured on the {previous.get("backend")} backend')
+        regressions = compare(results, previous, args.threshold)
+        for periods, users, name, before, after in regressions:
+            print(f'Regression: {name} with {periods} periods and {users} users, p50 {before:.2f} -> {after:.2f} ms')
+        if regressions:
+            sys.exit(1)
+        print(f'No operation is more than {args.threshold:g}x slower than in {args.compare}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,131 @@
+# bench_instalments.py
+"""
+Compare the rerun latency of the two layouts of the instalments page.
+
+The page runs headless through Streamlit's AppTest with its database helpers
+replaced by an in-memory store, so only rendering is measured, not the database.
+AppTest adds a fixed cost to every run, so an empty script is timed as well and
+subtracted to give the net cost of the page.
+
+Usage:
+    python benchmarks/bench_instalments.py [--runs 20]
+"""
+
+import argparse
+import os
+import statistics
+import time
+from streamlit.testing.v1 import AppTest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Script run by AppTest, the store lives in session state so edits survive reruns
+SCRIPT = f'''
+import sys
+sys.path.insert(0, {ROOT!r})
+import numpy as np
+import streamlit as st
+from logic import tracker
+from logic.instalments import InstalmentGrid
+
+ACCOUNTS = [
+    dict(id=1, name='ING', principal=13529.00, rate=0, term_months=None, payment=None, opening_paid=3699.81),
+    dict(id=2, name='CEC', principal=38660.00, rate=0, term_months=None, payment=None, opening_paid=594.35),
+    dict(id=3, name='Orange', principal=None, rate=0, term_months=None, payment=None, opening_paid=0),
+]
+if 'bench_store' not in st.session_state:
+    values = np.round(np.random.default_rng(0).uniform(0, 900, (12, 4)), 2)
+    values[:, -1] += 5000
+    st.session_state['bench_store'] = InstalmentGrid([a['name'] for a in ACCOUNTS], values, ids=[a['id'] for a in ACCOUNTS])
+store = st.session_state['bench_store']
+# The page reads and writes the rows of the logged in user
+st.session_state['username'] = 'bench'
+
+def save_data(grid, previous=None, username=None):
+    changed = grid.changed(previous)
+    st.session_state['bench_store'] = grid.copy()
+    return list(changed)
+
+tracker.load_years = lambda username=None: [store.year]
+tracker.load_accounts = lambda username=None, year=None: ACCOUNTS
+tracker.load_data = lambda accounts=None, year=None, username=None: store.copy()
+tracker.save_data = save_data
+tracker.f_instalments()
+'''
+
+# Empty script used to measure the fixed cost of an AppTest run
+BASELINE = 'import streamlit as st'
+
+
+def count_widgets(at: AppTest) -> int:
+    """
+    Counts the interactive elements rendered by the last run.
+    """
+    kinds = ('checkbox', 'number_input', 'radio', 'button')
+    return sum(len(getattr(at, kind)) for kind in kinds) + len(at.get('arrow_data_frame'))
+
+
+def time_reruns(at: AppTest, runs: int) -> list:
+    """
+    Reruns an app that already ran once and returns each latency in milliseconds.
+    """
+    timings = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        at.run()
+        timings.append((time.perf_counter() - started) * 1000)
+    return timings
+
+
+def measure(layout: str, runs: int, baseline: float) -> dict:
+    """
+    Times repeated reruns of one layout.
+
+    Args:
+        layout (str): "Cells" or "Grid".
+        runs (int): The number of timed reruns.
+        baseline (float): The median latency of an empty script, in milliseconds.
+
+    Returns:
+        dict: Latencies in milliseconds and the number of widgets on the page.
+    """
+    at = AppTest.from_string(SCRIPT, default_timeout=120)
+    at.run()
+    if layout != at.radio(key='instalments_layout').value:
+        at.radio(key='instalments_layout').set_value(layout).run()
+    if at.exception:
+        raise RuntimeError(at.exception[0].message)
+
+    timings = time_reruns(at, runs)
+    median = statistics.median(timings)
+    return {
+        'layout': layout,
+        'widgets': count_widgets(at),
+        'median_ms': median,
+        'max_ms': max(timings),
+        'net_ms': max(median - baseline, 0.0),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Benchmark the rerun latency of the instalments page layouts.')
+    parser.add_argument('--runs', type=int, default=20, help='timed reruns per layout')
+    args = parser.parse_args()
+
+    empty = AppTest.from_string(BASELINE)
+    empty.run()
+    baseline = statistics.median(time_reruns(empty, args.runs))
+
+    results = [measure(layout, args.runs, baseline) for layout in ('Cells', 'Grid')]
+    print(f"AppTest baseline: {baseline:.1f} ms per run")
+    print(f"{'layout':<8}{'widgets':>9}{'median ms':>11}{'max ms':>9}{'net ms':>9}")
+    for result in results:
+        print(f"{result['layout']:<8}{result['widgets']:>9}{result['median_ms']:>11.1f}"
+              f"{result['max_ms']:>9.1f}{result['net_ms']:>9.1f}")
+    cells, grid = results
+    if grid['net_ms']:
+        print(f"Grid reruns cost {cells['net_ms'] / grid['net_ms']:.1f}x less than the cell widgets")
+
+
+if __name__ == '__main__':
+    main()
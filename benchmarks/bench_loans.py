@@ -0,0 +1,47 @@
+# bench_loans.py
+"""
+Time the vectorized loan projections for a large book of random loans.
+
+Usage:
+    python benchmarks/bench_loans.py [--loans 500] [--months 360] [--repeat 20]
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import time
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from logic.loans import LoanBook, annuity_payment
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Benchmark the loan amortization projections.')
+    parser.add_argument('--loans', type=int, default=500, help='number of loans in the book')
+    parser.add_argument('--months', type=int, default=360, help='months projected')
+    parser.add_argument('--repeat', type=int, default=20, help='timed repetitions')
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    principal = rng.uniform(1_000, 500_000, args.loans)
+    rate = rng.uniform(0, 12, args.loans)
+    term = rng.integers(12, args.months + 1, args.loans)
+    book = LoanBook([f'Loan {i}' for i in range(args.loans)], principal, rate,
+                    annuity_payment(principal, rate, term), rng.uniform(0, 0.5, args.loans) * principal)
+
+    timings = []
+    for _ in range(args.repeat):
+        started = time.perf_counter()
+        book.balances(args.months)
+        book.payoff_months()
+        book.interest(args.months)
+        timings.append((time.perf_counter() - started) * 1000)
+    print(f'{args.loans} loans x {args.months} months: median {statistics.median(timings):.2f} ms, '
+          f'max {max(timings):.2f} ms')
+
+
+if __name__ == '__main__':
+    main()
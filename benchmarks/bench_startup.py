@@ -0,0 +1,148 @@
+# bench_startup.py
+"""
+Measure the cold import cost of the app entry points.
+
+Every run starts a fresh interpreter with ``-X importtime``, imports one target and
+reports the wall time of the whole process, the cumulative import time of the target,
+the packages that took longest and which heavy dependencies ended up loaded. The net
+column leaves out the time spent importing Streamlit in the same process, so it is
+what the app adds on top of it.
+
+Usage:
+    python benchmarks/bench_startup.py [--runs 5] [--top 8] [--json startup.json] [targets ...]
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+from collections import defaultdict
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# What runs before login, after login and on the tracker page
+TARGETS = ['main', 'logic.app', 'logic.tracker']
+
+# The fixed cost every target pays, left out of the net import time
+BASELINE = 'streamlit'
+
+# Dependencies that should only load on the pages that use them
+HEAVY = ['pandas', 'numpy', 'pyarrow', 'plotly', 'cryptography', 'streamlit_authenticator',
+         'streamlit_option_menu', 'pymysql']
+
+# Imports the target and prints the top level packages it left in sys.modules
+PROBE = 'import sys, json, {target}; print(json.dumps(sorted({{name.split(".")[0] for name in sys.modules}})))'
+
+
+def parse_importtime(stderr: str) -> list:
+    """
+    Parse the ``-X importtime`` report of one interpreter.
+
+    Args:
+        stderr (str): The standard error of the process.
+
+    Returns:
+        list: (module, self microseconds, cumulative microseconds, depth) tuples.
+    """
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        depth = (len(name) - len(name.lstrip())) // 2
+        rows.append((name.strip(), int(self_us), int(cumulative_us), depth))
+    return rows
+
+def run_once(target: str) -> dict:
+    """
+    Import a target in a fresh interpreter and time it.
+
+    Args:
+        target (str): The module to import.
+
+    Returns:
+        dict: The wall time, the import time with and without Streamlit, the time per top
+        level package and the packages loaded.
+    """
+    started = time.perf_counter()
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', PROBE.format(target=target)],
+                            cwd=ROOT, capture_output=True, text=True)
+    wall_ms = (time.perf_counter() - started) * 1000
+    if result.returncode:
+        raise RuntimeError(f'Importing {target} failed:\n{result.stderr[-2000:]}')
+
+    rows = parse_importtime(result.stderr)
+    packages = defaultdict(int)
+    for name, self_us, _, _ in rows:
+        packages[name.split('.')[0]] += self_us
+    import_us = next(cumulative for name, _, cumulative, depth in rows if name == target and depth == 0)
+    baseline_us = next((cumulative for name, _, cumulative, _ in rows if name == BASELINE), 0)
+    return {
+        'wall_ms': wall_ms,
+        'import_ms': import_us / 1000,
+        'net_import_ms': (import_us - baseline_us) / 1000,
+        'packages_ms': {name: us / 1000 for name, us in packages.items()},
+        'loaded': json.loads(result.stdout.strip().splitlines()[-1]),
+    }
+
+def measure(target: str, runs: int, top: int) -> dict:
+    """
+    Summarize several cold imports of a target.
+
+    Args:
+        target (str): The module to import.
+        runs (int): The number of fresh interpreters.
+        top (int): The number of slowest packages to report.
+
+    Returns:
+        dict: Median and maximum timings, the slowest packages and the heavy dependencies loaded.
+    """
+    samples = [run_once(target) for _ in range(runs)]
+    packages = defaultdict(list)
+    for sample in samples:
+        for name, ms in sample['packages_ms'].items():
+            packages[name].append(ms)
+    slowest = sorted(((name, statistics.median(ms)) for name, ms in packages.items()), key=lambda item: -item[1])
+    imports = [sample['import_ms'] for sample in samples]
+    nets = [sample['net_import_ms'] for sample in samples]
+    walls = [sample['wall_ms'] for sample in samples]
+    return {
+        'target': target,
+        'runs': runs,
+        'import_ms': {'median': statistics.median(imports), 'max': max(imports)},
+        'net_import_ms': {'median': statistics.median(nets), 'max': max(nets)},
+        'wall_ms': {'median': statistics.median(walls), 'max': max(walls)},
+        'slowest_packages_ms': dict((name, round(ms, 2)) for name, ms in slowest[:top]),
+        'heavy_loaded': [name for name in HEAVY if name in samples[-1]['loaded']],
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Benchmark the cold import time of the app.')
+    parser.add_argument('targets', nargs='*', default=TARGETS, help='modules to import')
+    parser.add_argument('--runs', type=int, default=5, help='fresh interpreters per target')
+    parser.add_argument('--top', type=int, default=8, help='slowest packages listed per target')
+    parser.add_argument('--json', help='also write the results to this file')
+    args = parser.parse_args()
+
+    results = [measure(target, args.runs, args.top) for target in args.targets]
+
+    print(f'{"target":<16}{"import ms":>11}{"net ms":>9}{"wall ms":>10}  heavy dependencies loaded')
+    for result in results:
+        print(f'{result["target"]:<16}{result["import_ms"]["median"]:>11.1f}{result["net_import_ms"]["median"]:>9.1f}'
+              f'{result["wall_ms"]["median"]:>10.1f}  {", ".join(result["heavy_loaded"]) or "-"}')
+    for result in results:
+        slowest = ', '.join(f'{name} {ms:.1f}' for name, ms in result['slowest_packages_ms'].items())
+        print(f'{result["target"]}: {slowest}')
+
+    if args.json:
+        with open(args.json, 'w') as fp:
+            json.dump({'python': sys.version.split()[0], 'results': results}, fp, indent=2)
+        print(f'Wrote {args.json}')
+
+
+if __name__ == '__main__':
+    main()
@@ -1,8 +1,7 @@
 # app.py
 
+from datetime import datetime
 import streamlit as st
-import plotly.graph_objects as go
-from streamlit_option_menu import option_menu
 from logic.navigation import nav
 from logic.currency import curr
 from logic.period import per
@@ -11,9 +10,10 @@ from logic.income import inc
 from logic.expense import exp
 from logic.data_plug import *
 from logic.database import *
-from logic.tracker import *
-from logic.authenticator import *
-import datetime
+from logic.export import export_widget, period_frames
+from logic.util import OWNER
+from logic.settings import snow
+from logic.metrics import section
 
 def og_app():
     """
@@ -21,72 +21,17 @@ def og_app():
 
     Handles the user's choice between the Data Entry, Data Visualization, and Data Tracker sections.
     """
-    # Check the current month and display snow effect if it's Nov, Dec, or Jan
-    if 'snow_initialized' not in st.session_state:
-        current_month = datetime.datetime.now().month
-        if current_month in [11, 12, 1, 2]:
-            # Generate 50 unique snowflake animations
-            snowflake_animations = [
-                f"""
-                @keyframes fall-{i} {{
-                    from {{
-                        transform: translate({(i % 5) * 20 - 50}vw, -10px) rotate(0deg);
-                    }}
-                    to {{
-                        transform: translate({((i % 7) - 3) * 15}vw, 110vh) rotate({i * 360}deg);
-                    }}
-                }}""" for i in range(50)
-            ]
-
-            custom_css = f"""
-                <style>
-                    {' '.join(snowflake_animations)}
-
-                    {''.join([f'''
-                    .snowflake:nth-child({i}) {{
-                        opacity: {0.4 + (i % 6) * 0.1};
-                        width: {1 + (i % 4)}px;
-                        height: {1 + (i % 4)}px;
-                        left: {(i * 2) % 100}vw;
-                        animation: fall-{i % 50} {5 + (i % 7)}s linear infinite;
-                        animation-delay: -{i * 0.2}s;
-                        pointer-events: none;
-                    }}''' for i in range(150)])}
-
-                    .snowflake {{
-                        position: fixed;
-                        background: white;
-                        border-radius: 50%;
-                        pointer-events: none;
-                    }}
-
-                    .snowfall {{
-                        position: fixed;
-                        top: 0;
-                        left: 0;
-                        width: 100vw;
-                        height: 100vh;
-                        z-index: 9999;
-                        pointer-events: none;
-                    }}
-                </style>
-                <div class="snowfall">
-                    {''.join(['<div class="snowflake"></div>' for _ in range(150)])}
-                </div>
-            """
-            st.session_state.snow_css = custom_css
-            st.session_state.snow_initialized = True
-
-    # Render the snow if it's initialized
-    if 'snow_css' in st.session_state:
-        st.markdown(st.session_state.snow_css, unsafe_allow_html=True)
+    # Display the snow effect in the winter months, the markup is built once per process
+    with section('snow'):
+        snow()
 
     # Use nav to determine user's choice
-    selected_choice = nav()
+    with section('nav'):
+        selected_choice = nav()
 
     # Handle Data Entry section logic.
     if selected_choice == "Data-Entry":
-        with st.form(key="main_form"):
+        with section('data_entry'), st.form(key="main_form"):
             # Period (Month & Year) Entry
             month, year = per()
             period = f"{month} {year}"
@@ -108,21 +53,31 @@ def og_app():
                 incomes = {income: st.session_state.get(f"income_{income}", 0) for income in incomes_list}
                 expenses = {expense: st.session_state.get(f"expense_{expense}", 0) for expense in expenses_list}
 
-                # Fetch the current data for the selected period
-                current_period_data = get_period(period)
-
-                # Check if there is an existing comment and append the new one
-                if current_period_data and "comment" in current_period_data:
-                    expense_comment = current_period_data["comment"] + "\n\n" + expense_comment
-                else:
-                    expense_comment = expense_comment
-
-                # Insert data for both Incomes and Expenses with the appended expense_comment
-                insert_period(period, incomes, expenses, expense_comment)
+                # Insert data for both Incomes and Expenses, appending expense_comment to any
+                # existing comment in the same statement
+                insert_period(period, incomes, expenses, expense_comment, append_comment=True)
 
                 # Display the saved data
                 st.success("Data Saved")
 
+        # Saves confirmed above that the database kept rejecting are not retried on their own
+        rejected = rejected_saves()
+        if rejected:
+            st.warning(f"{len(rejected)} saved period(s) could not be written to the database.")
+            for entry in rejected:
+                saved = datetime.fromtimestamp(entry['created_at']).strftime('%Y-%m-%d %H:%M')
+                st.caption(f"{entry['period']}, saved {saved}: {entry['last_error']}")
+            keys = [entry['key'] for entry in rejected]
+            b1, b2 = st.columns(2)
+            with b1:
+                if st.button("Retry"):
+                    retry_saves(keys)
+                    st.rerun()
+            with b2:
+                if st.button("Discard"):
+                    discard_saves(keys)
+                    st.rerun()
+
     # Handle Data Visualization section logic.
     elif selected_choice == "Data-Visualization":
         """
@@ -133,7 +88,12 @@ def og_app():
             Clears all data from the database.
             """
             clear_data()
-        plug()
+        with section('plug'):
+            plug()
+
+        # Stream the whole period history into a file on request
+        with section('export'):
+            export_widget("History", period_frames, key="history_export", file_name="history")
 
     # Handle Tracker section logic.
     elif selected_choice == "Data-Tracker":
@@ -141,11 +101,14 @@ def og_app():
         Handles the Data Tracker section logic.
         """
         username = st.session_state.get('username', None)
-        if username == "cosmint":
+        if username == OWNER:
             """
             If the user is authorized, display the tracker page.
             """
-            f_instalments()
+            # The tracker brings in pandas and the loan engine, so it loads with its page
+            with section('f_instalments'):
+                from logic.tracker import f_instalments
+                f_instalments()
 
         else:
             """
@@ -1,40 +1,26 @@
 # authenticator
 
+import functools
 import streamlit as st
-import streamlit_authenticator as stauth
 from datetime import datetime
 import re
-from deta import Deta
 from logic.util import *
-from cryptography.fernet import Fernet
+from logic.storage import get_storage, DuplicateError
 import time
-import pymysql
 
-def database() -> pymysql.Connection:
+@functools.lru_cache(maxsize=1)
+def cipher():
     """
-    Connects to the database and returns a database connection object.
+    Build the Fernet cipher for KEY on first use.
 
-    Raises:
-        pymysql.Error: If there is an error connecting to the database.
+    cryptography is only imported once a password is actually encrypted or checked,
+    so the login form renders without waiting for it.
+
+    Returns:
+        Fernet: The cipher shared by every session.
     """
-    connection = None
-    try:
-        connection = pymysql.connect(
-            # Database connection parameters
-            host=HOST,
-            user=USER,
-            password=PASSWORD,
-            port=int(PORT),
-            database=DATABASE,
-        )
-        print(f'Connected to database: {connection} ')
-    except pymysql.Error as e:
-        # Print error message if there is an error connecting to the database
-        print(f'Error connecting to database: {e}')
-        # Raise the exception so it can be handled by the caller
-        raise
-
-    return connection
+    from cryptography.fernet import Fernet
+    return Fernet(KEY)
 
 # Encrypt password
 def encrypt_password(password: str) -> str:
@@ -47,8 +33,7 @@ def encrypt_password(password: str) -> str:
     Returns:
         str: The encrypted password.
     """
-    cipher = Fernet(KEY)
-    encrypted_password = cipher.encrypt(password.encode())
+    encrypted_password = cipher().encrypt(password.encode())
     return encrypted_password.decode()
 
 # Decrypt password
@@ -62,9 +47,8 @@ def decrypt_password(encrypted_password: str) -> str:
     Returns:
         str: The decrypted password.
     """
-    cipher = Fernet(KEY)
     # Decode the encrypted password from bytes to string
-    return cipher.decrypt(encrypted_password.encode()).decode()
+    return cipher().decrypt(encrypted_password.encode()).decode()
 
 def insert_user(email: str, username: str, hashed_password: str) -> None:
     """
@@ -74,26 +58,15 @@ def insert_user(email: str, username: str, hashed_password: str) -> None:
         email (str): The email address of the user.
         username (str): The username of the user.
         hashed_password (str): The hashed password of the user.
-    """
-    # Establish a connection to the database
-    conn = database()
-
-    # Create a cursor object to execute queries
-    cursor = conn.cursor()
 
+    Raises:
+        DuplicateError: If the email or the username is already registered.
+    """
     # Get the current date and time
     date_joined = str(datetime.now())
 
-    # Execute the query to insert the user
-    query = "INSERT INTO ExpenseTrackerAuth (email, username, password, date_joined) VALUES (%s, %s, %s, %s)"
-    cursor.execute(query, (email, username, hashed_password, date_joined))
-
-    # Commit the changes to the database
-    conn.commit()
-
-    # Close the cursor and connection
-    cursor.close()
-    conn.close()
+    # Insert the user through the storage backend
+    get_storage().insert_user(email, username, hashed_password, date_joined)
 
 def fetch_users():
     """
@@ -102,24 +75,39 @@ def fetch_users():
     Returns:
         list: A list of dictionaries where each dictionary represents a user.
     """
-    # Establish a connection to the database
-    conn = database()
+    return get_storage().fetch_users()
+
+def get_user(username: str):
+    """
+    Fetches a single user by username using the unique username index.
 
-    # Create a cursor object to execute queries
-    cursor = conn.cursor(pymysql.cursors.DictCursor)
+    Args:
+        username (str): The username to look up.
 
-    # Execute the query to get all users
-    query = "SELECT * FROM ExpenseTrackerAuth"
-    cursor.execute(query)
+    Returns:
+        dict or None: The user row, or None if the username does not exist.
+    """
+    # Look up the one matching row through the index
+    return get_storage().get_user(username)
 
-    # Fetch all the users
-    users = cursor.fetchall()
+def find_taken(email: str, username: str) -> tuple[bool, bool]:
+    """
+    Checks in a single query whether an email or a username is already registered.
 
-    # Close the cursor and connection
-    cursor.close()
-    conn.close()
+    Args:
+        email (str): The email to check.
+        username (str): The username to check.
 
-    return users
+    Returns:
+        tuple[bool, bool]: Whether the email is taken and whether the username is taken.
+    """
+    # Both unique indexes are probed by the same query
+    rows = get_storage().find_taken(email, username)
+
+    # The indexes compare case-insensitively, so do the same here
+    email_taken = any(row[0].lower() == email.lower() for row in rows)
+    username_taken = any(row[1].lower() == username.lower() for row in rows)
+    return email_taken, username_taken
 
 def get_user_emails():
     """
@@ -219,18 +207,10 @@ def register():
                 st.warning('Invalid or missing Email!')
                 return
 
-            if email in get_user_emails():
-                st.warning('Email Already Exists!')
-                return
-
             if not validate_username(username):
                 st.warning('Invalid Username!')
                 return
 
-            if username in get_usernames():
-                st.warning('Username Already Exists!')
-                return
-
             if len(username) < 2:
                 st.warning('Username Too Short')
                 return
@@ -243,11 +223,26 @@ def register():
                 st.warning('Passwords Do Not Match!')
                 return
 
+            # Check both unique fields with one indexed query
+            email_taken, username_taken = find_taken(email, username)
+            if email_taken:
+                st.warning('Email Already Exists!')
+                return
+
+            if username_taken:
+                st.warning('Username Already Exists!')
+                return
+
             # Encrypt the password
             encrypted_password = encrypt_password(password)
 
             # Insert the user data into the MySQL database
-            insert_user(email, username, encrypted_password)
+            try:
+                insert_user(email, username, encrypted_password)
+            except DuplicateError:
+                # Someone registered the same email or username in the meantime
+                st.warning('Email or Username Already Exists!')
+                return
             st.success('Account Created Successfully')
             st.balloons()
             time.sleep(2)
@@ -273,20 +268,31 @@ def check_login(username: str, entered_password: str) -> bool:
     Returns:
         bool: True if the credentials match, False otherwise.
     """
-    # Fetch the users from the database
-    users = fetch_users()
-    # Find the user with the matching username
-    user = next((u for u in users if u['username'] == username), None)
+    # Fetch the one matching user from the database
+    user = get_user(username)
     if user:
-        # Get the stored encrypted password
-        stored_encrypted_password = user['password']
-        # Decrypt the stored password
-        decrypted_password = decrypt_password(stored_encrypted_password)
-        # Check if the entered password matches the decrypted one
-        return entered_password == decrypted_password
+        return verify_password(user, entered_password)
     # If no user is found, return False
     return False
 
+def verify_password(user: dict, entered_password: str) -> bool:
+    """
+    Check if the entered password matches the one stored for a user row.
+
+    Args:
+        user (dict): The user row returned by get_user.
+        entered_password (str): The password entered by the user.
+
+    Returns:
+        bool: True if the passwords match, False otherwise.
+    """
+    # Get the stored encrypted password
+    stored_encrypted_password = user['password']
+    # Decrypt the stored password
+    decrypted_password = decrypt_password(stored_encrypted_password)
+    # Check if the entered password matches the decrypted one
+    return entered_password == decrypted_password
+
 def login() -> str:
     """
     Handles the login process using the Streamlit Authenticator library.
@@ -294,6 +300,9 @@ def login() -> str:
     Returns:
         str: The username of the logged-in user.
     """
+    # streamlit_authenticator is only needed by this legacy login form
+    import streamlit_authenticator as stauth
+
     try:
         # Fetch the users from the database
         users = fetch_users()
@@ -0,0 +1,109 @@
+# cache.py
+
+import threading
+import time
+from collections import OrderedDict
+from logic.util import *
+
+# Sentinel returned by LRUCache.get on a miss, so None can be cached
+MISSING = object()
+
+
+class LRUCache:
+    """
+    A thread-safe, size-bounded cache with least-recently-used and time-to-live eviction.
+
+    Writers invalidate keys after changing the database. Each invalidation bumps a
+    generation counter, and ``set`` ignores values read before the last invalidation,
+    so a slow reader can never put stale data back into the cache.
+
+    Args:
+        maxsize (int): The maximum number of entries.
+        ttl (float): Seconds after which an entry expires, 0 to never expire.
+    """
+
+    def __init__(self, maxsize: int = CACHE_SIZE, ttl: float = CACHE_TTL):
+        self.maxsize = max(1, maxsize)
+        self.ttl = ttl
+        # Maps key -> (value, expires_at), least recently used first
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._generation = 0
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def generation(self) -> int:
+        """
+        The invalidation counter, read before loading a value that is about to be cached.
+        """
+        return self._generation
+
+    def get(self, key, default=MISSING):
+        """
+        Return the cached value for a key.
+
+        Args:
+            key: The cache key.
+            default: Returned when the key is missing or expired.
+
+        Returns:
+            The cached value, or ``default``.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or (self.ttl and entry[1] < time.monotonic()):
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return default
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def set(self, key, value, generation: int = None) -> None:
+        """
+        Store a value, evicting the least recently used entry when full.
+
+        Args:
+            key: The cache key.
+            value: The value to store.
+            generation (int, optional): The ``generation`` read before the value was loaded.
+                The value is dropped if anything was invalidated since.
+        """
+        with self._lock:
+            if generation is not None and generation != self._generation:
+                return
+            self._entries[key] = (value, time.monotonic() + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, *keys) -> None:
+        """
+        Remove the given keys.
+        """
+        with self._lock:
+            self._generation += 1
+            for key in keys:
+                self._entries.pop(key, None)
+
+    def invalidate_where(self, predicate) -> None:
+        """
+        Remove every key for which ``predicate(key)`` is true.
+        """
+        with self._lock:
+            self._generation += 1
+            for key in [key for key in self._entries if predicate(key)]:
+                del self._entries[key]
+
+    def clear(self) -> None:
+        """
+        Remove every entry.
+        """
+        with self._lock:
+            self._generation += 1
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
@@ -2,8 +2,8 @@
 
 import streamlit as st
 from logic.currency import *
-import plotly.graph_objects as go
 from logic.database import *
+from logic.sankey import sankey_figure, plotly_chart
 
 def show_details(total_income: float, currency: str, total_expense: float, remaining_budget: float):
     """
@@ -101,21 +101,8 @@ def plug():
             # Display the edited or original comment
             st.text(f"Comment: {edited_comment}")
 
-            # Set up the data for the Sankey diagram
-            label = list(incomes.keys()) + ["Total Income"] + list(expenses.keys())
-            source = list(range(len(incomes))) + [len(incomes)] * len(expenses)
-            target = [len(incomes)] * len(incomes) + [label.index(expense) for expense in expenses]
-            value = list(incomes.values()) + list(expenses.values())
-
-            # Structure the data and attributes for the Sankey diagram
-            link = dict(source=source, target=target, value=value)
-            node = dict(label=label, pad=20, thickness=30, color="#6a2336")
-            data = go.Sankey(link=link, node=node)
-
-            # Render the Sankey diagram in Streamlit
-            fig = go.Figure(data)
-            fig.update_layout(margin=dict(l=0, r=0, t=5, b=5))
-            st.plotly_chart(fig, use_container_width=True)
+            # Render the Sankey diagram, built once per distinct set of incomes and expenses
+            plotly_chart(sankey_figure(incomes, expenses), use_container_width=True)
         else:
             # Display a warning if no data is found for the selected period
             st.warning("No data found for the selected period.")
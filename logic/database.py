@@ -1,51 +1,132 @@
 # database.py
 import os
-from deta import Deta
+import threading
 from collections import OrderedDict
+from collections.abc import Mapping
+import streamlit as st
 from logic.util import *
-import pymysql
+from logic.cache import LRUCache, MISSING
+from logic.journal import Journal, WriteBehind
+from logic.rollups import ALL_CATEGORIES
+from logic.storage import get_storage
 import json
+import copy
 
+# Read-through cache for get_all_periods and get_period, keyed by ('periods', username)
+# and ('period', username, period). Every writer below invalidates the keys it changes.
+_cache = LRUCache(CACHE_SIZE, CACHE_TTL)
 
-def database() -> pymysql.Connection:
+
+def current_user(username=None) -> str:
     """
-    Connects to the database and returns a database connection object.
+    Resolve the user whose rows a helper reads or writes.
+
+    Every ExpenseTrackerDetails row belongs to one user, and every helper only touches
+    the rows of that user.
+
+    Args:
+        username (str, optional): An explicit username, e.g. from a command line tool.
+            Defaults to the user logged in to the current Streamlit session.
+
+    Returns:
+        str: The username.
 
     Raises:
-        pymysql.Error: If there is an error connecting to the database.
-    """
-    connection = None
-    try:
-        connection = pymysql.connect(
-            host=HOST,
-            user=USER,
-            password=PASSWORD,
-            port=int(PORT),
-            database=DATABASE,
-        )
-        print(f'Connected to database: {connection} ')
-        cursor = connection.cursor()
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS ExpenseTrackerDetails (
-                id INT AUTO_INCREMENT PRIMARY KEY,
-                period VARCHAR(255) NOT NULL,
-                incomes JSON NOT NULL,
-                expenses JSON NOT NULL,
-                comment TEXT
-            )
-        ''')
-    except pymysql.Error as e:
-        print(f'Error connecting to database: {e}')
-        raise
-
-    return connection
-
-def load_all_data():
+        RuntimeError: If no username is given and nobody is logged in.
+    """
+    if username:
+        return username
+    username = st.session_state.get('username')
+    if not username:
+        raise RuntimeError('No user is logged in')
+    return username
+
+def invalidate_user(username: str) -> None:
+    """
+    Drop every cached period lookup of a user.
+
+    Args:
+        username (str): The user whose cache entries are dropped.
+    """
+    _cache.invalidate_where(lambda key: key[1] == username)
+
+class LazyPeriod(Mapping):
+    """
+    A read-only period entry that decodes its incomes and expenses JSON on first access.
+
+    Behaves like the dictionaries returned by load_all_data, so consumers that only look at
+    the period name or comment never pay for json.loads.
+
+    Args:
+        row (tuple): An (id, period, incomes, expenses, comment) row.
+    """
+
+    _keys = ('id', 'period', 'incomes', 'expenses', 'comment')
+
+    def __init__(self, row):
+        self._row = row
+        self._decoded = {}
+
+    def __getitem__(self, key):
+        if key not in self._keys:
+            raise KeyError(key)
+        if key in ('incomes', 'expenses'):
+            if key not in self._decoded:
+                self._decoded[key] = json.loads(self._row[self._keys.index(key)])
+            return self._decoded[key]
+        return self._row[self._keys.index(key)]
+
+    def raw(self, key):
+        """
+        Returns a field without decoding it, the JSON text for incomes and expenses.
+        """
+        return self._row[self._keys.index(key)]
+
+    def __iter__(self):
+        return iter(self._keys)
+
+    def __len__(self):
+        return len(self._keys)
+
+def iter_all_data(batch_size=STREAM_BATCH_SIZE, lazy=False, username=None):
+    """
+    Stream all periods of the current user from the database.
+
+    Rows are read from the storage backend in batches of ``batch_size`` (through an
+    unbuffered server-side cursor on MySQL), so memory stays constant however long the
+    history is and the first period is available before the last one has been read.
+    On MySQL the pooled connection is held until the generator is exhausted or closed.
+
+    Args:
+        batch_size (int): The number of rows fetched per round trip.
+        lazy (bool): Yield LazyPeriod entries that decode their JSON only when accessed,
+            instead of fully decoded dictionaries.
+        username (str, optional): The owner of the entries, defaults to the logged in user.
+
+    Yields:
+        dict or LazyPeriod: One entry per period, with the keys described in load_all_data.
+    """
+    username = current_user(username)
+    for row in get_storage().iter_periods(username, batch_size):
+        if lazy:
+            yield LazyPeriod(row)
+        else:
+            # Create a dictionary for each entry with the relevant keys
+            yield {
+                'id': row[0],
+                'period': row[1],
+                'incomes': json.loads(row[2]),
+                'expenses': json.loads(row[3]),
+                'comment': row[4]
+            }
+
+def load_all_data(username=None):
     """
     Load all data from the database.
 
-    This function fetches all the entries from the ExpenseTrackerDetails table in the database and
-    returns them as a list of dictionaries.
+    This function fetches all the entries of the current user from the ExpenseTrackerDetails
+    table in the database and returns them as a list of dictionaries. Use iter_all_data to
+    consume large histories incrementally instead.
 
     The dictionaries contain the following keys:
         - id (int): The unique identifier for the entry.
@@ -54,53 +135,36 @@ def load_all_data():
         - expenses (dict): A dictionary of expenses where the keys are the expense names and the values are the amounts.
         - comment (str): A comment associated with the period.
 
+    :param username: The owner of the entries, defaults to the logged in user.
     :return: A list of dictionaries containing the data loaded from the database.
     """
-    connection = database()
-    cursor = connection.cursor()
-    # Fetch all the entries from the ExpenseTrackerDetails table
-    query = 'SELECT * FROM ExpenseTrackerDetails'
-    cursor.execute(query)
-    rows = cursor.fetchall()
-    data = []
-    for row in rows:
-        # Create a dictionary for each entry with the relevant keys
-        data.append({
-            'id': row[0],
-            'period': row[1],
-            'incomes': json.loads(row[2]),
-            'expenses': json.loads(row[3]),
-            'comment': row[4]
-        })
-    # Close the connection
-    connection.close()
-    return data
-
-def save_all_data(data):
+    return list(iter_all_data(username=username))
+
+def save_all_data(data, username=None, chunk_size=BULK_CHUNK_SIZE):
     """
     Save all data to the database.
 
-    This function iterates over the data list and inserts each dictionary into the
-    ExpenseTrackerDetails table in the database.
+    The entries are written with multi-row upserts of ``chunk_size`` rows inside a single
+    transaction, so either every entry is saved or none is. Entries for periods that already
+    exist replace the stored ones.
 
     Args:
-        data (list): A list of dictionaries containing the data to be saved.
-    """
-    connection = database()
-    cursor = connection.cursor()
+        data (iterable): Dictionaries with period, incomes, expenses and comment keys.
+            Any iterable works, including generators streaming from a file.
+        username (str, optional): The owner of the entries, defaults to the logged in user.
+        chunk_size (int): The number of rows per INSERT statement.
 
-    # Iterate over each dictionary in the data list
-    for item in data:
-        # Create a query to insert the data into the database
-        query = 'INSERT INTO ExpenseTrackerDetails (period, incomes, expenses, comment) VALUES (%s, %s, %s, %s)'
-        # Execute the query with the data from the dictionary
-        cursor.execute(query, (item['period'], json.dumps(item['incomes']),
-                               json.dumps(item['expenses']), item['comment']))
+    Returns:
+        int: The number of entries written.
+    """
+    username = current_user(username)
+    drain_journal()
+    # All chunks are committed together in one transaction
+    count = get_storage().save_periods(username, data, chunk_size)
 
-    # Commit the changes to the database
-    connection.commit()
-    # Close the database connection
-    connection.close()
+    # New periods were added, drop the user's cached lookups
+    invalidate_user(username)
+    return count
 
 def find_period_in_data(period, data):
     """
@@ -123,43 +187,154 @@ def find_period_in_data(period, data):
     # Return None if no matching entry was found
     return None
 
-def insert_period(period, incomes, expenses, comment):
+def insert_period(period, incomes, expenses, comment, append_comment=False, username=None):
     """
     Insert a new period into the database, or update an existing one.
 
+    The write is a single upsert on the unique (username, period) index, so concurrent
+    saves of the same period can never create duplicate rows.
+
     If an existing entry is found, the incomes, expenses, and comment fields will be updated.
     If no existing entry is found, a new entry will be inserted.
 
+    With WRITE_BEHIND, the save is appended to the local journal and the function returns
+    at once; a background thread writes it to MySQL.
+
     Args:
         period (str): The period to insert or update.
         incomes (dict): A dictionary of incomes for the period.
         expenses (dict): A dictionary of expenses for the period.
         comment (str): A comment associated with the period.
+        append_comment (bool): Append the comment to the stored one, separated by a blank
+            line, instead of replacing it. The append happens in the same statement as the write.
+        username (str, optional): The owner of the period, defaults to the logged in user.
     """
-    connection = database()
-    cursor = connection.cursor()
+    username = current_user(username)
+    if WRITE_BEHIND:
+        # Journal the save locally and confirm it, the background writer applies it to MySQL
+        write_behind().append(username, period, incomes, expenses, comment, append_comment)
+        return
 
-    # Check if an existing entry exists
-    query = 'SELECT * FROM ExpenseTrackerDetails WHERE period = %s'
-    cursor.execute(query, (period,))
-    existing_entry = cursor.fetchone()
+    get_storage().upsert_period(username, period, incomes, expenses, comment, append_comment)
 
-    if existing_entry:
-        # Update the existing entry
-        query = 'UPDATE ExpenseTrackerDetails SET incomes = %s, expenses = %s, comment = %s WHERE period = %s'
-        cursor.execute(query, (json.dumps(incomes), json.dumps(expenses), comment, period))
-    else:
-        # Insert a new entry
-        query = 'INSERT INTO ExpenseTrackerDetails (period, incomes, expenses, comment) VALUES (%s, %s, %s, %s)'
-        cursor.execute(query, (period, json.dumps(incomes), json.dumps(expenses), comment))
+    # The period may be new, so the period list is dropped along with its details
+    _cache.invalidate(('periods', username), ('period', username, period))
+
+_writer = None
+_writer_lock = threading.Lock()
+
+
+def write_behind() -> WriteBehind:
+    """
+    Returns the process-wide write-behind writer, starting its thread on first use.
+
+    The thread also picks up saves journaled by an earlier run that had not reached
+    MySQL yet.
+
+    Returns:
+        WriteBehind: The shared writer.
+    """
+    global _writer
+    if _writer is None:
+        with _writer_lock:
+            if _writer is None:
+                writer = WriteBehind(Journal(), apply_writes)
+                writer.start()
+                _writer = writer
+    return _writer
+
+def apply_writes(entries) -> None:
+    """
+    Apply journaled saves in one transaction, each idempotency key at most once, and
+    drop the cached lookups they change.
+
+    Args:
+        entries (list): Entries from Journal.batch, oldest first.
+    """
+    get_storage().apply_writes(entries)
+
+    for entry in entries:
+        _cache.invalidate(('periods', entry['username']), ('period', entry['username'], entry['period']))
+
+def drain_journal() -> None:
+    """
+    Write the pending journaled saves before a write that bypasses the journal.
+    """
+    if WRITE_BEHIND:
+        write_behind().drain()
+
+def rejected_saves(username=None) -> list:
+    """
+    List the journaled saves of a user that MySQL kept rejecting and that are no longer retried.
+
+    Args:
+        username (str, optional): The owner of the saves, defaults to the logged in user.
+
+    Returns:
+        list: Entry dictionaries from Journal.rejected, oldest first, empty without WRITE_BEHIND.
+    """
+    if not WRITE_BEHIND:
+        return []
+    return write_behind().journal.rejected(current_user(username))
 
-    # Commit the changes to the database
-    connection.commit()
+def retry_saves(keys: list) -> None:
+    """
+    Queue rejected journaled saves to be written again.
+    """
+    write_behind().retry(keys)
 
-    # Close the database connection
-    connection.close()
+def discard_saves(keys: list) -> None:
+    """
+    Drop rejected journaled saves for good.
+    """
+    write_behind().journal.remove(keys)
 
-def update_period(period, incomes, expenses):
+def merge_pending_periods(username: str, periods: list) -> list:
+    """
+    Add the periods of saves still in the journal to a stored period list.
+
+    Args:
+        username (str): The owner of the periods.
+        periods (list): The periods read from storage, in date order.
+
+    Returns:
+        list: A new list, still in date order.
+    """
+    if not WRITE_BEHIND:
+        return list(periods)
+    known = set(periods)
+    added = [entry['period'] for entry in write_behind().journal.pending(username) if entry['period'] not in known]
+    if not added:
+        return list(periods)
+    # Same order as ORDER BY period_key, id: unparseable periods first, ties keep their order
+    merged = list(periods) + list(dict.fromkeys(added))
+    return sorted(merged, key=lambda period: (period_key(period) is not None, period_key(period) or 0))
+
+def merge_pending_details(username: str, period: str, details: dict) -> dict:
+    """
+    Apply the saves of a period still in the journal to its stored details.
+
+    Args:
+        username (str): The owner of the period.
+        period (str): The period.
+        details (dict): The details read from storage, updated in place.
+
+    Returns:
+        dict: The details as they will be once the journal is written.
+    """
+    if not WRITE_BEHIND:
+        return details
+    for entry in write_behind().journal.pending(username, period):
+        details['incomes'] = entry['incomes']
+        details['expenses'] = entry['expenses']
+        if entry['append_comment']:
+            # Same as the comment append of Storage.upsert_period
+            details['comment'] = '\n\n'.join(part for part in (details['comment'], entry['comment']) if part)
+        else:
+            details['comment'] = entry['comment']
+    return details
+
+def update_period(period, incomes, expenses, username=None):
     """
     Update an existing period in the database.
 
@@ -167,54 +342,52 @@ def update_period(period, incomes, expenses):
         period (str): The period to update.
         incomes (dict): A dictionary of updated incomes for the period.
         expenses (dict): A dictionary of updated expenses for the period.
+        username (str, optional): The owner of the period, defaults to the logged in user.
     """
-    # Connect to the database
-    connection = database()
-    cursor = connection.cursor()
+    username = current_user(username)
+    drain_journal()
+    get_storage().update_period(username, period, incomes, expenses)
 
-    # Update the period in the database
-    query = 'UPDATE ExpenseTrackerDetails SET incomes = %s, expenses = %s WHERE period = %s'
-    cursor.execute(query, (json.dumps(incomes), json.dumps(expenses), period))
+    # Only the details of this period changed
+    _cache.invalidate(('period', username, period))
 
-    # Commit the changes to the database
-    connection.commit()
+def get_all_periods(username=None):
+    """
+    Get all the periods stored in the database for the current user, oldest first.
 
-    # Close the database connection
-    connection.close()
+    With WRITE_BEHIND, the periods of saves still waiting in the journal are included.
 
-def get_all_periods():
-    """
-    Get all the periods stored in the database.
+    Args:
+        username (str, optional): The owner of the periods, defaults to the logged in user.
 
     Returns:
         list: A list of all the periods.
     """
-    # Connect to the database
-    connection = database()
-    cursor = connection.cursor()
-
-    # Execute the query to get all periods
-    query = 'SELECT period FROM ExpenseTrackerDetails'
-    cursor.execute(query)
+    username = current_user(username)
+    key = ('periods', username)
 
-    # Fetch all the periods
-    rows = cursor.fetchall()
+    # Serve repeat views from the cache
+    periods = _cache.get(key)
+    if periods is not MISSING:
+        return merge_pending_periods(username, periods)
+    generation = _cache.generation
 
-    # Extract the periods from the query results
-    periods = [row[0] for row in rows]
+    # The user's periods in date order
+    periods = get_storage().list_periods(username)
+    _cache.set(key, periods, generation)
 
-    # Close the database connection
-    connection.close()
+    # Return a copy of the list of periods with any journaled ones, so callers cannot change the cached one
+    return merge_pending_periods(username, periods)
 
-    # Return the list of periods
-    return periods
-
-def get_period(period):
+def get_period(period, username=None):
     """
     Get the details for a specific period from the database.
 
+    With WRITE_BEHIND, saves of the period still waiting in the journal are applied.
+
     Args:
         period (str): The period to retrieve details for.
+        username (str, optional): The owner of the period, defaults to the logged in user.
 
     Returns:
         dict: A dictionary containing the details for the period.
@@ -224,65 +397,164 @@ def get_period(period):
             - comment (str): A comment associated with the period.
                 If no comment is found, an empty string is returned.
     """
-    # Connect to the database
-    connection = database()
-    # Create a cursor object to execute queries
-    cursor = connection.cursor()
-    # Execute the query to get the period details
-    query = 'SELECT * FROM ExpenseTrackerDetails WHERE period = %s'
-    cursor.execute(query, (period,))
-    # Fetch the query result
-    entry = cursor.fetchone()
-    # Close the database connection
-    connection.close()
-    # If a result was found, return a dictionary with the details
+    username = current_user(username)
+    key = ('period', username, period)
+
+    # Serve repeat views from the cache
+    details = _cache.get(key)
+    if details is not MISSING:
+        return merge_pending_details(username, period, copy.deepcopy(details))
+    generation = _cache.generation
+
+    # Fetch the stored incomes, expenses and comment
+    entry = get_storage().get_period(username, period)
+    # If a result was found, build a dictionary with the details
     if entry:
-        return {
-            "incomes": json.loads(entry[2]),
-            "expenses": json.loads(entry[3]),
-            "comment": entry[4] if entry[4] else ""
+        details = {
+            "incomes": json.loads(entry[0]),
+            "expenses": json.loads(entry[1]),
+            "comment": entry[2] if entry[2] else ""
         }
-    # If no result was found, return an empty dictionary
-    return {"incomes": {}, "expenses": {}, "comment": ""}
+    # If no result was found, use an empty dictionary
+    else:
+        details = {"incomes": {}, "expenses": {}, "comment": ""}
+    _cache.set(key, details, generation)
+
+    # Return a copy with any journaled saves applied, so callers cannot change the cached details
+    return merge_pending_details(username, period, copy.deepcopy(details))
 
-def clear_data():
+def clear_data(username=None):
     """
-    Clear all data from the database.
+    Clear all data of the current user from the database.
 
-    This function truncates the ExpenseTrackerDetails table, which will delete all rows.
+    This function deletes every ExpenseTrackerDetails row owned by the user, leaving
+    the rows of other users untouched.
+
+    Args:
+        username (str, optional): The owner of the rows, defaults to the logged in user.
     """
-    # Connect to the database
-    connection = database()
-    # Create a cursor object to execute queries
-    cursor = connection.cursor()
-    # Execute the query to truncate the table
-    query = 'TRUNCATE TABLE ExpenseTrackerDetails'
-    cursor.execute(query)
-    # Commit the changes to the database
-    connection.commit()
-    # Close the database connection
-    connection.close()
+    username = current_user(username)
+    drain_journal()
+    get_storage().clear_periods(username)
 
-def update_comment(period: str, edited_comment: str) -> None:
+    # Every period of the user is gone
+    invalidate_user(username)
+
+def update_comment(period: str, edited_comment: str, username=None) -> None:
     """
     Update the comment associated with a given period.
 
     Args:
         period (str): The period to update the comment for.
         edited_comment (str): The new comment to associate with the period.
+        username (str, optional): The owner of the period, defaults to the logged in user.
+    """
+    username = current_user(username)
+    drain_journal()
+    get_storage().update_comment(username, period, edited_comment)
+
+    # Only the details of this period changed
+    _cache.invalidate(('period', username, period))
+
+def get_period_totals(period: str, username=None) -> dict:
     """
+    Get the total income and expense of a period, summed in SQL over its line items on MySQL.
+
+    Args:
+        period (str): The period to total.
+        username (str, optional): The owner of the period, defaults to the logged in user.
 
-    # Connect to the database
-    connection = database()
-    # Create a cursor object to execute queries
-    cursor = connection.cursor()
+    Returns:
+        dict: The totals keyed by kind, e.g. {"income": 3800.0, "expense": 1250.0}.
+    """
+    return get_storage().period_totals(current_user(username), period)
 
-    # Execute the query to update the comment
-    query = 'UPDATE ExpenseTrackerDetails SET comment = %s WHERE period = %s'
-    cursor.execute(query, (edited_comment, period))
+def get_totals_by_period(username=None) -> dict:
+    """
+    Get the total income and expense of every period in one grouped query.
 
-    # Commit the changes to the database
-    connection.commit()
+    Args:
+        username (str, optional): The owner of the periods, defaults to the logged in user.
 
-    # Close the database connection
-    connection.close()
+    Returns:
+        dict: Maps each period to its totals keyed by kind.
+    """
+    return get_storage().totals_by_period(current_user(username))
+
+def get_category_totals(kind: str, periods=None, categories=None, username=None) -> dict:
+    """
+    Sum the amounts of each category across periods, using the category index on MySQL.
+
+    Args:
+        kind (str): Either "income" or "expense".
+        periods (list, optional): Only include these periods, defaults to all of them.
+        categories (list, optional): Only include these categories, defaults to all of them.
+        username (str, optional): The owner of the periods, defaults to the logged in user.
+
+    Returns:
+        dict: Maps each category to its total.
+    """
+    return get_storage().category_totals(current_user(username), kind, periods, categories)
+
+def get_rollups(year=None, username=None) -> list:
+    """
+    Read the monthly or yearly totals, precomputed rollups on MySQL.
+
+    Args:
+        year (int, optional): Return the months of this year. By default one row per year
+            is returned.
+        username (str, optional): The owner of the periods, defaults to the logged in user.
+
+    Returns:
+        list: Dictionaries with year, month (0 for a whole year), income, expense, balance
+            and categories keys, ordered by date. categories maps (kind, category) to its sum.
+    """
+    rows = get_storage().rollup_rows(current_user(username), year)
+
+    summaries = {}
+    for row_year, month, kind, category, amount in rows:
+        summary = summaries.setdefault((row_year, month), {
+            'year': row_year, 'month': month, 'income': 0.0, 'expense': 0.0, 'balance': 0.0, 'categories': {}})
+        if category == ALL_CATEGORIES:
+            summary[kind] = float(amount)
+            summary['balance'] = summary['income'] - summary['expense']
+        else:
+            summary['categories'][(kind, category)] = float(amount)
+    return list(summaries.values())
+
+def get_periods_between(start, end, username=None) -> list:
+    """
+    Get the periods between two months, inclusive, with a range query on period_key.
+
+    Args:
+        start: The first month, as a period name ("January 2025"), a (year, month) pair or a key (202501).
+        end: The last month, in any of the same forms.
+        username (str, optional): The owner of the periods, defaults to the logged in user.
+
+    Returns:
+        list: The period names in date order.
+
+    Raises:
+        ValueError: If start or end is not a valid period.
+    """
+    username = current_user(username)
+    start_key, end_key = period_key(start), period_key(end)
+    if start_key is None or end_key is None:
+        raise ValueError(f'Invalid period range: {start!r} - {end!r}')
+    return get_storage().periods_between(username, start_key, end_key)
+
+def get_recent_periods(months: int = 12, username=None) -> list:
+    """
+    Get the periods of the last ``months`` months, including the current one.
+
+    Args:
+        months (int): The number of months to go back.
+        username (str, optional): The owner of the periods, defaults to the logged in user.
+
+    Returns:
+        list: The period names in date order.
+    """
+    today = datetime.now()
+    # Count months from year 0 to step back across year boundaries
+    first = today.year * 12 + today.month - 1 - (months - 1)
+    return get_periods_between((first // 12, first % 12 + 1), (today.year, today.month), username)
@@ -0,0 +1,262 @@
+# export.py
+
+import atexit
+import importlib.util
+import itertools
+import os
+import tempfile
+import threading
+import time
+import streamlit as st
+
+# Export formats as label: (file extension, MIME type, module required to write it)
+FORMATS = {
+    'CSV': ('csv', 'text/csv', None),
+    'Parquet': ('parquet', 'application/vnd.apache.parquet', 'pyarrow'),
+    'Excel': ('xlsx', 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet', 'xlsxwriter'),
+}
+
+# Rows converted to a DataFrame and written at a time
+EXPORT_CHUNK_SIZE = int(os.getenv('EXPORT_CHUNK_SIZE', 5000))
+
+# Prepared exports are written here and deleted once downloaded, once older than
+# EXPORT_MAX_AGE seconds, or when the process exits
+EXPORT_DIR = os.path.join(tempfile.gettempdir(), 'expense-tracker-exports')
+EXPORT_MAX_AGE = float(os.getenv('EXPORT_MAX_AGE', 3600))
+
+# Files prepared by this process and not deleted yet
+_prepared = set()
+_prepared_lock = threading.Lock()
+
+
+def available_formats() -> list:
+    """
+    List the export formats whose writer is installed.
+
+    Returns:
+        list: The format labels, CSV always first.
+    """
+    return [label for label, (_, _, module) in FORMATS.items()
+            if module is None or importlib.util.find_spec(module) is not None]
+
+def chunked_frames(rows, columns: list, chunk_size: int = EXPORT_CHUNK_SIZE):
+    """
+    Group an iterable of rows into DataFrames of at most ``chunk_size`` rows.
+
+    Args:
+        rows (iterable): Row tuples or lists, consumed lazily.
+        columns (list): The column names.
+        chunk_size (int): The number of rows per DataFrame.
+
+    Yields:
+        pd.DataFrame: The next chunk of rows.
+    """
+    import pandas as pd
+
+    rows = iter(rows)
+    while True:
+        chunk = list(itertools.islice(rows, chunk_size))
+        if not chunk:
+            return
+        yield pd.DataFrame(chunk, columns=columns)
+
+def period_frames(username: str = None, chunk_size: int = EXPORT_CHUNK_SIZE):
+    """
+    Stream the period history of a user as DataFrame chunks.
+
+    Rows come from the server-side cursor of iter_all_data and the incomes and expenses
+    stay the JSON text stored in the database, so neither the full history nor its
+    decoded dictionaries are ever held in memory.
+
+    Args:
+        username (str, optional): The owner of the periods, defaults to the logged in user.
+        chunk_size (int): The number of periods per DataFrame.
+
+    Yields:
+        pd.DataFrame: Chunks with period, incomes, expenses and comment columns.
+    """
+    from logic.database import iter_all_data
+
+    rows = ((entry['period'], entry.raw('incomes'), entry.raw('expenses'), entry['comment'] or '')
+            for entry in iter_all_data(lazy=True, username=username))
+    yield from chunked_frames(rows, ['period', 'incomes', 'expenses', 'comment'], chunk_size)
+
+def write_csv(frames, path: str) -> int:
+    """
+    Append DataFrame chunks to a CSV file, writing the header once.
+    """
+    count = 0
+    with open(path, 'w', newline='', encoding='utf-8') as fp:
+        for frame in frames:
+            frame.to_csv(fp, index=False, header=not count)
+            count += len(frame)
+    return count
+
+def write_parquet(frames, path: str) -> int:
+    """
+    Write DataFrame chunks as row groups of one Parquet file.
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    count = 0
+    writer = None
+    try:
+        for frame in frames:
+            table = pa.Table.from_pandas(frame, preserve_index=False)
+            if writer is None:
+                writer = pq.ParquetWriter(path, table.schema)
+            writer.write_table(table.cast(writer.schema))
+            count += len(frame)
+        if writer is None:
+            # An empty export still produces a readable file
+            pq.write_table(pa.table({}), path)
+    finally:
+        if writer is not None:
+            writer.close()
+    return count
+
+def write_xlsx(frames, path: str) -> int:
+    """
+    Stream DataFrame chunks into one worksheet.
+
+    XlsxWriter's constant memory mode flushes every row to disk once the next one is
+    started, so the workbook never holds more than a row in memory.
+    """
+    import xlsxwriter
+
+    count = 0
+    workbook = xlsxwriter.Workbook(path, {'constant_memory': True, 'nan_inf_to_errors': True})
+    try:
+        sheet = workbook.add_worksheet()
+        for frame in frames:
+            if not count:
+                sheet.write_row(0, 0, [str(column) for column in frame.columns])
+            for offset, row in enumerate(frame.itertuples(index=False), start=count + 1):
+                sheet.write_row(offset, 0, row)
+            count += len(frame)
+    finally:
+        workbook.close()
+    return count
+
+WRITERS = {'CSV': write_csv, 'Parquet': write_parquet, 'Excel': write_xlsx}
+
+def remove_export(path: str) -> None:
+    """
+    Delete a prepared export file, if it is still there.
+    """
+    with _prepared_lock:
+        _prepared.discard(path)
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+def sweep_exports(max_age: float = EXPORT_MAX_AGE) -> None:
+    """
+    Delete the prepared exports older than ``max_age`` seconds, by any process.
+
+    Streamlit has no hook for the end of a session, so an export that was prepared but
+    never downloaded is only removed once it ages out.
+    """
+    cutoff = time.time() - max_age
+    try:
+        entries = list(os.scandir(EXPORT_DIR))
+    except FileNotFoundError:
+        return
+    for entry in entries:
+        try:
+            if entry.is_file() and entry.stat().st_mtime < cutoff:
+                remove_export(entry.path)
+        except FileNotFoundError:
+            # Removed meanwhile by another session or process
+            pass
+
+@atexit.register
+def _remove_prepared() -> None:
+    """
+    Delete the exports this process prepared that were never downloaded.
+    """
+    with _prepared_lock:
+        paths = list(_prepared)
+    for path in paths:
+        remove_export(path)
+
+def export_file(frames, fmt: str) -> tuple:
+    """
+    Write DataFrame chunks to a temporary file in the given format.
+
+    Exports that aged out are deleted first, so abandoned ones never pile up.
+
+    Args:
+        frames (iterable): DataFrames with the same columns, consumed one at a time.
+        fmt (str): A label of FORMATS.
+
+    Returns:
+        tuple: The path of the file and the number of rows written.
+    """
+    sweep_exports()
+    extension = FORMATS[fmt][0]
+    os.makedirs(EXPORT_DIR, exist_ok=True)
+    fd, path = tempfile.mkstemp(prefix='expense-tracker-', suffix=f'.{extension}', dir=EXPORT_DIR)
+    os.close(fd)
+    with _prepared_lock:
+        _prepared.add(path)
+    try:
+        count = WRITERS[fmt](frames, path)
+    except BaseException:
+        remove_export(path)
+        raise
+    return path, count
+
+def discard(key: str) -> None:
+    """
+    Delete the prepared export stored under a session state key.
+    """
+    prepared = st.session_state.pop(key, None)
+    if prepared:
+        remove_export(prepared['path'])
+
+def export_widget(label: str, frames, key: str, file_name: str) -> None:
+    """
+    Display a format selector with a two step export: prepare, then download.
+
+    Nothing is generated until "Prepare" is pressed. The file is then written in chunks
+    to a temporary file, and only its path is kept in the session. The native download
+    button serves the file from Streamlit's media endpoint instead of embedding it in the
+    page. The temporary file is deleted once it has been downloaded, and a file that is
+    never downloaded is deleted once it is older than EXPORT_MAX_AGE.
+
+    Args:
+        label (str): What is exported, e.g. "Installments".
+        frames (callable): Called without arguments to produce the DataFrame chunks.
+        key (str): A session state key unique to this export.
+        file_name (str): The download name, without extension.
+    """
+    formats = available_formats()
+    select_column, prepare_column, download_column = st.columns([2, 1, 1])
+    fmt = select_column.selectbox(f"{label} Format", formats, key=f"{key}_format")
+    with prepare_column:
+        st.write("")
+        if st.button("Prepare", key=f"{key}_prepare"):
+            discard(key)
+            path, count = export_file(frames(), fmt)
+            st.session_state[key] = {'path': path, 'format': fmt, 'rows': count}
+
+    prepared = st.session_state.get(key)
+    if not prepared:
+        return
+    extension, mime, _ = FORMATS[prepared['format']]
+    with download_column:
+        st.write("")
+        try:
+            with open(prepared['path'], 'rb') as fp:
+                downloaded = st.download_button(f"Download {prepared['format']}", fp, key=f"{key}_download",
+                                                file_name=f"{file_name}.{extension}", mime=mime)
+        except FileNotFoundError:
+            # The file aged out, it has to be prepared again
+            st.session_state.pop(key, None)
+            return
+    st.caption(f"{prepared['rows']} rows ready")
+    if downloaded:
+        discard(key)
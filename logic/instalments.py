@@ -0,0 +1,193 @@
+# instalments.py
+
+import numpy as np
+from logic.util import *
+
+# Accounts of a grid built without any, the columns of the original instalments table
+ACCOUNTS = ['ING', 'CEC', 'Orange']
+
+
+class InstalmentGrid:
+    """
+    Compact model of the instalments table.
+
+    The table is held as a 12 x (N + 1) float array: one row per month, one column per
+    account plus a final Salary column, and a boolean mask of the same shape for the
+    checkboxes. Columns are looked up by index, so MyCut, totals and remaining balances
+    are computed in single vectorized passes instead of per-cell Python loops.
+
+    Parameters
+    ----------
+    accounts : list, optional
+        The account names, defaults to ACCOUNTS.
+    values : np.ndarray, optional
+        The 12 x (N + 1) amounts, zeros by default.
+    mask : np.ndarray, optional
+        The 12 x (N + 1) checkbox states, defaults to every non-zero amount.
+    ids : list, optional
+        The database ids of the accounts, needed to save the grid.
+    year : int, optional
+        The year the grid holds, defaults to the current year.
+    """
+
+    def __init__(self, accounts=None, values=None, mask=None, ids=None, year=None):
+        self.accounts = list(ACCOUNTS if accounts is None else accounts)
+        self.ids = list(ids) if ids is not None else None
+        self.year = year or datetime.today().year
+        self.columns = self.accounts + ['Salary']
+        shape = (len(MONTHS), len(self.columns))
+        self.values = np.zeros(shape) if values is None else np.asarray(values, dtype=float).reshape(shape)
+        self.mask = self.values != 0 if mask is None else np.asarray(mask, dtype=bool).reshape(shape)
+
+    @classmethod
+    def from_rows(cls, rows, accounts=None) -> 'InstalmentGrid':
+        """
+        Builds a grid from (month name, *account amounts, salary) rows.
+
+        Parameters
+        ----------
+        rows : iterable
+            The rows, in any order; months without a row stay zero.
+        accounts : list, optional
+            The account names, defaults to ACCOUNTS.
+
+        Returns
+        -------
+        InstalmentGrid
+            The populated grid.
+        """
+        grid = cls(accounts)
+        rows = [row for row in rows if row[0] in MONTHS]
+        if rows:
+            month_index = np.array([MONTHS.index(row[0]) for row in rows])
+            grid.values[month_index] = np.array([row[1:] for row in rows], dtype=float)
+            grid.mask = grid.values != 0
+        return grid
+
+    @classmethod
+    def from_payments(cls, accounts, payments, salaries, year=None) -> 'InstalmentGrid':
+        """
+        Builds a grid from the normalized account, payment and salary rows.
+
+        Parameters
+        ----------
+        accounts : list
+            Account rows with id and name keys, in column order.
+        payments : iterable
+            (account id, month number 1 to 12, amount) rows.
+        salaries : iterable
+            (month name, salary) rows.
+        year : int, optional
+            The year of the rows, defaults to the current year.
+
+        Returns
+        -------
+        InstalmentGrid
+            The populated grid.
+        """
+        grid = cls([account['name'] for account in accounts], ids=[account['id'] for account in accounts], year=year)
+        column = {account_id: j for j, account_id in enumerate(grid.ids)}
+        payments = [row for row in payments if row[0] in column and 1 <= row[1] <= len(MONTHS)]
+        if payments:
+            rows = np.array([row[1] - 1 for row in payments])
+            cols = np.array([column[row[0]] for row in payments])
+            grid.values[rows, cols] = np.array([row[2] for row in payments], dtype=float)
+        salaries = [row for row in salaries if row[0] in MONTHS]
+        if salaries:
+            grid.salary[[MONTHS.index(row[0]) for row in salaries]] = np.array([row[1] for row in salaries], dtype=float)
+        grid.mask = grid.values != 0
+        return grid
+
+    def index(self, column: str) -> int:
+        """
+        Returns the column index of an account, or of "Salary".
+        """
+        return self.columns.index(column)
+
+    def copy(self) -> 'InstalmentGrid':
+        """
+        Returns an independent copy of the grid.
+        """
+        return InstalmentGrid(self.accounts, self.values.copy(), self.mask.copy(), self.ids, self.year)
+
+    @property
+    def amounts(self) -> np.ndarray:
+        """
+        The 12 x N account amounts, a view into ``values``.
+        """
+        return self.values[:, :len(self.accounts)]
+
+    @property
+    def salary(self) -> np.ndarray:
+        """
+        The 12 salaries, a view into ``values``.
+        """
+        return self.values[:, len(self.accounts)]
+
+    def my_cut(self) -> np.ndarray:
+        """
+        Returns what is left of each month's salary after every instalment.
+        """
+        return self.salary - self.amounts.sum(axis=1)
+
+    def totals(self) -> np.ndarray:
+        """
+        Returns the yearly total paid into each account.
+        """
+        return self.amounts.sum(axis=0)
+
+    def changed(self, previous: 'InstalmentGrid' = None) -> np.ndarray:
+        """
+        Finds the month rows whose values differ from another grid.
+
+        Values are compared at the two decimals the database keeps, so float noise from
+        the number inputs never counts as a change.
+
+        Parameters
+        ----------
+        previous : InstalmentGrid, optional
+            The grid returned by load_data. Every month counts as changed when omitted.
+
+        Returns
+        -------
+        np.ndarray
+            The indexes of the changed months.
+        """
+        if previous is None:
+            return np.arange(len(MONTHS))
+        return np.flatnonzero((np.round(self.values, 2) != np.round(previous.values, 2)).any(axis=1))
+
+    def apply(self, frame) -> np.ndarray:
+        """
+        Copies the amounts of an edited table into the grid in one step.
+
+        Parameters
+        ----------
+        frame : pd.DataFrame
+            A table laid out like ``to_frame``, e.g. the value returned by ``st.data_editor``.
+            Extra columns such as MyCut are ignored and empty cells count as zero.
+
+        Returns
+        -------
+        np.ndarray
+            The indexes of the months that changed.
+        """
+        previous = self.copy()
+        self.values[:] = frame[self.columns].fillna(0).to_numpy(dtype=float)
+        return self.changed(previous)
+
+    def to_frame(self):
+        """
+        Builds the table shown and exported by the tracker, with a MyCut column.
+
+        Returns
+        -------
+        pd.DataFrame
+            One row per month with the account, Salary and MyCut columns.
+        """
+        import pandas as pd
+
+        frame = pd.DataFrame(self.values.copy(), columns=self.columns)
+        frame.insert(0, 'Months', MONTHS)
+        frame['MyCut'] = self.my_cut()
+        return frame
@@ -0,0 +1,398 @@
+# journal.py
+
+import argparse
+import atexit
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+import pymysql
+from logic.util import *
+
+logger = logging.getLogger(__name__)
+
+# Errors that say nothing about the entries themselves, the same batch is retried after a pause
+TRANSIENT_ERRORS = (pymysql.OperationalError, pymysql.InterfaceError, sqlite3.OperationalError)
+
+
+class RejectedWrite(Exception):
+    """
+    Raised by ``WriteBehind.flush_once`` when MySQL rejected every entry of a batch.
+    """
+
+
+class Journal:
+    """
+    A durable local queue of period saves waiting to be written to MySQL.
+
+    Entries live in a SQLite database in WAL mode with full synchronous commits, so a
+    save is on disk before it is confirmed and survives a crash or restart of the app.
+    Each entry carries an idempotency key, so replaying it after a failure never applies
+    it twice. Entries MySQL keeps rejecting are set aside after ``max_attempts`` tries
+    instead of blocking the entries behind them.
+
+    Args:
+        path (str): The SQLite file, created if it does not exist.
+        max_attempts (int): Rejections after which an entry is no longer retried.
+    """
+
+    def __init__(self, path: str = JOURNAL_PATH, max_attempts: int = JOURNAL_MAX_ATTEMPTS):
+        self.path = path
+        self.max_attempts = max(1, max_attempts)
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        # One connection shared by the script threads and the writer, guarded by the lock
+        self._connection = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._lock = threading.Lock()
+        with self._lock:
+            self._connection.execute('PRAGMA journal_mode=WAL')
+            self._connection.execute('PRAGMA synchronous=FULL')
+            self._connection.execute('''
+                CREATE TABLE IF NOT EXISTS writes (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    key TEXT NOT NULL UNIQUE,
+                    username TEXT NOT NULL,
+                    period TEXT NOT NULL,
+                    incomes TEXT NOT NULL,
+                    expenses TEXT NOT NULL,
+                    comment TEXT NOT NULL,
+                    append_comment INTEGER NOT NULL,
+                    created_at REAL NOT NULL,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    dead INTEGER NOT NULL DEFAULT 0,
+                    last_error TEXT
+                )
+            ''')
+            self._connection.execute('CREATE INDEX IF NOT EXISTS idx_writes_user_period ON writes (username, period)')
+
+    @staticmethod
+    def _entry(row) -> dict:
+        """
+        Convert a journal row into the entry dictionary handed to readers and the flusher.
+        """
+        key, username, period, incomes, expenses, comment, append_comment, attempts = row
+        return {'key': key, 'username': username, 'period': period, 'incomes': json.loads(incomes),
+                'expenses': json.loads(expenses), 'comment': comment,
+                'append_comment': bool(append_comment), 'attempts': attempts}
+
+    def append(self, username: str, period: str, incomes: dict, expenses: dict, comment: str,
+               append_comment: bool = False, key: str = None) -> str:
+        """
+        Durably record a save of a period.
+
+        Args:
+            username (str): The owner of the period.
+            period (str): The period saved.
+            incomes (dict): The incomes of the period.
+            expenses (dict): The expenses of the period.
+            comment (str): The comment of the period.
+            append_comment (bool): Append the comment to the stored one instead of replacing it.
+            key (str, optional): The idempotency key, a random one by default. Appending
+                the same key twice records the save once.
+
+        Returns:
+            str: The idempotency key of the entry.
+        """
+        key = key or uuid.uuid4().hex
+        with self._lock:
+            self._connection.execute('''
+                INSERT OR IGNORE INTO writes (key, username, period, incomes, expenses, comment, append_comment, created_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            ''', (key, username, period, json.dumps(incomes), json.dumps(expenses), comment or '',
+                  int(append_comment), time.time()))
+        return key
+
+    def pending(self, username: str, period: str = None) -> list:
+        """
+        List the entries of a user still waiting to be written, oldest first.
+
+        Args:
+            username (str): The owner of the entries.
+            period (str, optional): Only return the entries of this period.
+
+        Returns:
+            list: Entry dictionaries.
+        """
+        query = ('SELECT key, username, period, incomes, expenses, comment, append_comment, attempts '
+                 'FROM writes WHERE dead = 0 AND username = ?')
+        params = [username]
+        if period is not None:
+            query += ' AND period = ?'
+            params.append(period)
+        with self._lock:
+            rows = self._connection.execute(query + ' ORDER BY id', params).fetchall()
+        return [self._entry(row) for row in rows]
+
+    def batch(self, limit: int) -> list:
+        """
+        Take the oldest entries waiting to be written, without removing them.
+
+        Args:
+            limit (int): The maximum number of entries.
+
+        Returns:
+            list: Entry dictionaries, oldest first.
+        """
+        with self._lock:
+            rows = self._connection.execute(
+                'SELECT key, username, period, incomes, expenses, comment, append_comment, attempts '
+                'FROM writes WHERE dead = 0 ORDER BY id LIMIT ?', (limit,)).fetchall()
+        return [self._entry(row) for row in rows]
+
+    def remove(self, keys: list) -> None:
+        """
+        Delete entries once MySQL has committed them.
+        """
+        with self._lock:
+            self._connection.executemany('DELETE FROM writes WHERE key = ?', [(key,) for key in keys])
+
+    def reject(self, key: str, error: str) -> None:
+        """
+        Count a rejection of an entry, setting it aside after ``max_attempts`` of them.
+
+        An entry set aside is a save the user saw confirmed that will not reach MySQL on
+        its own, so it is logged as a warning and listed by ``rejected`` until it is
+        retried or discarded.
+        """
+        with self._lock:
+            self._connection.execute('''
+                UPDATE writes SET attempts = attempts + 1, last_error = ?, dead = (attempts + 1 >= ?)
+                WHERE key = ?
+            ''', (error, self.max_attempts, key))
+            row = self._connection.execute('SELECT username, period, attempts, dead FROM writes WHERE key = ?',
+                                           (key,)).fetchone()
+        if row and row[3]:
+            logger.warning('Journaled save %s of %s for %s set aside after %s rejections: %s',
+                           key, row[1], row[0], row[2], error)
+
+    def rejected(self, username: str) -> list:
+        """
+        List the entries of a user set aside after too many rejections, oldest first.
+
+        Args:
+            username (str): The owner of the entries.
+
+        Returns:
+            list: Entry dictionaries, with the time of the save as "created_at" and the
+            last error as "last_error".
+        """
+        with self._lock:
+            rows = self._connection.execute(
+                'SELECT key, username, period, incomes, expenses, comment, append_comment, attempts, '
+                'created_at, last_error FROM writes WHERE dead = 1 AND username = ? ORDER BY id',
+                (username,)).fetchall()
+        return [dict(self._entry(row[:8]), created_at=row[8], last_error=row[9]) for row in rows]
+
+    def retry(self, keys: list) -> None:
+        """
+        Put entries set aside back in the queue, with their rejections forgotten.
+        """
+        with self._lock:
+            self._connection.executemany('UPDATE writes SET dead = 0, attempts = 0 WHERE key = ?',
+                                         [(key,) for key in keys])
+
+    def counts(self) -> dict:
+        """
+        Count the entries waiting to be written and the ones set aside.
+
+        Returns:
+            dict: {"pending": int, "dead": int}
+        """
+        with self._lock:
+            rows = self._connection.execute('SELECT dead, COUNT(*) FROM writes GROUP BY dead').fetchall()
+        counts = {'pending': 0, 'dead': 0}
+        counts.update({'dead' if dead else 'pending': count for dead, count in rows})
+        return counts
+
+    def close(self) -> None:
+        """
+        Close the SQLite connection.
+        """
+        with self._lock:
+            self._connection.close()
+
+
+class WriteBehind:
+    """
+    Writes the entries of a Journal to MySQL from a background thread.
+
+    The thread wakes whenever an entry is appended, and every ``interval`` seconds to
+    pick up entries left by an earlier run. Entries are written in batches of
+    ``batch_size`` through ``flush``, oldest first. When MySQL is unreachable the batch
+    is retried with exponential backoff, capped at ``max_backoff`` seconds. When MySQL
+    rejects a batch, its entries are retried one by one so only the rejected ones are
+    held back.
+
+    Args:
+        journal (Journal): The journal to drain.
+        flush (callable): Writes a list of entries to MySQL in one transaction, applying
+            each idempotency key at most once.
+        batch_size (int): The maximum number of entries per flush.
+        interval (float): Seconds between checks while nothing is appended.
+        max_backoff (float): The longest pause between retries while MySQL is unreachable.
+    """
+
+    def __init__(self, journal: Journal, flush, batch_size: int = JOURNAL_BATCH_SIZE,
+                 interval: float = JOURNAL_FLUSH_INTERVAL, max_backoff: float = JOURNAL_MAX_BACKOFF):
+        self.journal = journal
+        self.flush = flush
+        self.batch_size = max(1, batch_size)
+        self.interval = interval
+        self.max_backoff = max_backoff
+        self.last_error = None
+        self._wake = threading.Event()
+        self._stopping = threading.Event()
+        # Serializes the background thread and callers draining the journal themselves
+        self._flush_lock = threading.Lock()
+        self._start_lock = threading.Lock()
+        self._thread = None
+
+    def start(self) -> None:
+        """
+        Start the background thread, if it is not running yet.
+        """
+        with self._start_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='write-behind', daemon=True)
+                self._thread.start()
+                atexit.register(self.stop)
+
+    def append(self, *args, **kwargs) -> str:
+        """
+        Record a save in the journal and wake the background thread.
+
+        Takes the arguments of ``Journal.append``.
+
+        Returns:
+            str: The idempotency key of the entry.
+        """
+        key = self.journal.append(*args, **kwargs)
+        self._wake.set()
+        return key
+
+    def retry(self, keys: list) -> None:
+        """
+        Put entries set aside back in the journal and wake the background thread.
+        """
+        self.journal.retry(keys)
+        self._wake.set()
+
+    def flush_once(self) -> int:
+        """
+        Write the oldest batch of entries to MySQL.
+
+        Returns:
+            int: The number of entries written, 0 once the journal is empty.
+
+        Raises:
+            pymysql.OperationalError, pymysql.InterfaceError: If MySQL is unreachable.
+            RejectedWrite: If MySQL rejected every entry of the batch.
+        """
+        with self._flush_lock:
+            entries = self.journal.batch(self.batch_size)
+            if not entries:
+                return 0
+            try:
+                self.flush(entries)
+            except TRANSIENT_ERRORS:
+                raise
+            except Exception as error:
+                if len(entries) == 1:
+                    self.journal.reject(entries[0]['key'], repr(error))
+                    raise RejectedWrite(str(error)) from error
+            else:
+                self.journal.remove([entry['key'] for entry in entries])
+                return len(entries)
+
+            # Retry one by one, so only the entries MySQL rejects are held back
+            written = 0
+            for entry in entries:
+                try:
+                    self.flush([entry])
+                except TRANSIENT_ERRORS:
+                    raise
+                except Exception as error:
+                    self.journal.reject(entry['key'], repr(error))
+                    rejection = error
+                else:
+                    self.journal.remove([entry['key']])
+                    written += 1
+            if not written:
+                raise RejectedWrite(str(rejection)) from rejection
+            return written
+
+    def drain(self) -> int:
+        """
+        Write every pending entry now, in the calling thread.
+
+        Called before writes that bypass the journal, so they land after the saves
+        made before them. Entries that keep being rejected are left to the background
+        thread.
+
+        Returns:
+            int: The number of entries written.
+
+        Raises:
+            pymysql.OperationalError, pymysql.InterfaceError: If MySQL is unreachable.
+        """
+        written = 0
+        try:
+            while True:
+                count = self.flush_once()
+                if not count:
+                    return written
+                written += count
+        except RejectedWrite:
+            return written
+
+    def _run(self) -> None:
+        """
+        The background loop: wait for entries, flush them, back off while MySQL is failing.
+        """
+        delay = 0
+        while not self._stopping.is_set():
+            if delay:
+                # Keep to the backoff even if more saves arrive meanwhile
+                self._stopping.wait(delay)
+            else:
+                self._wake.wait(self.interval)
+            self._wake.clear()
+            try:
+                while not self._stopping.is_set() and self.flush_once():
+                    pass
+                delay = 0
+                self.last_error = None
+            except Exception as error:
+                delay = min(max(delay * 2, 1), self.max_backoff)
+                self.last_error = repr(error)
+                logger.warning('Write-behind flush failed, retrying in %.0fs: %s', delay, error)
+
+    def stop(self, timeout: float = 5) -> None:
+        """
+        Stop the background thread. Unwritten entries stay in the journal for the next run.
+        """
+        self._stopping.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+
+def main() -> None:
+    """
+    Command line entry point: ``python -m logic.journal [--flush]``.
+    """
+    parser = argparse.ArgumentParser(description='Inspect or drain the local write-behind journal.')
+    parser.add_argument('--flush', action='store_true', help='write every pending entry to MySQL now')
+    args = parser.parse_args()
+
+    if args.flush:
+        from logic.database import write_behind
+        print(f'Wrote {write_behind().drain()} journaled saves')
+    counts = Journal().counts()
+    print(f'{counts["pending"]} saves pending, {counts["dead"]} rejected ({JOURNAL_PATH})')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,231 @@
+# loans.py
+
+import numpy as np
+from logic.util import *
+
+# Months projected ahead of the current one, 30 years
+PROJECTION_MONTHS = 360
+
+
+def annuity_payment(principal, rate, term) -> np.ndarray:
+    """
+    Computes the fixed monthly instalment that repays each loan over its term.
+
+    Parameters
+    ----------
+    principal : array_like
+        The amount borrowed per loan.
+    rate : array_like
+        The yearly interest rate per loan, in percent.
+    term : array_like
+        The number of monthly instalments per loan.
+
+    Returns
+    -------
+    np.ndarray
+        The monthly instalment per loan, NaN where the term is unknown.
+    """
+    principal, rate, term = np.broadcast_arrays(np.asarray(principal, dtype=float),
+                                                np.asarray(rate, dtype=float) / 1200,
+                                                np.asarray(term, dtype=float))
+    with np.errstate(divide='ignore', invalid='ignore', over='ignore'):
+        factor = (1 + rate) ** term
+        payment = np.where(rate > 0, principal * rate * factor / (factor - 1), principal / term)
+    return np.where(term > 0, payment, np.nan)
+
+
+class LoanBook:
+    """
+    Vectorized projections for any number of loans.
+
+    Every loan is one element of the arrays below, so balances, payoff dates and
+    interest are computed for the whole book at once. The balance after k more
+    instalments has a closed form, so a projection over all loans and months is a
+    single broadcast of a (loans, 1) array against a (1, months) array, with no
+    Python loop over either.
+
+    Parameters
+    ----------
+    names : list
+        The loan names.
+    principal : array_like
+        The total to be repaid per loan.
+    rate : array_like
+        The yearly interest rate per loan in percent, applied to the remaining balance.
+    payment : array_like
+        The monthly instalment per loan.
+    paid : array_like
+        The amount already repaid per loan.
+    """
+
+    def __init__(self, names, principal, rate, payment, paid):
+        self.names = list(names)
+        self.principal = np.asarray(principal, dtype=float)
+        self.rate = np.asarray(rate, dtype=float)
+        self.payment = np.nan_to_num(np.asarray(payment, dtype=float))
+        self.paid = np.asarray(paid, dtype=float)
+
+    @classmethod
+    def from_accounts(cls, accounts, paid, observed=None) -> 'LoanBook':
+        """
+        Builds the book of the accounts that have a principal.
+
+        The monthly instalment of each loan is its stored payment, else the annuity
+        of its principal, rate and term, else the average of the non-zero amounts
+        paid into it this year.
+
+        Parameters
+        ----------
+        accounts : list
+            Account rows as returned by load_accounts.
+        paid : array_like
+            The amount paid into each account this year, in the same order.
+        observed : array_like, optional
+            The 12 x N amounts paid per month, used when no instalment is known.
+
+        Returns
+        -------
+        LoanBook
+            The loans among the accounts.
+        """
+        loans = [i for i, account in enumerate(accounts) if account['principal'] is not None]
+        principal = np.array([float(accounts[i]['principal']) for i in loans])
+        rate = np.array([float(accounts[i]['rate'] or 0) for i in loans])
+        term = np.array([accounts[i]['term_months'] or 0 for i in loans], dtype=float)
+        payment = np.array([np.nan if accounts[i]['payment'] is None else float(accounts[i]['payment'])
+                            for i in loans])
+        # Repaid before this year: the carried balance when loaded for a year, else the opening one
+        opening = np.array([float(accounts[i].get('carried', accounts[i]['opening_paid']) or 0) for i in loans])
+
+        # Fall back from the stored instalment to the annuity, then to what is actually paid
+        payment = np.where(np.isnan(payment), annuity_payment(principal, rate, term), payment)
+        if observed is not None and loans:
+            observed = np.asarray(observed, dtype=float)[:, loans]
+            counts = np.count_nonzero(observed, axis=0)
+            average = np.divide(observed.sum(axis=0), counts, out=np.zeros(len(loans)), where=counts > 0)
+            payment = np.where(np.isnan(payment), average, payment)
+
+        return cls([accounts[i]['name'] for i in loans], principal, rate, payment,
+                   opening + np.asarray(paid, dtype=float)[loans])
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def remaining(self) -> np.ndarray:
+        """
+        Returns the balance left to repay on each loan, never below zero.
+        """
+        return np.clip(self.principal - self.paid, 0, None)
+
+    def balances(self, months: int = PROJECTION_MONTHS) -> np.ndarray:
+        """
+        Projects the balance of every loan over the coming months.
+
+        Parameters
+        ----------
+        months : int
+            The number of instalments to project.
+
+        Returns
+        -------
+        np.ndarray
+            A (loans, months + 1) array, column k holding the balance after k more instalments.
+        """
+        balance = self.remaining()[:, None]
+        rate = (self.rate / 1200)[:, None]
+        payment = self.payment[:, None]
+        k = np.arange(months + 1)[None, :]
+        growth = (1 + rate) ** k
+        # Sum of the compounded instalments, k instalments when there is no interest
+        with np.errstate(divide='ignore', invalid='ignore'):
+            paid = np.where(rate > 0, (growth - 1) / rate, k)
+        return np.clip(balance * growth - payment * paid, 0, None)
+
+    def interest(self, months: int = PROJECTION_MONTHS) -> np.ndarray:
+        """
+        Returns the interest each loan will still cost over the coming months.
+        """
+        balances = self.balances(months)
+        return (balances[:, :-1] * (self.rate / 1200)[:, None]).sum(axis=1)
+
+    def payoff_months(self) -> np.ndarray:
+        """
+        Computes the number of instalments left on each loan.
+
+        Returns
+        -------
+        np.ndarray
+            The instalments left per loan, inf where the instalment never repays the loan.
+        """
+        balance = self.remaining()
+        rate = self.rate / 1200
+        payment = self.payment
+        with np.errstate(divide='ignore', invalid='ignore'):
+            # Solve balance * (1 + r)^n = payment * ((1 + r)^n - 1) / r for n
+            compounded = -np.log1p(-rate * balance / payment) / np.log1p(rate)
+            months = np.where(rate > 0, compounded, balance / payment)
+        # Round before ceil so float noise never adds an instalment
+        months = np.ceil(np.round(months, 6))
+        months = np.where((payment <= 0) | (payment <= rate * balance) | np.isnan(months), np.inf, months)
+        return np.where(balance <= 0, 0, months)
+
+    def payoff_dates(self, year: int, month: int) -> list:
+        """
+        Dates of the last instalment of each loan.
+
+        Parameters
+        ----------
+        year : int
+            The year of the next instalment.
+        month : int
+            The month of the next instalment, 1 to 12.
+
+        Returns
+        -------
+        list
+            "Month Year" per loan, "Paid" for repaid loans and None when the loan is never repaid.
+        """
+        months = self.payoff_months()
+        finite = np.isfinite(months)
+        # Months counted from January of year 0, the last instalment being months - 1 after the next one
+        index = year * 12 + (month - 1) + np.where(finite, months, 1).astype(int) - 1
+        dates = []
+        for left, done, position in zip(months.tolist(), finite.tolist(), index.tolist()):
+            if not done:
+                dates.append(None)
+            elif left == 0:
+                dates.append('Paid')
+            else:
+                dates.append(f'{MONTHS[position % 12]} {position // 12}')
+        return dates
+
+    def to_frame(self, year: int, month: int):
+        """
+        Builds the summary table shown by the tracker.
+
+        Parameters
+        ----------
+        year : int
+            The year of the next instalment.
+        month : int
+            The month of the next instalment, 1 to 12.
+
+        Returns
+        -------
+        pd.DataFrame
+            One row per loan with its principal, repaid and remaining amounts,
+            instalment, instalments left, payoff date and interest still due.
+        """
+        import pandas as pd
+
+        left = self.payoff_months()
+        return pd.DataFrame({
+            'Loan': self.names,
+            'Principal': self.principal,
+            'Paid': self.paid,
+            'Remaining': self.remaining(),
+            'Instalment': self.payment,
+            'Instalments Left': np.where(np.isfinite(left), left, np.nan),
+            'Payoff': self.payoff_dates(year, month),
+            'Interest Due': self.interest(),
+        })
@@ -0,0 +1,205 @@
+# memory_storage.py
+
+import itertools
+import json
+import threading
+from logic.util import *
+from logic.storage import Storage, DuplicateError, ACCOUNT_FIELDS
+
+
+class MemoryStorage(Storage):
+    """
+    A process-local backend holding everything in dictionaries, for benchmarks and
+    hermetic runs of the app. Nothing survives a restart.
+
+    Periods are kept as the JSON text the other backends store, so callers get the
+    same types back and never share a dictionary with the store. Periods are grouped
+    by user and users are indexed by their lowercased email and username, so lookups
+    cost what an indexed query would however large the store grows. One lock guards
+    every table, and each write happens entirely under it.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._ids = itertools.count(1)
+        # username -> {period: [id, period, incomes JSON, expenses JSON, comment]}, in insertion order
+        self._periods = {}
+        # id -> user dictionary
+        self._users = {}
+        # Lowercased email and username -> user id, the unique indexes of the other backends
+        self._emails = {}
+        self._usernames = {}
+        # id -> account dictionary with username, ACCOUNT_FIELDS and position
+        self._accounts = {}
+        # (account_id, year, month) -> amount
+        self._payments = {}
+        # (account_id, year) -> opening_paid
+        self._account_years = {}
+        # (username, year, month) -> (month name, salary, my cut)
+        self._installments = {}
+        self._applied = set()
+
+    def _upsert_period(self, username, period, incomes, expenses, comment, append_comment=False) -> None:
+        periods = self._periods.setdefault(username, {})
+        row = periods.get(period)
+        if row is None:
+            periods[period] = [next(self._ids), period, json.dumps(incomes), json.dumps(expenses), comment or '']
+            return
+        if append_comment:
+            # Same result as the CONCAT_WS of the MySQL backend
+            comment = '\n\n'.join(part for part in (row[4], comment) if part)
+        row[2:] = [json.dumps(incomes), json.dumps(expenses), comment or '']
+
+    # Periods
+
+    def iter_periods(self, username, batch_size=STREAM_BATCH_SIZE):
+        with self._lock:
+            rows = [tuple(row) for row in self._periods.get(username, {}).values()]
+        yield from rows
+
+    def get_period(self, username, period):
+        with self._lock:
+            row = self._periods.get(username, {}).get(period)
+            return tuple(row[2:]) if row else None
+
+    def save_periods(self, username, entries, chunk_size=BULK_CHUNK_SIZE):
+        # Validate every entry before the first write, so a bad one leaves the store untouched
+        entries = [(item['period'], item['incomes'], item['expenses'], item.get('comment') or '') for item in entries]
+        with self._lock:
+            for period, incomes, expenses, comment in entries:
+                self._upsert_period(username, period, incomes, expenses, comment)
+        return len(entries)
+
+    def upsert_period(self, username, period, incomes, expenses, comment, append_comment=False):
+        with self._lock:
+            self._upsert_period(username, period, incomes, expenses, comment, append_comment)
+
+    def apply_writes(self, entries):
+        with self._lock:
+            for entry in entries:
+                if entry['key'] in self._applied:
+                    continue
+                self._applied.add(entry['key'])
+                self._upsert_period(entry['username'], entry['period'], entry['incomes'], entry['expenses'],
+                                    entry['comment'], entry['append_comment'])
+
+    def update_period(self, username, period, incomes, expenses):
+        with self._lock:
+            row = self._periods.get(username, {}).get(period)
+            if row is None:
+                return False
+            row[2:4] = [json.dumps(incomes), json.dumps(expenses)]
+            return True
+
+    def update_comment(self, username, period, comment):
+        with self._lock:
+            row = self._periods.get(username, {}).get(period)
+            if row is not None:
+                row[4] = comment
+
+    def clear_periods(self, username):
+        with self._lock:
+            self._periods.pop(username, None)
+
+    # Users
+
+    def insert_user(self, email, username, password, date_joined):
+        with self._lock:
+            if self.find_taken(email, username):
+                raise DuplicateError(f'Email {email!r} or username {username!r} already exists')
+            user_id = next(self._ids)
+            self._users[user_id] = {'id': user_id, 'email': email, 'username': username,
+                                    'password': password, 'date_joined': date_joined}
+            self._emails[email.lower()] = user_id
+            self._usernames[username.lower()] = user_id
+
+    def fetch_users(self):
+        with self._lock:
+            return [dict(user) for user in self._users.values()]
+
+    def get_user(self, username):
+        with self._lock:
+            user = self._users.get(self._usernames.get(username.lower()))
+            return {key: user[key] for key in ('id', 'email', 'username', 'password')} if user else None
+
+    def find_taken(self, email, username):
+        # Compared case-insensitively, like the unique indexes of the other backends
+        with self._lock:
+            ids = dict.fromkeys(user_id for user_id in (self._emails.get(email.lower()),
+                                                        self._usernames.get(username.lower())) if user_id)
+            return [(self._users[user_id]['email'], self._users[user_id]['username']) for user_id in ids]
+
+    # Instalments
+
+    def load_accounts(self, username, year):
+        with self._lock:
+            accounts = sorted((account for account in self._accounts.values() if account['username'] == username),
+                              key=lambda account: (account['position'], account['id']))
+            rows = []
+            for account in accounts:
+                carried = self._account_years.get((account['id'], year))
+                if carried is None:
+                    carried = (account['opening_paid'] or 0) + sum(
+                        amount for (account_id, paid_year, _), amount in self._payments.items()
+                        if account_id == account['id'] and paid_year < year)
+                rows.append(dict({'id': account['id']}, **{field: account[field] for field in ACCOUNT_FIELDS},
+                                 carried=carried))
+            return rows
+
+    def load_years(self, username):
+        with self._lock:
+            ids = {account_id for account_id, account in self._accounts.items() if account['username'] == username}
+            return ({year for owner, year, _ in self._installments if owner == username} |
+                    {year for account_id, year, _ in self._payments if account_id in ids})
+
+    def save_accounts(self, username, rows):
+        with self._lock:
+            kept = {int(row['id']) for row in rows if row.get('id') is not None}
+            for account_id in [account_id for account_id, account in self._accounts.items()
+                               if account['username'] == username and account_id not in kept]:
+                self._delete_account(account_id)
+            for position, row in enumerate(rows):
+                account_id = int(row['id']) if row.get('id') is not None else next(self._ids)
+                self._accounts[account_id] = dict({field: row[field] for field in ACCOUNT_FIELDS},
+                                                  id=account_id, username=username, position=position)
+
+    def _delete_account(self, account_id: int) -> None:
+        # Payments and opening balances go with the account, like the foreign keys of the other backends
+        del self._accounts[account_id]
+        for table in (self._payments, self._account_years):
+            for key in [key for key in table if key[0] == account_id]:
+                del table[key]
+
+    def load_instalments(self, username, year):
+        with self._lock:
+            ids = {account_id for account_id, account in self._accounts.items() if account['username'] == username}
+            payments = [(account_id, month, amount) for (account_id, paid_year, month), amount in self._payments.items()
+                        if account_id in ids and paid_year == year]
+            salaries = [(name, salary) for (owner, row_year, _), (name, salary, _) in self._installments.items()
+                        if owner == username and row_year == year]
+        return payments, salaries
+
+    def save_instalments(self, username, year, account_ids, payments, months):
+        with self._lock:
+            for account_id, month, amount in payments:
+                self._payments[(account_id, year, month)] = amount
+            if payments:
+                for key in [key for key in self._account_years if key[0] in account_ids and key[1] > year]:
+                    del self._account_years[key]
+            for month, salary, my_cut in months:
+                self._installments[(username, year, month)] = (MONTHS[month - 1], salary, my_cut)
+
+    def rollover(self, year, username=None):
+        with self._lock:
+            accounts = [account for account in self._accounts.values()
+                        if username is None or account['username'] == username]
+            for account in accounts:
+                opening = self._account_years.get((account['id'], year))
+                paid = {'earlier': 0, 'year': 0}
+                for (account_id, paid_year, _), amount in self._payments.items():
+                    if account_id == account['id'] and paid_year <= year:
+                        paid['year' if paid_year == year else 'earlier'] += amount
+                if opening is None:
+                    opening = (account['opening_paid'] or 0) + paid['earlier']
+                self._account_years[(account['id'], year + 1)] = opening + paid['year']
+            return len(accounts)
@@ -0,0 +1,367 @@
+# metrics.py
+
+import logging
+import os
+import threading
+import time
+from bisect import bisect_left
+from collections import defaultdict
+from contextlib import contextmanager
+from logic.util import *
+
+logger = logging.getLogger(__name__)
+
+# Prefix of every exported metric name
+PREFIX = 'expense_tracker'
+
+# Upper bounds of the latency histogram buckets, in seconds
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Metric name: (type, help text)
+METRICS = {
+    'rerun_seconds': ('histogram', 'Wall time of a script rerun.'),
+    'section_seconds': ('histogram', 'Wall time of a page section.'),
+    'query_seconds': ('histogram', 'Wall time of a storage call, streamed rows included.'),
+    'rows_fetched_total': ('counter', 'Rows returned by storage calls.'),
+    'statements_total': ('counter', 'SQL statements executed.'),
+    'connections_opened_total': ('counter', 'Physical database connections opened.'),
+    'connection_checkouts_total': ('counter', 'Connections checked out of the MySQL pool.'),
+}
+
+# Storage methods returning a generator, timed until the caller has consumed it
+STREAMS = {'iter_periods'}
+
+# Rows returned by a storage call, when it is not the length of its result
+ROWS = {
+    'get_period': lambda result: int(result is not None),
+    'get_user': lambda result: int(result is not None),
+    'period_totals': lambda result: 1,
+    'load_instalments': lambda result: len(result[0]) + len(result[1]),
+}
+
+
+class Histogram:
+    """
+    Counts observations into the fixed BUCKETS, the way a Prometheus histogram does.
+
+    Args:
+        buckets (tuple): The ascending upper bounds of the buckets, +Inf is implied.
+    """
+
+    def __init__(self, buckets: tuple = BUCKETS):
+        self.buckets = buckets
+        # Non-cumulative counts, the last one for observations above every bound
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q: float) -> float:
+        """
+        Estimate a quantile as the upper bound of the bucket holding it.
+
+        Returns:
+            float: The bound in seconds, infinity above the last bucket, 0 without observations.
+        """
+        if not self.count:
+            return 0.0
+        rank, seen = q * self.count, 0
+        for bound, count in zip(self.buckets + (float('inf'),), self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return float('inf')
+
+
+class Registry:
+    """
+    The process-wide histograms and counters, shared by every session and thread.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # (name, labels) -> Histogram or float, labels being a tuple of (key, value) pairs
+        self._histograms = {}
+        self._counters = defaultdict(float)
+
+    def observe(self, name: str, seconds: float, **labels) -> None:
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram()
+            histogram.observe(seconds)
+
+    def increment(self, name: str, amount: float = 1, **labels) -> None:
+        with self._lock:
+            self._counters[(name, tuple(sorted(labels.items())))] += amount
+
+    def histogram(self, name: str, **labels) -> Histogram:
+        """
+        Returns a histogram, empty if nothing was observed with these labels.
+        """
+        with self._lock:
+            return self._histograms.get((name, tuple(sorted(labels.items()))), Histogram())
+
+    def render(self) -> str:
+        """
+        Serialize every metric in the Prometheus text exposition format.
+
+        Returns:
+            str: The exposition, one line per sample.
+        """
+        with self._lock:
+            histograms = sorted(self._histograms.items())
+            counters = sorted(self._counters.items())
+        lines = []
+        for name, (kind, description) in METRICS.items():
+            lines += [f'# HELP {PREFIX}_{name} {description}', f'# TYPE {PREFIX}_{name} {kind}']
+            if kind == 'histogram':
+                for (metric, labels), histogram in histograms:
+                    if metric != name:
+                        continue
+                    cumulative = 0
+                    for bound, count in zip(histogram.buckets + (float('inf'),), histogram.counts):
+                        cumulative += count
+                        le = '+Inf' if bound == float('inf') else repr(bound)
+                        lines.append(f'{PREFIX}_{name}_bucket{_labels(labels + (("le", le),))} {cumulative}')
+                    lines.append(f'{PREFIX}_{name}_sum{_labels(labels)} {histogram.sum!r}')
+                    lines.append(f'{PREFIX}_{name}_count{_labels(labels)} {histogram.count}')
+            else:
+                lines += [f'{PREFIX}_{name}{_labels(labels)} {value:g}'
+                          for (metric, labels), value in counters if metric == name]
+        return '\n'.join(lines) + '\n'
+
+    def write(self, path: str) -> None:
+        """
+        Replace a metrics file atomically, so a collector never reads half of it.
+
+        Args:
+            path (str): The file, e.g. in the directory of node_exporter's textfile collector.
+        """
+        text = self.render()
+        temporary = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        with open(temporary, 'w') as fp:
+            fp.write(text)
+        os.replace(temporary, path)
+
+
+def _labels(labels: tuple) -> str:
+    """
+    Format label pairs as {key="value",...}, escaping the values.
+    """
+    if not labels:
+        return ''
+    pairs = []
+    for key, value in labels:
+        value = str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        pairs.append(f'{key}="{value}"')
+    return '{' + ','.join(pairs) + '}'
+
+
+class Rerun:
+    """
+    What one script rerun spent its time on: the sections it went through, the storage
+    calls it made and its counters.
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        # [name, depth, seconds] in the order the sections started, seconds is None while running
+        self.sections = []
+        # (name, seconds, rows) in the order the calls finished
+        self.queries = []
+        self.counters = defaultdict(float)
+        self.depth = 0
+
+    @property
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.started
+
+
+registry = Registry()
+_local = threading.local()
+
+
+def current() -> Rerun:
+    """
+    Returns the rerun running in this thread, or None outside a rerun, e.g. in the write-behind thread.
+    """
+    return getattr(_local, 'rerun', None)
+
+@contextmanager
+def rerun(path: str = METRICS_PATH):
+    """
+    Record one script rerun.
+
+    Streamlit runs the script of a session in its own thread, so the sections and
+    queries of concurrent sessions never mix. When the rerun ends, its wall time goes
+    to the rerun histogram and the metrics file is rewritten.
+
+    Args:
+        path (str): The Prometheus text file to write, nothing is written when empty.
+
+    Yields:
+        Rerun: The record of this rerun.
+    """
+    record = _local.rerun = Rerun()
+    try:
+        yield record
+    finally:
+        _local.rerun = None
+        registry.observe('rerun_seconds', record.elapsed)
+        if path:
+            try:
+                registry.write(path)
+            except OSError as error:
+                logger.error('Error writing metrics to %s: %s', path, error)
+
+@contextmanager
+def section(name: str):
+    """
+    Time a section of the page, e.g. ``with section('plug'): plug()``.
+
+    Sections may nest, the debug panel indents them.
+    """
+    record = current()
+    entry = None
+    if record is not None:
+        entry = [name, record.depth, None]
+        record.sections.append(entry)
+        record.depth += 1
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        seconds = time.perf_counter() - started
+        registry.observe('section_seconds', seconds, section=name)
+        if entry is not None:
+            entry[2] = seconds
+            record.depth -= 1
+
+def record_query(name: str, seconds: float, rows: int = 0) -> None:
+    """
+    Record one storage call, and the rows it returned.
+    """
+    registry.observe('query_seconds', seconds, query=name)
+    if rows:
+        registry.increment('rows_fetched_total', rows, query=name)
+    record = current()
+    if record is not None:
+        record.queries.append((name, seconds, rows))
+        record.counters['rows_fetched_total'] += rows
+
+def increment(name: str, amount: float = 1, **labels) -> None:
+    """
+    Add to a counter of the process and of the current rerun.
+    """
+    registry.increment(name, amount, **labels)
+    record = current()
+    if record is not None:
+        record.counters[name] += amount
+
+
+class InstrumentedStorage:
+    """
+    Wraps a storage backend and records every call as one query of the current rerun.
+
+    Calls returning a generator are timed while the caller consumes them, and their
+    rows are counted as they are yielded.
+
+    Args:
+        storage (Storage): The backend doing the work.
+    """
+
+    def __init__(self, storage):
+        self.storage = storage
+
+    def __getattr__(self, name):
+        attribute = getattr(self.storage, name)
+        if name.startswith('_') or not callable(attribute):
+            return attribute
+        if name in STREAMS:
+            return lambda *args, **kwargs: self._stream(name, attribute(*args, **kwargs))
+
+        def call(*args, **kwargs):
+            started = time.perf_counter()
+            result = None
+            try:
+                result = attribute(*args, **kwargs)
+                return result
+            finally:
+                rows = ROWS[name](result) if name in ROWS and result is not None else (
+                    len(result) if isinstance(result, (list, set, dict)) else 0)
+                record_query(name, time.perf_counter() - started, rows)
+        return call
+
+    @staticmethod
+    def _stream(name: str, iterator):
+        """
+        Re-yield the rows of a generator, timing only the time spent producing them.
+        """
+        rows, seconds = 0, 0.0
+        try:
+            while True:
+                started = time.perf_counter()
+                try:
+                    row = next(iterator)
+                except StopIteration:
+                    return
+                finally:
+                    seconds += time.perf_counter() - started
+                rows += 1
+                yield row
+        finally:
+            # Closing early releases whatever the backend holds, e.g. a server-side cursor
+            iterator.close()
+            record_query(name, seconds, rows)
+
+
+def debug_panel() -> None:
+    """
+    Show the sections, queries and counters of the current rerun in the sidebar, and
+    the heaviest statements of the process.
+
+    Only rendered with METRICS_PANEL enabled. Called last, so every section of the
+    rerun has finished, and the total is the time spent so far.
+    """
+    record = current()
+    if not METRICS_PANEL or record is None:
+        return
+    import streamlit as st
+    from logic.querylog import query_log
+
+    with st.sidebar.expander('Debug: rerun metrics', expanded=True):
+        st.caption(f'{record.elapsed * 1000:.1f} ms so far, {len(record.queries)} queries, '
+                   f'{record.counters["statements_total"]:g} SQL statements, '
+                   f'{record.counters["rows_fetched_total"]:g} rows fetched, '
+                   f'{record.counters["connections_opened_total"]:g} connections opened, '
+                   f'{record.counters["connection_checkouts_total"]:g} checkouts')
+        st.dataframe([{'section': '· ' * depth + name, 'ms': round((seconds or 0) * 1000, 2)}
+                      for name, depth, seconds in record.sections],
+                     hide_index=True, use_container_width=True)
+        queries = {}
+        for name, seconds, rows in record.queries:
+            entry = queries.setdefault(name, {'query': name, 'calls': 0, 'ms': 0.0, 'rows': 0})
+            entry['calls'] += 1
+            entry['ms'] += seconds * 1000
+            entry['rows'] += rows
+        if queries:
+            st.dataframe([dict(entry, ms=round(entry['ms'], 2)) for entry in queries.values()],
+                         hide_index=True, use_container_width=True)
+        statements = query_log.top(5)
+        if statements:
+            st.caption('Heaviest statements of this process')
+            st.dataframe([{'statement': stats['fingerprint'], 'calls': stats['count'],
+                           'total ms': round(stats['total_s'] * 1000, 2), 'max ms': round(stats['max_s'] * 1000, 2),
+                           'rows': stats['rows'], 'site': stats['site']} for stats in statements],
+                         hide_index=True, use_container_width=True)
+        p99 = registry.histogram('rerun_seconds').quantile(0.99)
+        if p99 == float('inf'):
+            st.caption(f'p99 rerun of this process: over {BUCKETS[-1]:g} s')
+        elif p99:
+            st.caption(f'p99 rerun of this process: under {p99 * 1000:g} ms')
@@ -0,0 +1,502 @@
+# migrations.py
+
+import argparse
+import json
+import logging
+import threading
+from logic.util import *
+from logic import pool, rollups
+
+logger = logging.getLogger(__name__)
+
+# Table recording which schema versions have been applied
+SCHEMA_TABLE = 'ExpenseTrackerSchema'
+
+# Named lock that keeps two processes from migrating at the same time
+MIGRATION_LOCK = 'expense_tracker_migrations'
+
+
+def index_exists(cursor, table: str, name: str) -> bool:
+    """
+    Check whether an index exists on a table in the current database.
+
+    Args:
+        cursor: An open database cursor.
+        table (str): The table name.
+        name (str): The index name.
+
+    Returns:
+        bool: True if the index exists, False otherwise.
+    """
+    cursor.execute(
+        'SELECT 1 FROM information_schema.statistics '
+        'WHERE table_schema = DATABASE() AND table_name = %s AND index_name = %s LIMIT 1',
+        (table, name))
+    return cursor.fetchone() is not None
+
+def column_exists(cursor, table: str, name: str) -> bool:
+    """
+    Check whether a column exists on a table in the current database.
+
+    Args:
+        cursor: An open database cursor.
+        table (str): The table name.
+        name (str): The column name.
+
+    Returns:
+        bool: True if the column exists, False otherwise.
+    """
+    cursor.execute(
+        'SELECT 1 FROM information_schema.columns '
+        'WHERE table_schema = DATABASE() AND table_name = %s AND column_name = %s LIMIT 1',
+        (table, name))
+    return cursor.fetchone() is not None
+
+def add_index(cursor, table: str, name: str, columns: str, unique: bool = False) -> None:
+    """
+    Create an index unless it already exists.
+
+    Args:
+        cursor: An open database cursor.
+        table (str): The table name.
+        name (str): The index name.
+        columns (str): The indexed columns, e.g. "username, period".
+        unique (bool): Create a unique index.
+    """
+    if not index_exists(cursor, table, name):
+        kind = 'UNIQUE INDEX' if unique else 'INDEX'
+        cursor.execute(f'CREATE {kind} {name} ON {table} ({columns})')
+
+def drop_index(cursor, table: str, name: str) -> None:
+    """
+    Drop an index if it exists.
+
+    Args:
+        cursor: An open database cursor.
+        table (str): The table name.
+        name (str): The index name.
+    """
+    if index_exists(cursor, table, name):
+        cursor.execute(f'DROP INDEX {name} ON {table}')
+
+def add_column(cursor, table: str, name: str, definition: str) -> None:
+    """
+    Add a column unless it already exists.
+
+    Args:
+        cursor: An open database cursor.
+        table (str): The table name.
+        name (str): The column name.
+        definition (str): The column type and options, e.g. "INT NULL".
+    """
+    if not column_exists(cursor, table, name):
+        cursor.execute(f'ALTER TABLE {table} ADD COLUMN {name} {definition}')
+
+
+def _v1_baseline(cursor) -> None:
+    """
+    Create the details, auth and installments tables with their lookup indexes.
+    """
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS ExpenseTrackerDetails (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            period VARCHAR(255) NOT NULL,
+            incomes JSON NOT NULL,
+            expenses JSON NOT NULL,
+            comment TEXT
+        )
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS ExpenseTrackerAuth (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            email VARCHAR(255) NOT NULL,
+            username VARCHAR(255) NOT NULL,
+            password TEXT NOT NULL,
+            date_joined VARCHAR(32)
+        )
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS ExpenseTrackerInstallments (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            Months VARCHAR(16) NOT NULL,
+            ING DECIMAL(12, 2) NOT NULL DEFAULT 0,
+            CEC DECIMAL(12, 2) NOT NULL DEFAULT 0,
+            Orange DECIMAL(12, 2) NOT NULL DEFAULT 0,
+            Salary DECIMAL(12, 2) NOT NULL DEFAULT 0,
+            MyCut DECIMAL(12, 2) NOT NULL DEFAULT 0
+        )
+    ''')
+    # Every period lookup filters on the period name
+    add_index(cursor, 'ExpenseTrackerDetails', 'idx_details_period', 'period')
+    # The tracker reads and writes one row per month name
+    add_index(cursor, 'ExpenseTrackerInstallments', 'idx_installments_months', 'Months')
+
+
+def _v2_unique_users(cursor) -> None:
+    """
+    Make usernames and emails unique so logins and registrations are single keyed lookups.
+    """
+    for column in ('username', 'email'):
+        cursor.execute(f'SELECT {column} FROM ExpenseTrackerAuth GROUP BY {column} HAVING COUNT(*) > 1 LIMIT 10')
+        duplicates = [row[0] for row in cursor.fetchall()]
+        if duplicates:
+            raise RuntimeError(f'Duplicate {column} values must be resolved before migrating: {duplicates}')
+    add_index(cursor, 'ExpenseTrackerAuth', 'uq_auth_username', 'username', unique=True)
+    add_index(cursor, 'ExpenseTrackerAuth', 'uq_auth_email', 'email', unique=True)
+
+
+def _v3_unique_periods(cursor) -> None:
+    """
+    Make the period unique so saves can be a single upsert, keeping the newest duplicate.
+    """
+    cursor.execute('''
+        DELETE older FROM ExpenseTrackerDetails older
+        JOIN ExpenseTrackerDetails newer ON newer.period = older.period AND newer.id > older.id
+    ''')
+    add_index(cursor, 'ExpenseTrackerDetails', 'uq_details_period', 'period', unique=True)
+    drop_index(cursor, 'ExpenseTrackerDetails', 'idx_details_period')
+
+
+def _v4_details_owner(cursor) -> None:
+    """
+    Give every period an owner and key periods by (username, period).
+
+    Rows written before periods were kept per user are assigned to OWNER.
+    """
+    add_column(cursor, 'ExpenseTrackerDetails', 'username', "VARCHAR(255) NOT NULL DEFAULT ''")
+    cursor.execute("UPDATE ExpenseTrackerDetails SET username = %s WHERE username = ''", (OWNER,))
+    add_index(cursor, 'ExpenseTrackerDetails', 'uq_details_user_period', 'username, period', unique=True)
+    drop_index(cursor, 'ExpenseTrackerDetails', 'uq_details_period')
+
+
+def _v5_line_items(cursor) -> None:
+    """
+    Create the normalized line-item table and fill it from the JSON columns of existing periods.
+    """
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS ExpenseTrackerLineItems (
+            id BIGINT AUTO_INCREMENT PRIMARY KEY,
+            username VARCHAR(255) NOT NULL,
+            period VARCHAR(255) NOT NULL,
+            kind ENUM('income', 'expense') NOT NULL,
+            category VARCHAR(191) NOT NULL,
+            amount DECIMAL(14, 2) NOT NULL DEFAULT 0,
+            UNIQUE INDEX uq_line_items (username, period, kind, category),
+            INDEX idx_line_items_category (username, kind, category)
+        )
+    ''')
+    # Walk the periods in id order, one page at a time
+    last_id = 0
+    while True:
+        cursor.execute('SELECT id, username, period, incomes, expenses FROM ExpenseTrackerDetails '
+                       'WHERE id > %s ORDER BY id LIMIT 1000', (last_id,))
+        rows = cursor.fetchall()
+        if not rows:
+            break
+        params = []
+        for _, username, period, incomes, expenses in rows:
+            for category, amount in json.loads(incomes).items():
+                params.extend((username, period, 'income', category, float(amount or 0)))
+            for category, amount in json.loads(expenses).items():
+                params.extend((username, period, 'expense', category, float(amount or 0)))
+        if params:
+            placeholders = ', '.join(['(%s, %s, %s, %s, %s)'] * (len(params) // 5))
+            cursor.execute('INSERT IGNORE INTO ExpenseTrackerLineItems (username, period, kind, category, amount) '
+                           f'VALUES {placeholders}', params)
+        last_id = rows[-1][0]
+
+
+def _v6_rollups(cursor) -> None:
+    """
+    Create the monthly and yearly rollup table and fill it from the line items.
+    """
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS ExpenseTrackerRollups (
+            username VARCHAR(255) NOT NULL,
+            year SMALLINT NOT NULL,
+            month TINYINT NOT NULL,
+            kind ENUM('income', 'expense') NOT NULL,
+            category VARCHAR(191) NOT NULL,
+            amount DECIMAL(16, 2) NOT NULL DEFAULT 0,
+            PRIMARY KEY (username, year, month, kind, category)
+        )
+    ''')
+    rollups.rebuild(cursor)
+
+
+def _v7_period_keys(cursor) -> None:
+    """
+    Add the sortable (year, month) key of each period, backfill it and index it per user.
+    """
+    add_column(cursor, 'ExpenseTrackerDetails', 'period_key', 'INT NULL')
+    last_id = 0
+    while True:
+        cursor.execute('SELECT id, period FROM ExpenseTrackerDetails WHERE id > %s ORDER BY id LIMIT 1000',
+                       (last_id,))
+        rows = cursor.fetchall()
+        if not rows:
+            break
+        keys = [(row_id, period_key(period)) for row_id, period in rows]
+        keys = [(row_id, key) for row_id, key in keys if key is not None]
+        if keys:
+            cases = ' '.join(['WHEN %s THEN %s'] * len(keys))
+            ids = ', '.join(['%s'] * len(keys))
+            params = [value for pair in keys for value in pair] + [row_id for row_id, _ in keys]
+            cursor.execute(f'UPDATE ExpenseTrackerDetails SET period_key = CASE id {cases} END WHERE id IN ({ids})',
+                           params)
+        last_id = rows[-1][0]
+    add_index(cursor, 'ExpenseTrackerDetails', 'idx_details_user_period_key', 'username, period_key')
+
+
+def _v8_unique_months(cursor) -> None:
+    """
+    Make the installment month unique so changed months are saved with one upsert.
+    """
+    cursor.execute('''
+        DELETE older FROM ExpenseTrackerInstallments older
+        JOIN ExpenseTrackerInstallments newer ON newer.Months = older.Months AND newer.id > older.id
+    ''')
+    add_index(cursor, 'ExpenseTrackerInstallments', 'uq_installments_months', 'Months', unique=True)
+    drop_index(cursor, 'ExpenseTrackerInstallments', 'idx_installments_months')
+
+
+def _v9_accounts(cursor) -> None:
+    """
+    Move the instalment accounts into their own tables, seeded from the columns and
+    balances the tracker used to hard-code.
+    """
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS ExpenseTrackerAccounts (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            username VARCHAR(255) NOT NULL,
+            name VARCHAR(64) NOT NULL,
+            principal DECIMAL(12, 2) NULL,
+            rate DECIMAL(7, 4) NOT NULL DEFAULT 0,
+            term_months INT NULL,
+            payment DECIMAL(12, 2) NULL,
+            opening_paid DECIMAL(12, 2) NOT NULL DEFAULT 0,
+            position INT NOT NULL DEFAULT 0,
+            UNIQUE INDEX uq_accounts (username, name)
+        )
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS ExpenseTrackerPayments (
+            account_id INT NOT NULL,
+            month TINYINT NOT NULL,
+            amount DECIMAL(12, 2) NOT NULL DEFAULT 0,
+            PRIMARY KEY (account_id, month),
+            FOREIGN KEY (account_id) REFERENCES ExpenseTrackerAccounts (id) ON DELETE CASCADE
+        )
+    ''')
+    # The accounts, loan totals and amounts paid before tracking started, as the tracker had them
+    seed = [('ING', 13529.00, 3699.81), ('CEC', 38660.00, 594.35), ('Orange', None, 0)]
+    cursor.execute('''
+        INSERT IGNORE INTO ExpenseTrackerAccounts (username, name, principal, opening_paid, position)
+        VALUES ''' + ', '.join(['(%s, %s, %s, %s, %s)'] * len(seed)),
+        [value for position, (name, principal, opening) in enumerate(seed)
+         for value in (OWNER, name, principal, opening, position)])
+    # Copy the amounts of the legacy per-account columns, months numbered from 1
+    months = ', '.join(['%s'] * len(MONTHS))
+    for name, _, _ in seed:
+        cursor.execute(f'''
+            INSERT IGNORE INTO ExpenseTrackerPayments (account_id, month, amount)
+            SELECT accounts.id, FIELD(installments.Months, {months}), installments.{name}
+            FROM ExpenseTrackerInstallments installments
+            JOIN ExpenseTrackerAccounts accounts ON accounts.username = %s AND accounts.name = %s
+            WHERE installments.{name} <> 0 AND FIELD(installments.Months, {months}) > 0
+        ''', MONTHS + [OWNER, name] + MONTHS)
+
+
+def _v10_instalment_years(cursor) -> None:
+    """
+    Key salaries and payments by (user, year, month) so years no longer overwrite each
+    other, and add the per-year opening balances written by the rollover.
+
+    Existing rows belong to OWNER and the current year.
+    """
+    year = datetime.today().year
+    months = ', '.join(['%s'] * len(MONTHS))
+    add_column(cursor, 'ExpenseTrackerInstallments', 'username', "VARCHAR(255) NOT NULL DEFAULT ''")
+    add_column(cursor, 'ExpenseTrackerInstallments', 'year', 'SMALLINT NOT NULL DEFAULT 0')
+    add_column(cursor, 'ExpenseTrackerInstallments', 'month', 'TINYINT NOT NULL DEFAULT 0')
+    cursor.execute(f'''
+        UPDATE ExpenseTrackerInstallments SET username = %s, year = %s, month = FIELD(Months, {months})
+        WHERE username = ''
+    ''', [OWNER, year] + MONTHS)
+    add_index(cursor, 'ExpenseTrackerInstallments', 'uq_installments_period', 'username, year, month', unique=True)
+    drop_index(cursor, 'ExpenseTrackerInstallments', 'uq_installments_months')
+
+    if not column_exists(cursor, 'ExpenseTrackerPayments', 'year'):
+        cursor.execute('ALTER TABLE ExpenseTrackerPayments ADD COLUMN year SMALLINT NOT NULL DEFAULT 0 AFTER account_id')
+        cursor.execute('UPDATE ExpenseTrackerPayments SET year = %s', (year,))
+        cursor.execute('ALTER TABLE ExpenseTrackerPayments DROP PRIMARY KEY, ADD PRIMARY KEY (account_id, year, month)')
+
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS ExpenseTrackerAccountYears (
+            account_id INT NOT NULL,
+            year SMALLINT NOT NULL,
+            opening_paid DECIMAL(12, 2) NOT NULL DEFAULT 0,
+            PRIMARY KEY (account_id, year),
+            FOREIGN KEY (account_id) REFERENCES ExpenseTrackerAccounts (id) ON DELETE CASCADE
+        )
+    ''')
+
+
+def _v11_applied_writes(cursor) -> None:
+    """
+    Record the idempotency keys of the journaled saves applied by the write-behind writer.
+    """
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS ExpenseTrackerAppliedWrites (
+            write_key CHAR(32) NOT NULL PRIMARY KEY,
+            applied_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            INDEX idx_applied_writes_at (applied_at)
+        )
+    ''')
+
+
+def _v12_zero_rollups(cursor) -> None:
+    """
+    Delete the rollup rows left at zero by deleted categories and periods, which the
+    rollup writes now remove as they go.
+    """
+    cursor.execute('DELETE FROM ExpenseTrackerRollups WHERE amount = 0')
+
+
+# Ordered list of (version, description, migration function)
+MIGRATIONS = [
+    (1, 'Create the details, auth and installments tables', _v1_baseline),
+    (2, 'Unique username and email indexes on ExpenseTrackerAuth', _v2_unique_users),
+    (3, 'Unique period index on ExpenseTrackerDetails', _v3_unique_periods),
+    (4, 'Per-user periods keyed by (username, period)', _v4_details_owner),
+    (5, 'Normalized ExpenseTrackerLineItems table', _v5_line_items),
+    (6, 'Monthly and yearly ExpenseTrackerRollups table', _v6_rollups),
+    (7, 'Sortable period_key column on ExpenseTrackerDetails', _v7_period_keys),
+    (8, 'Unique month index on ExpenseTrackerInstallments', _v8_unique_months),
+    (9, 'ExpenseTrackerAccounts and ExpenseTrackerPayments tables', _v9_accounts),
+    (10, 'Instalments keyed by (username, year, month) and ExpenseTrackerAccountYears', _v10_instalment_years),
+    (11, 'ExpenseTrackerAppliedWrites idempotency keys', _v11_applied_writes),
+    (12, 'Delete zero ExpenseTrackerRollups rows', _v12_zero_rollups),
+]
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+
+def applied_versions(cursor) -> set:
+    """
+    Fetch the schema versions already applied to the database.
+
+    Args:
+        cursor: An open database cursor.
+
+    Returns:
+        set: The applied version numbers.
+    """
+    cursor.execute(f'''
+        CREATE TABLE IF NOT EXISTS {SCHEMA_TABLE} (
+            version INT PRIMARY KEY,
+            description VARCHAR(255) NOT NULL,
+            applied_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    cursor.execute(f'SELECT version FROM {SCHEMA_TABLE}')
+    return {row[0] for row in cursor.fetchall()}
+
+def migrate(target: int = LATEST_VERSION) -> list:
+    """
+    Apply every pending migration up to the target version.
+
+    A MySQL named lock serialises concurrent runs, so several replicas starting at
+    once apply each migration exactly once.
+
+    Args:
+        target (int): The schema version to migrate to.
+
+    Returns:
+        list: The versions applied by this call.
+    """
+    applied = []
+    with pool.connection() as connection:
+        cursor = connection.cursor()
+        cursor.execute('SELECT GET_LOCK(%s, 60)', (MIGRATION_LOCK,))
+        if cursor.fetchone()[0] != 1:
+            raise RuntimeError('Timed out waiting for the schema migration lock')
+        try:
+            done = applied_versions(cursor)
+            for version, description, upgrade in MIGRATIONS:
+                if version in done or version > target:
+                    continue
+                logger.info('Applying schema migration %s: %s', version, description)
+                upgrade(cursor)
+                cursor.execute(f'INSERT INTO {SCHEMA_TABLE} (version, description) VALUES (%s, %s)',
+                               (version, description))
+                applied.append(version)
+        finally:
+            cursor.execute('SELECT RELEASE_LOCK(%s)', (MIGRATION_LOCK,))
+            cursor.fetchone()
+    return applied
+
+def current_version() -> int:
+    """
+    Get the highest schema version applied to the database.
+
+    Returns:
+        int: The current version, or 0 if no migration has been applied.
+    """
+    with pool.connection() as connection:
+        cursor = connection.cursor()
+        done = applied_versions(cursor)
+    return max(done, default=0)
+
+
+_schema_ready = False
+_schema_lock = threading.Lock()
+
+
+def ensure_schema() -> None:
+    """
+    Bring the schema up to date once per process.
+
+    Called at startup; later calls return immediately, so no query helper ever issues DDL.
+    The work is left to the selected storage backend: MySQL applies the migrations of
+    this module, or with AUTO_MIGRATE disabled only checks them and asks for
+    ``python -m logic.migrations`` to be run when the database is behind.
+
+    Raises:
+        RuntimeError: If the schema is outdated and AUTO_MIGRATE is disabled.
+    """
+    from logic.storage import get_storage
+
+    global _schema_ready
+    if _schema_ready:
+        return
+    with _schema_lock:
+        if _schema_ready:
+            return
+        get_storage().ensure_schema()
+        _schema_ready = True
+
+
+def main() -> None:
+    """
+    Command line entry point: ``python -m logic.migrations [--status] [--target N]``.
+    """
+    parser = argparse.ArgumentParser(description='Apply the expense tracker schema migrations.')
+    parser.add_argument('--status', action='store_true', help='only print the current schema version')
+    parser.add_argument('--target', type=int, default=LATEST_VERSION, help='schema version to migrate to')
+    args = parser.parse_args()
+    # Show each migration as it is applied
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+
+    if args.status:
+        print(f'Schema version {current_version()} (latest {LATEST_VERSION})')
+        return
+    applied = migrate(args.target)
+    if applied:
+        print(f'Applied migrations: {", ".join(map(str, applied))}')
+    else:
+        print('Schema is up to date')
+
+
+if __name__ == '__main__':
+    main()
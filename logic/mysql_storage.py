@@ -0,0 +1,476 @@
+# mysql_storage.py
+
+import json
+import itertools
+import pymysql
+from logic.util import *
+from logic import pool
+from logic.rollups import rollup_deltas, apply_rollup_deltas, YEAR_TOTAL
+from logic.storage import Storage, DuplicateError, ACCOUNT_FIELDS
+
+# Idempotency keys of journaled saves are kept this long after being applied
+APPLIED_KEY_RETENTION_DAYS = 7
+
+
+def database(transaction: bool = False):
+    """
+    Checks out a pooled database connection.
+
+    The tables themselves are created by the schema migrations in logic/migrations.py.
+
+    Args:
+        transaction (bool): Run the block inside an explicit transaction that is committed
+            on success and rolled back on error.
+
+    Usage:
+        with database() as connection:
+            ...
+
+    Raises:
+        pymysql.Error: If there is an error connecting to the database.
+    """
+    return pool.transaction() if transaction else pool.connection()
+
+def line_items(incomes: dict, expenses: dict) -> list:
+    """
+    Flatten the incomes and expenses of a period into (kind, category, amount) line items.
+
+    Args:
+        incomes (dict): The incomes of the period.
+        expenses (dict): The expenses of the period.
+
+    Returns:
+        list: One (kind, category, amount) tuple per category.
+    """
+    return ([('income', category, float(amount or 0)) for category, amount in incomes.items()] +
+            [('expense', category, float(amount or 0)) for category, amount in expenses.items()])
+
+def write_line_items(cursor, username: str, entries) -> None:
+    """
+    Replace the ExpenseTrackerLineItems rows of the given periods and update the rollups.
+
+    Must run inside the transaction that writes the periods themselves, so the
+    normalized rows and the rollups always match the JSON columns.
+
+    Args:
+        cursor: A cursor of the connection running the transaction.
+        username (str): The owner of the periods.
+        entries (list): (period, incomes, expenses) tuples, the last one wins for a repeated period.
+    """
+    # One set of line items per period, a repeated period would insert its categories twice
+    entries = list({entry[0]: entry for entry in entries}.values())
+    if not entries:
+        return
+    periods = [period for period, _, _ in entries]
+    placeholders = ', '.join(['%s'] * len(periods))
+    # Lock and read the items being replaced, the rollups are adjusted by the difference
+    cursor.execute('SELECT period, kind, category, amount FROM ExpenseTrackerLineItems '
+                   f'WHERE username = %s AND period IN ({placeholders}) FOR UPDATE', [username] + periods)
+    old_items = cursor.fetchall()
+    cursor.execute(f'DELETE FROM ExpenseTrackerLineItems WHERE username = %s AND period IN ({placeholders})',
+                   [username] + periods)
+    new_items = []
+    params = []
+    for period, incomes, expenses in entries:
+        for kind, category, amount in line_items(incomes, expenses):
+            new_items.append((period, kind, category, amount))
+            params.extend((username, period, kind, category, amount))
+    if params:
+        placeholders = ', '.join(['(%s, %s, %s, %s, %s)'] * (len(params) // 5))
+        cursor.execute('INSERT INTO ExpenseTrackerLineItems (username, period, kind, category, amount) '
+                       f'VALUES {placeholders}', params)
+    # Keep the monthly and yearly rollups in step within the same transaction
+    apply_rollup_deltas(cursor, rollup_deltas(username, old_items, new_items))
+
+def upsert_period(cursor, username, period, incomes, expenses, comment, append_comment=False) -> None:
+    """
+    Insert or update a period and its line items. Must run inside a transaction.
+
+    Args:
+        cursor: A cursor of the connection running the transaction.
+        username (str): The owner of the period.
+        period (str): The period to insert or update.
+        incomes (dict): A dictionary of incomes for the period.
+        expenses (dict): A dictionary of expenses for the period.
+        comment (str): A comment associated with the period.
+        append_comment (bool): Append the comment to the stored one instead of replacing it.
+    """
+    if append_comment:
+        # Skip empty parts so no stray separators are stored
+        comment_update = "CONCAT_WS('\\n\\n', NULLIF(comment, ''), NULLIF(VALUES(comment), ''))"
+    else:
+        comment_update = 'VALUES(comment)'
+
+    # Insert the period, or update it in place if it already exists
+    query = f'''
+        INSERT INTO ExpenseTrackerDetails (username, period, period_key, incomes, expenses, comment)
+        VALUES (%s, %s, %s, %s, %s, %s)
+        ON DUPLICATE KEY UPDATE incomes = VALUES(incomes), expenses = VALUES(expenses), comment = {comment_update}
+    '''
+    cursor.execute(query, (username, period, period_key(period), json.dumps(incomes), json.dumps(expenses), comment))
+
+    # Keep the normalized line items in step
+    write_line_items(cursor, username, [(period, incomes, expenses)])
+
+
+class MySQLStorage(Storage):
+    """
+    The MySQL backend, on the shared connection pool of logic/pool.py.
+
+    Every period write also maintains the normalized ExpenseTrackerLineItems rows and
+    the ExpenseTrackerRollups in the same transaction, so the totals are indexed
+    aggregates instead of scans of the JSON columns.
+    """
+
+    # Periods
+
+    def iter_periods(self, username, batch_size=STREAM_BATCH_SIZE):
+        with database() as connection:
+            # An unbuffered cursor streams rows instead of loading the whole result
+            with connection.cursor(pymysql.cursors.SSCursor) as cursor:
+                query = 'SELECT id, period, incomes, expenses, comment FROM ExpenseTrackerDetails WHERE username = %s'
+                cursor.execute(query, (username,))
+                while True:
+                    rows = cursor.fetchmany(batch_size)
+                    if not rows:
+                        break
+                    yield from rows
+
+    def list_periods(self, username):
+        with database() as connection:
+            cursor = connection.cursor()
+            # Served from the (username, period_key) index
+            query = 'SELECT period FROM ExpenseTrackerDetails WHERE username = %s ORDER BY period_key, id'
+            cursor.execute(query, (username,))
+            return [row[0] for row in cursor.fetchall()]
+
+    def get_period(self, username, period):
+        with database() as connection:
+            cursor = connection.cursor()
+            query = 'SELECT incomes, expenses, comment FROM ExpenseTrackerDetails WHERE username = %s AND period = %s'
+            cursor.execute(query, (username, period))
+            return cursor.fetchone()
+
+    def save_periods(self, username, entries, chunk_size=BULK_CHUNK_SIZE):
+        entries = iter(entries)
+        count = 0
+        # All chunks are committed together at the end of the transaction
+        with database(transaction=True) as connection:
+            cursor = connection.cursor()
+            while True:
+                chunk = list(itertools.islice(entries, chunk_size))
+                if not chunk:
+                    break
+                count += len(chunk)
+                # A period repeated within the chunk is saved once, the last occurrence wins as it
+                # does across chunks, so the line items and rollups never count it twice
+                chunk = list({item['period']: item for item in chunk}.values())
+                # One multi-row upsert per chunk instead of one INSERT per entry
+                placeholders = ', '.join(['(%s, %s, %s, %s, %s, %s)'] * len(chunk))
+                query = f'''
+                    INSERT INTO ExpenseTrackerDetails (username, period, period_key, incomes, expenses, comment)
+                    VALUES {placeholders}
+                    ON DUPLICATE KEY UPDATE incomes = VALUES(incomes), expenses = VALUES(expenses), comment = VALUES(comment)
+                '''
+                params = []
+                for item in chunk:
+                    params.extend((username, item['period'], period_key(item['period']), json.dumps(item['incomes']),
+                                   json.dumps(item['expenses']), item.get('comment') or ''))
+                cursor.execute(query, params)
+                # Keep the normalized line items of the chunk in step
+                write_line_items(cursor, username, [(item['period'], item['incomes'], item['expenses'])
+                                                    for item in chunk])
+        return count
+
+    def upsert_period(self, username, period, incomes, expenses, comment, append_comment=False):
+        # The period and its line items are committed together
+        with database(transaction=True) as connection:
+            upsert_period(connection.cursor(), username, period, incomes, expenses, comment, append_comment)
+
+    def apply_writes(self, entries):
+        """
+        The keys are recorded in ExpenseTrackerAppliedWrites by the same transaction, so a
+        batch replayed after a lost commit acknowledgement skips the saves it already made.
+        A concurrent flusher claiming the same keys fails on the primary key and retries.
+        """
+        keys = [entry['key'] for entry in entries]
+        placeholders = ', '.join(['%s'] * len(keys))
+        with database(transaction=True) as connection:
+            cursor = connection.cursor()
+            cursor.execute(f'SELECT write_key FROM ExpenseTrackerAppliedWrites WHERE write_key IN ({placeholders})', keys)
+            applied = {row[0] for row in cursor.fetchall()}
+            entries = [entry for entry in entries if entry['key'] not in applied]
+            if entries:
+                # Claim the keys before writing, in the same transaction as the writes
+                cursor.execute('INSERT INTO ExpenseTrackerAppliedWrites (write_key) VALUES '
+                               + ', '.join(['(%s)'] * len(entries)), [entry['key'] for entry in entries])
+                for entry in entries:
+                    upsert_period(cursor, entry['username'], entry['period'], entry['incomes'], entry['expenses'],
+                                  entry['comment'], entry['append_comment'])
+            cursor.execute('DELETE FROM ExpenseTrackerAppliedWrites WHERE applied_at < NOW() - INTERVAL %s DAY',
+                           (APPLIED_KEY_RETENTION_DAYS,))
+
+    def update_period(self, username, period, incomes, expenses):
+        # The period and its line items are committed together
+        with database(transaction=True) as connection:
+            cursor = connection.cursor()
+            query = 'UPDATE ExpenseTrackerDetails SET incomes = %s, expenses = %s WHERE username = %s AND period = %s'
+            cursor.execute(query, (json.dumps(incomes), json.dumps(expenses), username, period))
+            # Keep the normalized line items in step, but only for a period that exists
+            if not cursor.rowcount:
+                return False
+            write_line_items(cursor, username, [(period, incomes, expenses)])
+        return True
+
+    def update_comment(self, username, period, comment):
+        with database() as connection:
+            cursor = connection.cursor()
+            query = 'UPDATE ExpenseTrackerDetails SET comment = %s WHERE username = %s AND period = %s'
+            cursor.execute(query, (comment, username, period))
+
+    def clear_periods(self, username):
+        # The periods and their line items are deleted together
+        with database(transaction=True) as connection:
+            cursor = connection.cursor()
+            cursor.execute('DELETE FROM ExpenseTrackerRollups WHERE username = %s', (username,))
+            cursor.execute('DELETE FROM ExpenseTrackerLineItems WHERE username = %s', (username,))
+            cursor.execute('DELETE FROM ExpenseTrackerDetails WHERE username = %s', (username,))
+
+    def period_totals(self, username, period):
+        with database() as connection:
+            cursor = connection.cursor()
+            query = '''
+                SELECT kind, SUM(amount) FROM ExpenseTrackerLineItems
+                WHERE username = %s AND period = %s GROUP BY kind
+            '''
+            cursor.execute(query, (username, period))
+            rows = cursor.fetchall()
+        totals = {'income': 0.0, 'expense': 0.0}
+        totals.update({kind: float(total) for kind, total in rows})
+        return totals
+
+    def totals_by_period(self, username):
+        with database() as connection:
+            cursor = connection.cursor()
+            query = '''
+                SELECT period, kind, SUM(amount) FROM ExpenseTrackerLineItems
+                WHERE username = %s GROUP BY period, kind
+            '''
+            cursor.execute(query, (username,))
+            rows = cursor.fetchall()
+        totals = {}
+        for period, kind, total in rows:
+            totals.setdefault(period, {'income': 0.0, 'expense': 0.0})[kind] = float(total)
+        return totals
+
+    def category_totals(self, username, kind, periods=None, categories=None):
+        query = 'SELECT category, SUM(amount) FROM ExpenseTrackerLineItems WHERE username = %s AND kind = %s'
+        params = [username, kind]
+        # Optional filters become IN lists on the indexed columns
+        if periods is not None:
+            if not periods:
+                return {}
+            query += f" AND period IN ({', '.join(['%s'] * len(periods))})"
+            params.extend(periods)
+        if categories is not None:
+            if not categories:
+                return {}
+            query += f" AND category IN ({', '.join(['%s'] * len(categories))})"
+            params.extend(categories)
+        query += ' GROUP BY category'
+        with database() as connection:
+            cursor = connection.cursor()
+            cursor.execute(query, params)
+            rows = cursor.fetchall()
+        return {category: float(total) for category, total in rows}
+
+    def rollup_rows(self, username, year=None):
+        # Read the precomputed rollups instead of aggregating raw periods
+        if year is None:
+            query = 'SELECT year, month, kind, category, amount FROM ExpenseTrackerRollups WHERE username = %s AND month = %s'
+            params = (username, YEAR_TOTAL)
+        else:
+            query = 'SELECT year, month, kind, category, amount FROM ExpenseTrackerRollups WHERE username = %s AND year = %s AND month <> %s'
+            params = (username, year, YEAR_TOTAL)
+        with database() as connection:
+            cursor = connection.cursor()
+            # Zero rows left by writes made before they were deleted are skipped
+            cursor.execute(query + ' AND amount <> 0 ORDER BY year, month', params)
+            return list(cursor.fetchall())
+
+    def periods_between(self, username, start_key, end_key):
+        with database() as connection:
+            cursor = connection.cursor()
+            query = '''
+                SELECT period FROM ExpenseTrackerDetails
+                WHERE username = %s AND period_key BETWEEN %s AND %s ORDER BY period_key
+            '''
+            cursor.execute(query, (username, start_key, end_key))
+            return [row[0] for row in cursor.fetchall()]
+
+    # Users
+
+    def insert_user(self, email, username, password, date_joined):
+        with database() as connection:
+            cursor = connection.cursor()
+            query = "INSERT INTO ExpenseTrackerAuth (email, username, password, date_joined) VALUES (%s, %s, %s, %s)"
+            try:
+                cursor.execute(query, (email, username, password, date_joined))
+            except pymysql.IntegrityError as error:
+                raise DuplicateError(str(error)) from error
+
+    def fetch_users(self):
+        with database() as connection:
+            cursor = connection.cursor(pymysql.cursors.DictCursor)
+            cursor.execute("SELECT * FROM ExpenseTrackerAuth")
+            return list(cursor.fetchall())
+
+    def get_user(self, username):
+        with database() as connection:
+            cursor = connection.cursor(pymysql.cursors.DictCursor)
+            # Look up the one matching row through the index
+            query = "SELECT id, email, username, password FROM ExpenseTrackerAuth WHERE username = %s LIMIT 1"
+            cursor.execute(query, (username,))
+            return cursor.fetchone()
+
+    def find_taken(self, email, username):
+        with database() as connection:
+            cursor = connection.cursor()
+            # Both unique indexes are probed by the same statement
+            query = "SELECT email, username FROM ExpenseTrackerAuth WHERE email = %s OR username = %s LIMIT 2"
+            cursor.execute(query, (email, username))
+            return list(cursor.fetchall())
+
+    # Instalments
+
+    def load_accounts(self, username, year):
+        fields = ', '.join(f'accounts.{field}' for field in ACCOUNT_FIELDS)
+        with database() as connection:
+            with connection.cursor(pymysql.cursors.DictCursor) as cursor:
+                cursor.execute(f"""
+                SELECT accounts.id, {fields},
+                    COALESCE(years.opening_paid, accounts.opening_paid + COALESCE((
+                        SELECT SUM(payments.amount) FROM ExpenseTrackerPayments payments
+                        WHERE payments.account_id = accounts.id AND payments.year < %s
+                    ), 0)) AS carried
+                FROM ExpenseTrackerAccounts accounts
+                LEFT JOIN ExpenseTrackerAccountYears years ON years.account_id = accounts.id AND years.year = %s
+                WHERE accounts.username = %s ORDER BY accounts.position, accounts.id
+                """, (year, year, username))
+                return list(cursor.fetchall())
+
+    def load_years(self, username):
+        with database() as connection:
+            with connection.cursor() as cursor:
+                cursor.execute("""
+                SELECT DISTINCT year FROM ExpenseTrackerInstallments WHERE username = %s
+                UNION
+                SELECT DISTINCT payments.year FROM ExpenseTrackerPayments payments
+                JOIN ExpenseTrackerAccounts accounts ON accounts.id = payments.account_id
+                WHERE accounts.username = %s
+                """, (username, username))
+                return {row[0] for row in cursor.fetchall()}
+
+    def save_accounts(self, username, rows):
+        params = []
+        for position, row in enumerate(rows):
+            params.extend([row.get('id'), username] + [row[field] for field in ACCOUNT_FIELDS] + [position])
+        kept = [int(row['id']) for row in rows if row.get('id') is not None]
+
+        columns = ['id', 'username'] + ACCOUNT_FIELDS + ['position']
+        placeholders = ', '.join(['(' + ', '.join(['%s'] * len(columns)) + ')'] * len(rows))
+        updates = ', '.join(f'{column} = VALUES({column})' for column in columns[2:])
+        with database(transaction=True) as connection:
+            with connection.cursor() as cursor:
+                # Payments of removed accounts go with them through the foreign key
+                if kept:
+                    cursor.execute(f"""
+                    DELETE FROM ExpenseTrackerAccounts WHERE username = %s AND id NOT IN ({', '.join(['%s'] * len(kept))})
+                    """, [username] + kept)
+                else:
+                    cursor.execute("DELETE FROM ExpenseTrackerAccounts WHERE username = %s", (username,))
+                if params:
+                    cursor.execute(f"""
+                    INSERT INTO ExpenseTrackerAccounts ({', '.join(columns)}) VALUES {placeholders}
+                    ON DUPLICATE KEY UPDATE {updates}
+                    """, params)
+
+    def load_instalments(self, username, year):
+        # Both queries read a single (user, year) range of their table's key
+        with database() as connection:
+            with connection.cursor() as cursor:
+                cursor.execute("""
+                SELECT payments.account_id, payments.month, payments.amount
+                FROM ExpenseTrackerPayments payments
+                JOIN ExpenseTrackerAccounts accounts ON accounts.id = payments.account_id
+                WHERE accounts.username = %s AND payments.year = %s
+                """, (username, year))
+                payments = cursor.fetchall()
+                cursor.execute("SELECT Months, Salary FROM ExpenseTrackerInstallments WHERE username = %s AND year = %s",
+                               (username, year))
+                salaries = cursor.fetchall()
+        return payments, salaries
+
+    def save_instalments(self, username, year, account_ids, payments, months):
+        with database(transaction=True) as connection:
+            with connection.cursor() as cursor:
+                if payments:
+                    placeholders = ', '.join(['(%s, %s, %s, %s)'] * len(payments))
+                    cursor.execute(f"""
+                    INSERT INTO ExpenseTrackerPayments (account_id, year, month, amount) VALUES {placeholders}
+                    ON DUPLICATE KEY UPDATE amount = VALUES(amount)
+                    """, [value for account_id, month, amount in payments for value in (account_id, year, month, amount)])
+                    ids = ', '.join(['%s'] * len(account_ids))
+                    cursor.execute(f"DELETE FROM ExpenseTrackerAccountYears WHERE account_id IN ({ids}) AND year > %s",
+                                   list(account_ids) + [year])
+                if months:
+                    # Insert or update the salary of every changed month on the unique (username, year, month) key
+                    placeholders = ', '.join(['(%s, %s, %s, %s, %s, %s)'] * len(months))
+                    cursor.execute(f"""
+                    INSERT INTO ExpenseTrackerInstallments (username, year, month, Months, Salary, MyCut) VALUES {placeholders}
+                    ON DUPLICATE KEY UPDATE Salary = VALUES(Salary), MyCut = VALUES(MyCut)
+                    """, [value for month, salary, my_cut in months
+                          for value in (username, year, month, MONTHS[month - 1], salary, my_cut)])
+
+    def rollover(self, year, username=None):
+        where, params = ('WHERE accounts.username = %s', [username]) if username else ('', [])
+        with database(transaction=True) as connection:
+            cursor = connection.cursor()
+            cursor.execute(f'''
+                INSERT INTO ExpenseTrackerAccountYears (account_id, year, opening_paid)
+                SELECT accounts.id, %s,
+                    COALESCE(years.opening_paid, accounts.opening_paid + COALESCE(earlier.amount, 0))
+                    + COALESCE(paid.amount, 0)
+                FROM ExpenseTrackerAccounts accounts
+                LEFT JOIN ExpenseTrackerAccountYears years ON years.account_id = accounts.id AND years.year = %s
+                LEFT JOIN (
+                    SELECT account_id, SUM(amount) AS amount FROM ExpenseTrackerPayments
+                    WHERE year = %s GROUP BY account_id
+                ) paid ON paid.account_id = accounts.id
+                LEFT JOIN (
+                    SELECT account_id, SUM(amount) AS amount FROM ExpenseTrackerPayments
+                    WHERE year < %s GROUP BY account_id
+                ) earlier ON earlier.account_id = accounts.id
+                {where}
+                ON DUPLICATE KEY UPDATE opening_paid = VALUES(opening_paid)
+            ''', [year + 1, year, year, year] + params)
+            # rowcount counts updated rows twice, so count the accounts instead
+            cursor.execute(f'SELECT COUNT(*) FROM ExpenseTrackerAccounts accounts {where}', params)
+            return cursor.fetchone()[0]
+
+    # Schema
+
+    def ensure_schema(self):
+        """
+        Apply the pending migrations of logic/migrations.py, or with AUTO_MIGRATE
+        disabled only check that none are pending.
+
+        Raises:
+            RuntimeError: If the schema is outdated and AUTO_MIGRATE is disabled.
+        """
+        from logic import migrations
+
+        if AUTO_MIGRATE:
+            migrations.migrate()
+        elif migrations.current_version() < migrations.LATEST_VERSION:
+            raise RuntimeError('Database schema is outdated, run: python -m logic.migrations')
@@ -0,0 +1,305 @@
+# pool.py
+
+import atexit
+import logging
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+import pymysql
+from pymysql.constants import CLIENT
+from logic.util import *
+from logic.metrics import increment
+from logic import querylog
+
+logger = logging.getLogger(__name__)
+
+
+class PoolTimeoutError(pymysql.OperationalError):
+    """
+    Raised when no pooled connection becomes available within the checkout timeout.
+    """
+
+
+class TracedConnection(pymysql.connections.Connection):
+    """
+    A pymysql connection that reports every statement it runs to logic/querylog.py.
+
+    Every cursor, buffered, dictionary or server-side, sends its statements through
+    ``query``, so this is the one place each of them can be timed. Buffered results are
+    read inside ``query`` and their rows counted; server-side cursors stream their rows
+    afterwards, so only the time to the first row is recorded for them.
+    """
+
+    def query(self, sql, unbuffered=False):
+        started = time.perf_counter()
+        rows = 0
+        try:
+            rows = super().query(sql, unbuffered)
+            return rows
+        finally:
+            querylog.record(sql, time.perf_counter() - started, 0 if unbuffered else rows or 0)
+
+
+class ConnectionPool:
+    """
+    A thread-safe pool of pymysql connections shared by the whole logic package.
+
+    Every connection is handed to exactly one thread at a time, so Streamlit's
+    script threads never share a socket. Connections idle for longer than
+    ``idle_timeout`` are closed, and connections idle for longer than
+    ``ping_interval`` are pinged before being handed out again.
+
+    Args:
+        size (int): The maximum number of open connections.
+        timeout (float): Seconds to wait for a free connection before giving up.
+        idle_timeout (float): Seconds after which an unused connection is closed.
+        ping_interval (float): Seconds of idleness after which a connection is
+            health-checked on checkout.
+        **connect_kwargs: Extra arguments passed to ``pymysql.connect``.
+    """
+
+    def __init__(self, size: int = POOL_SIZE, timeout: float = POOL_TIMEOUT,
+                 idle_timeout: float = POOL_IDLE_TIMEOUT, ping_interval: float = POOL_PING_INTERVAL,
+                 **connect_kwargs):
+        self.size = max(1, size)
+        self.timeout = timeout
+        self.idle_timeout = idle_timeout
+        self.ping_interval = ping_interval
+        self.connect_kwargs = connect_kwargs
+        # Idle connections as (connection, last_used) pairs, most recently used last
+        self._idle = deque()
+        # Number of connections currently open, idle or checked out
+        self._opened = 0
+        self._condition = threading.Condition()
+        self._closed = False
+
+    def _connect(self) -> pymysql.Connection:
+        """
+        Opens a new physical connection to the database.
+
+        Raises:
+            pymysql.Error: If there is an error connecting to the database.
+        """
+        try:
+            connection = TracedConnection(
+                host=HOST,
+                user=USER,
+                password=PASSWORD,
+                port=int(PORT),
+                database=DATABASE,
+                autocommit=True,
+                # Report matched rather than changed rows, so rowcount tells whether a row exists
+                client_flag=CLIENT.FOUND_ROWS,
+                **self.connect_kwargs,
+            )
+            logger.debug('Connected to database: %s', connection)
+            increment('connections_opened_total', backend='mysql')
+        except pymysql.Error as e:
+            logger.error('Error connecting to database: %s', e)
+            raise
+        return connection
+
+    def _evict_idle(self) -> list:
+        """
+        Removes connections that have been idle for too long. Must be called with the lock held.
+
+        Returns:
+            list: The evicted connections, to be closed outside the lock.
+        """
+        evicted = []
+        cutoff = time.monotonic() - self.idle_timeout
+        # The oldest connections sit at the left end of the deque
+        while self._idle and self._idle[0][1] < cutoff:
+            evicted.append(self._idle.popleft()[0])
+            self._opened -= 1
+        return evicted
+
+    @staticmethod
+    def _close_quietly(connections) -> None:
+        """
+        Closes the given connections, ignoring errors from already broken sockets.
+        """
+        for connection in connections:
+            try:
+                connection.close()
+            except Exception:
+                pass
+
+    def acquire(self) -> pymysql.Connection:
+        """
+        Checks out a healthy connection, opening a new one if the pool is not full.
+
+        Returns:
+            pymysql.Connection: A connection owned by the calling thread until released.
+
+        Raises:
+            PoolTimeoutError: If no connection is freed within the checkout timeout.
+            pymysql.Error: If a new connection cannot be opened.
+        """
+        deadline = time.monotonic() + self.timeout
+        while True:
+            connection, last_used = None, None
+            with self._condition:
+                while True:
+                    if self._closed:
+                        raise PoolTimeoutError('Connection pool is closed')
+                    evicted = self._evict_idle()
+                    if self._idle:
+                        # Reuse the most recently used connection, it is the least likely to be stale
+                        connection, last_used = self._idle.pop()
+                        break
+                    if self._opened < self.size:
+                        # Reserve a slot and open the connection outside the lock
+                        self._opened += 1
+                        break
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise PoolTimeoutError(f'No database connection available after {self.timeout}s')
+                    self._condition.wait(remaining)
+            self._close_quietly(evicted)
+
+            if connection is None:
+                try:
+                    return self._connect()
+                except Exception:
+                    self._forget()
+                    raise
+
+            # Health check connections that have been idle for a while
+            if time.monotonic() - last_used < self.ping_interval:
+                return connection
+            try:
+                connection.ping(reconnect=False)
+                return connection
+            except pymysql.Error:
+                self._close_quietly([connection])
+                self._forget()
+
+    def _forget(self) -> None:
+        """
+        Frees the slot of a connection that was closed or never opened.
+        """
+        with self._condition:
+            self._opened -= 1
+            self._condition.notify()
+
+    def release(self, connection: pymysql.Connection, discard: bool = False) -> None:
+        """
+        Returns a connection to the pool.
+
+        Args:
+            connection (pymysql.Connection): The connection obtained from ``acquire``.
+            discard (bool): Close the connection instead of reusing it, e.g. after a network error.
+        """
+        if discard or not connection.open or self._closed:
+            self._close_quietly([connection])
+            self._forget()
+            return
+        with self._condition:
+            self._idle.append((connection, time.monotonic()))
+            evicted = self._evict_idle()
+            self._condition.notify()
+        self._close_quietly(evicted)
+
+    @contextmanager
+    def connection(self):
+        """
+        Context manager that checks out a connection and returns it to the pool afterwards.
+
+        Connections run in autocommit mode, so every statement is committed on its own.
+        Use ``transaction`` when several statements must succeed or fail together.
+
+        Yields:
+            pymysql.Connection: The checked out connection.
+        """
+        connection = self.acquire()
+        increment('connection_checkouts_total')
+        try:
+            yield connection
+        except (pymysql.OperationalError, pymysql.InterfaceError):
+            # The socket may be unusable, never hand it to another caller
+            self.release(connection, discard=True)
+            raise
+        except BaseException:
+            self.release(connection)
+            raise
+        else:
+            self.release(connection)
+
+    @contextmanager
+    def transaction(self):
+        """
+        Context manager that checks out a connection inside an explicit transaction.
+
+        The transaction is committed when the block exits normally and rolled back
+        if it raises.
+
+        Yields:
+            pymysql.Connection: The checked out connection.
+        """
+        with self.connection() as connection:
+            connection.begin()
+            try:
+                yield connection
+            except BaseException:
+                try:
+                    connection.rollback()
+                except pymysql.Error:
+                    pass
+                raise
+            connection.commit()
+
+    def close(self) -> None:
+        """
+        Closes every idle connection and refuses further checkouts.
+        """
+        with self._condition:
+            self._closed = True
+            idle = [connection for connection, _ in self._idle]
+            self._idle.clear()
+            self._opened -= len(idle)
+            self._condition.notify_all()
+        self._close_quietly(idle)
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool() -> ConnectionPool:
+    """
+    Returns the process-wide connection pool, creating it on first use.
+
+    Returns:
+        ConnectionPool: The shared pool.
+    """
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ConnectionPool()
+                atexit.register(_pool.close)
+    return _pool
+
+
+def connection():
+    """
+    Checks out a connection from the shared pool.
+
+    Usage:
+        with connection() as conn:
+            ...
+    """
+    return get_pool().connection()
+
+
+def transaction():
+    """
+    Checks out a connection from the shared pool inside an explicit transaction.
+
+    Usage:
+        with transaction() as conn:
+            ...
+    """
+    return get_pool().transaction()
@@ -0,0 +1,248 @@
+# querylog.py
+
+import argparse
+import functools
+import json
+import logging
+import os
+import re
+import sys
+import threading
+from collections import defaultdict
+from logic.util import *
+from logic.metrics import increment
+
+logger = logging.getLogger(__name__)
+
+# The repository root, call sites are reported relative to it
+ROOT = os.path.dirname(SCRIPT_DIR)
+
+# Frames of the query hooks themselves, skipped when looking for the call site: whole
+# files, and the cursor helpers of the SQLite backend
+HOOK_FILES = ('querylog.py', 'pool.py', 'metrics.py', 'contextlib.py')
+HOOK_FUNCTIONS = {'execute', 'executemany', '_query', '_dicts', '_transaction'}
+
+# Call site frames kept per slow statement, innermost first
+SITE_DEPTH = 4
+
+# Normalization of a statement into its fingerprint, applied in order
+_STRINGS = re.compile(r"'(?:[^'\\]|\\.|'')*'|\"(?:[^\"\\]|\\.|\"\")*\"")
+_COMMENTS = re.compile(r'/\*.*?\*/|--[^\n]*', re.S)
+_NUMBERS = re.compile(r'\b0x[0-9a-f]+\b|(?<![\w.])-?\d+(?:\.\d+)?(?:e[+-]?\d+)?\b', re.I)
+_PLACEHOLDERS = re.compile(r'%\(\w+\)s|%s|\?')
+_LISTS = re.compile(r'\(\s*\?(?:\s*,\s*\?)*\s*\)')
+_ROWS = re.compile(r'\(\?\+\)(?:\s*,\s*\(\?\+\))+')
+_SPACE = re.compile(r'\s+')
+
+
+@functools.lru_cache(maxsize=1024)
+def fingerprint(statement: str) -> str:
+    """
+    Normalize a statement so every execution of the same query shape shares one key.
+
+    Literals and placeholders become ``?``, lists of them ``(?+)``, the rows of a
+    multi-row INSERT one ``(?+)...``, comments are dropped and whitespace is collapsed,
+    e.g. ``SELECT * FROM t WHERE id IN (1, 2) AND name = 'x'`` becomes
+    ``select * from t where id in (?+) and name = ?``.
+
+    Args:
+        statement (str): The SQL text, with its values or with placeholders.
+
+    Returns:
+        str: The fingerprint, lowercased.
+    """
+    statement = _STRINGS.sub('?', statement)
+    statement = _COMMENTS.sub(' ', statement)
+    statement = _NUMBERS.sub('?', statement)
+    statement = _PLACEHOLDERS.sub('?', statement)
+    statement = _LISTS.sub('(?+)', statement)
+    statement = _ROWS.sub('(?+)...', statement)
+    return _SPACE.sub(' ', statement).strip().lower()
+
+def call_site(depth: int = SITE_DEPTH) -> str:
+    """
+    Describe where the running statement comes from: the innermost frames of the
+    repository outside the query hooks, e.g.
+    ``logic/mysql_storage.py:120 get_period < logic/database.py:250 get_period``.
+    """
+    frames = []
+    frame = sys._getframe(1)
+    while frame is not None and len(frames) < depth:
+        filename = frame.f_code.co_filename
+        if (filename.startswith(ROOT) and os.path.basename(filename) not in HOOK_FILES
+                and frame.f_code.co_name not in HOOK_FUNCTIONS):
+            frames.append(f'{os.path.relpath(filename, ROOT)}:{frame.f_lineno} {frame.f_code.co_name}')
+        frame = frame.f_back
+    return ' < '.join(frames) or '?'
+
+
+class QueryLog:
+    """
+    Aggregates every executed statement by fingerprint and logs the slow ones.
+
+    For each fingerprint the log keeps the number of executions, the total and the
+    longest duration, the rows returned or changed and the call site it was first seen
+    at. Statements taking at least ``threshold_ms`` are also appended to ``path`` as
+    JSON lines with their call site. Only fingerprints are ever kept or written, never
+    the statements themselves, which carry emails, password hashes and amounts. Memory
+    stays bounded: once ``max_fingerprints`` shapes are tracked, the one with the least
+    total time makes room for a new one.
+
+    Args:
+        threshold_ms (float): The duration from which a statement is slow, negative to log none.
+        path (str): The slow-query log, JSON lines. Empty to log slow statements as warnings instead.
+        max_fingerprints (int): The number of query shapes aggregated at most.
+    """
+
+    def __init__(self, threshold_ms: float = SLOW_QUERY_MS, path: str = SLOW_QUERY_LOG,
+                 max_fingerprints: int = QUERY_FINGERPRINTS):
+        self.threshold = threshold_ms / 1000
+        self.path = path
+        self.max_fingerprints = max(1, max_fingerprints)
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        # fingerprint -> aggregate dictionary
+        self._stats = {}
+
+    def record(self, statement, seconds: float, rows: int = 0, backend: str = 'mysql') -> None:
+        """
+        Account for one executed statement.
+
+        Args:
+            statement (str or bytes): The statement as sent to the database.
+            seconds (float): How long it took, results included when they were buffered.
+            rows (int): The rows it returned or changed.
+            backend (str): The backend that ran it.
+        """
+        if isinstance(statement, bytes):
+            statement = statement.decode('utf-8', 'replace')
+        key = fingerprint(statement)
+        slow = 0 <= self.threshold <= seconds
+        with self._lock:
+            stats = self._stats.get(key)
+        # The call site is only looked up for new shapes and slow statements
+        site = call_site() if stats is None or slow else None
+        with self._lock:
+            stats = self._stats.get(key)
+            if stats is None:
+                if len(self._stats) >= self.max_fingerprints:
+                    del self._stats[min(self._stats, key=lambda other: self._stats[other]['total_s'])]
+                stats = self._stats[key] = {'fingerprint': key, 'backend': backend, 'count': 0, 'total_s': 0.0,
+                                            'max_s': 0.0, 'rows': 0, 'slow': 0, 'site': site}
+            stats['count'] += 1
+            stats['total_s'] += seconds
+            stats['rows'] += rows
+            stats['max_s'] = max(stats['max_s'], seconds)
+            if slow:
+                stats['slow'] += 1
+                stats['site'] = site
+        increment('statements_total', backend=backend)
+        if slow:
+            self._log_slow(key, seconds, rows, backend, site)
+
+    def _log_slow(self, key: str, seconds: float, rows: int, backend: str, site: str) -> None:
+        """
+        Append one slow statement to the slow-query log, by its fingerprint only.
+        """
+        entry = {'time': datetime.now().isoformat(timespec='milliseconds'), 'ms': round(seconds * 1000, 3),
+                 'rows': rows, 'backend': backend, 'fingerprint': key, 'site': site}
+        if not self.path:
+            logger.warning('Slow query (%s ms, %s rows) at %s: %s', entry['ms'], rows, site, key)
+            return
+        try:
+            with self._write_lock, open(self.path, 'a') as fp:
+                fp.write(json.dumps(entry) + '\n')
+        except OSError as error:
+            logger.error('Error writing the slow-query log %s: %s', self.path, error)
+
+    def top(self, n: int = 10, by: str = 'total_s') -> list:
+        """
+        The heaviest query shapes of the process.
+
+        Args:
+            n (int): The number of shapes.
+            by (str): "total_s", "max_s", "count", "rows" or "slow".
+
+        Returns:
+            list: Aggregate dictionaries, heaviest first, with the mean duration added as "mean_s".
+        """
+        with self._lock:
+            stats = [dict(stats, mean_s=stats['total_s'] / stats['count']) for stats in self._stats.values()]
+        return sorted(stats, key=lambda stats: stats[by], reverse=True)[:n]
+
+    def reset(self) -> None:
+        """
+        Forget every aggregate, e.g. before measuring one page.
+        """
+        with self._lock:
+            self._stats.clear()
+
+
+query_log = QueryLog()
+
+
+def record(statement, seconds: float, rows: int = 0, backend: str = 'mysql') -> None:
+    """
+    Account for one statement in the process-wide QueryLog. Called by the execution hooks
+    of the MySQL pool and the SQLite backend.
+    """
+    query_log.record(statement, seconds, rows, backend)
+
+
+def summarize(path: str, by: str = 'total_s') -> list:
+    """
+    Aggregate a slow-query log by fingerprint.
+
+    Args:
+        path (str): The slow-query log.
+        by (str): "total_s", "max_s" or "count".
+
+    Returns:
+        list: One dictionary per fingerprint with count, total_s, max_s, rows and the
+        call sites seen, heaviest first.
+    """
+    stats = defaultdict(lambda: {'count': 0, 'total_s': 0.0, 'max_s': 0.0, 'rows': 0, 'sites': set()})
+    with open(path) as fp:
+        for line in fp:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                # A line cut short by a crash
+                continue
+            shape = stats[entry['fingerprint']]
+            seconds = entry['ms'] / 1000
+            shape['count'] += 1
+            shape['total_s'] += seconds
+            shape['max_s'] = max(shape['max_s'], seconds)
+            shape['rows'] += entry.get('rows') or 0
+            shape['sites'].add(entry.get('site') or '?')
+    rows = [dict(shape, fingerprint=key, sites=sorted(shape['sites'])) for key, shape in stats.items()]
+    return sorted(rows, key=lambda row: row[by], reverse=True)
+
+
+def main() -> None:
+    """
+    Command line entry point: ``python -m logic.querylog [--top N] [--by total_s|max_s|count] [--log FILE]``.
+    """
+    parser = argparse.ArgumentParser(description='Summarize the slow-query log by query fingerprint.')
+    parser.add_argument('--log', default=SLOW_QUERY_LOG or None, help='the slow-query log to read')
+    parser.add_argument('--top', type=int, default=10, help='number of query shapes listed')
+    parser.add_argument('--by', choices=['total_s', 'max_s', 'count'], default='total_s', help='ranking')
+    args = parser.parse_args()
+
+    if not args.log:
+        parser.error('no slow-query log configured, set SLOW_QUERY_LOG or pass --log')
+    if not os.path.exists(args.log):
+        print(f'No slow queries logged yet ({args.log})')
+        return
+    shapes = summarize(args.log, args.by)
+    print(f'{len(shapes)} slow query shapes in {args.log}')
+    for shape in shapes[:args.top]:
+        print(f'\n{shape["count"]:>6} x  total {shape["total_s"] * 1000:.0f} ms  max {shape["max_s"] * 1000:.0f} ms'
+              f'  rows {shape["rows"]}\n  {shape["fingerprint"]}')
+        for site in shape['sites']:
+            print(f'  at {site}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,41 @@
+# rollover.py
+
+import argparse
+from logic.util import *
+from logic.storage import get_storage
+
+
+def rollover(year: int, username: str = None) -> int:
+    """
+    Carry the balances of every account from one year into the next.
+
+    The amount repaid before the next year is the opening balance of ``year`` (or,
+    when it was never rolled over, the amount paid before tracking plus every earlier
+    payment) plus the payments of ``year``. The backend writes every account in one
+    transaction, and running it again after late edits simply overwrites them.
+
+    Args:
+        year (int): The year being closed.
+        username (str, optional): Only roll over this user's accounts, defaults to every user.
+
+    Returns:
+        int: The number of accounts rolled over.
+    """
+    return get_storage().rollover(year, username)
+
+
+def main() -> None:
+    """
+    Command line entry point: ``python -m logic.rollover [--year YEAR] [--user USERNAME]``.
+    """
+    parser = argparse.ArgumentParser(description='Carry the account balances of a year into the next one.')
+    parser.add_argument('--year', type=int, default=datetime.today().year - 1,
+                        help='the year being closed, defaults to last year')
+    parser.add_argument('--user', help='only roll over this user, defaults to every user')
+    args = parser.parse_args()
+    count = rollover(args.year, args.user)
+    print(f'Rolled {count} accounts over from {args.year} into {args.year + 1}')
+
+
+if __name__ == '__main__':
+    main()
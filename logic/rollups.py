@@ -0,0 +1,132 @@
+# rollups.py
+
+import argparse
+from collections import defaultdict
+from logic.util import *
+from logic import pool
+
+# month value of the rows that hold a whole year
+YEAR_TOTAL = 0
+# category value of the rows that hold the total of a kind
+ALL_CATEGORIES = ''
+
+
+def rollup_deltas(username: str, old_items, new_items) -> dict:
+    """
+    Compute how replacing line items changes the monthly and yearly rollups.
+
+    Every line item contributes to four rollup rows: its month and its year, each once
+    for its category and once for the total of its kind. Periods whose name is not a
+    month and a year are not rolled up.
+
+    Args:
+        username (str): The owner of the line items.
+        old_items (iterable): (period, kind, category, amount) tuples being removed.
+        new_items (iterable): (period, kind, category, amount) tuples being written.
+
+    Returns:
+        dict: Maps (username, year, month, kind, category) to the amount to add.
+    """
+    deltas = defaultdict(float)
+    for sign, items in ((-1, old_items), (1, new_items)):
+        for period, kind, category, amount in items:
+            key = parse_period(period)
+            if key is None:
+                continue
+            year, month = key
+            amount = sign * float(amount)
+            for rollup_month in (month, YEAR_TOTAL):
+                for rollup_category in (category, ALL_CATEGORIES):
+                    deltas[(username, year, rollup_month, kind, rollup_category)] += amount
+    # Rows that do not change need no write
+    return {key: amount for key, amount in deltas.items() if round(amount, 2)}
+
+def apply_rollup_deltas(cursor, deltas: dict) -> None:
+    """
+    Add the given amounts to the rollup rows in one multi-row upsert, then delete the
+    rows that dropped to zero, e.g. the categories of a deleted or emptied period, so
+    the rollups hold the same rows as a rebuild would.
+
+    Must run inside the transaction that changes the line items.
+
+    Args:
+        cursor: A cursor of the connection running the transaction.
+        deltas (dict): The output of rollup_deltas.
+    """
+    if not deltas:
+        return
+    params = []
+    for key, amount in deltas.items():
+        params.extend(key + (amount,))
+    placeholders = ', '.join(['(%s, %s, %s, %s, %s, %s)'] * len(deltas))
+    cursor.execute(f'''
+        INSERT INTO ExpenseTrackerRollups (username, year, month, kind, category, amount) VALUES {placeholders}
+        ON DUPLICATE KEY UPDATE amount = amount + VALUES(amount)
+    ''', params)
+    # Only rows that were lowered can have reached zero
+    lowered = [key for key, amount in deltas.items() if amount < 0]
+    if lowered:
+        placeholders = ', '.join(['(%s, %s, %s, %s, %s)'] * len(lowered))
+        cursor.execute(f'''
+            DELETE FROM ExpenseTrackerRollups
+            WHERE (username, year, month, kind, category) IN ({placeholders}) AND amount = 0
+        ''', [value for key in lowered for value in key])
+
+def rebuild(cursor, username: str = None) -> int:
+    """
+    Recompute the rollups from the line items using an open cursor.
+
+    Args:
+        cursor: A cursor of the connection running the transaction.
+        username (str, optional): Only rebuild this user's rollups, defaults to every user.
+
+    Returns:
+        int: The number of rollup rows written.
+    """
+    where, params = ('WHERE username = %s', [username]) if username else ('', [])
+    cursor.execute(f'DELETE FROM ExpenseTrackerRollups {where}', params)
+    # Pre-aggregate per period in SQL, then spread each total over its rollup rows
+    cursor.execute(f'''
+        SELECT username, period, kind, category, SUM(amount) FROM ExpenseTrackerLineItems {where}
+        GROUP BY username, period, kind, category
+    ''', params)
+    items = defaultdict(list)
+    for owner, period, kind, category, amount in cursor.fetchall():
+        items[owner].append((period, kind, category, amount))
+    count = 0
+    for owner, owner_items in items.items():
+        deltas = rollup_deltas(owner, [], owner_items)
+        keys = list(deltas)
+        # Keep statements to a bounded size
+        for start in range(0, len(keys), BULK_CHUNK_SIZE):
+            apply_rollup_deltas(cursor, {key: deltas[key] for key in keys[start:start + BULK_CHUNK_SIZE]})
+        count += len(deltas)
+    return count
+
+def rebuild_rollups(username: str = None) -> int:
+    """
+    Recompute the rollups from the line items in one transaction, repairing any drift.
+
+    Args:
+        username (str, optional): Only rebuild this user's rollups, defaults to every user.
+
+    Returns:
+        int: The number of rollup rows written.
+    """
+    with pool.transaction() as connection:
+        return rebuild(connection.cursor(), username)
+
+
+def main() -> None:
+    """
+    Command line entry point: ``python -m logic.rollups [--user USERNAME]``.
+    """
+    parser = argparse.ArgumentParser(description='Rebuild the monthly and yearly rollups from the line items.')
+    parser.add_argument('--user', help='only rebuild this user, defaults to every user')
+    args = parser.parse_args()
+    count = rebuild_rollups(args.user)
+    print(f'Rebuilt {count} rollup rows')
+
+
+if __name__ == '__main__':
+    main()
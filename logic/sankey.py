@@ -0,0 +1,97 @@
+# sankey.py
+
+import hashlib
+import json
+import streamlit as st
+from logic.util import *
+from logic.cache import LRUCache, MISSING
+
+# Built figures keyed by a hash of the incomes and expenses they show. The key is the
+# content itself, so entries never go stale and only need a size bound.
+_figures = LRUCache(FIGURE_CACHE_SIZE, ttl=0)
+
+
+def sankey_key(incomes: dict, expenses: dict) -> str:
+    """
+    Hash the incomes and expenses of a period, in their display order.
+
+    Args:
+        incomes (dict): The incomes of the period.
+        expenses (dict): The expenses of the period.
+
+    Returns:
+        str: A hex digest that changes whenever a label, an amount or the order changes.
+    """
+    content = json.dumps([list(incomes.items()), list(expenses.items())], default=str)
+    return hashlib.blake2b(content.encode(), digest_size=16).hexdigest()
+
+def sankey_spec(incomes: dict, expenses: dict) -> dict:
+    """
+    Build the Sankey figure of a period as a plain Plotly figure dictionary.
+
+    Incomes flow into a "Total Income" node, which flows into every expense. Node
+    indexes follow from the position of each label, so building the links is linear
+    and an expense sharing its name with an income still gets its own node.
+
+    Args:
+        incomes (dict): The incomes of the period.
+        expenses (dict): The expenses of the period.
+
+    Returns:
+        dict: The figure with its data and layout.
+    """
+    total = len(incomes)
+    label = list(incomes) + ["Total Income"] + list(expenses)
+    source = list(range(total)) + [total] * len(expenses)
+    target = [total] * total + list(range(total + 1, total + 1 + len(expenses)))
+    value = list(incomes.values()) + list(expenses.values())
+    return {
+        'data': [{
+            'type': 'sankey',
+            'link': {'source': source, 'target': target, 'value': value},
+            'node': {'label': label, 'pad': 20, 'thickness': 30, 'color': "#6a2336"},
+        }],
+        'layout': {'margin': {'l': 0, 'r': 0, 't': 5, 'b': 5}},
+    }
+
+def build(spec: dict):
+    """
+    Build and validate a Plotly figure from a figure dictionary.
+    """
+    import plotly.graph_objects as go
+
+    return go.Figure(spec)
+
+def sankey_figure(incomes: dict, expenses: dict):
+    """
+    Return the Sankey figure of a period, building it only on a cache miss.
+
+    The figure is shared by every session showing the same content, so callers must
+    not change it.
+
+    Args:
+        incomes (dict): The incomes of the period.
+        expenses (dict): The expenses of the period.
+
+    Returns:
+        go.Figure: The validated figure.
+    """
+    key = ('sankey', sankey_key(incomes, expenses))
+    figure = _figures.get(key)
+    if figure is MISSING:
+        figure = build(sankey_spec(incomes, expenses))
+        _figures.set(key, figure)
+    return figure
+
+def plotly_chart(figure, use_container_width: bool = True) -> None:
+    """
+    Display a figure returned by ``sankey_figure``.
+
+    st.plotly_chart validates dictionaries by building a figure from them, but takes
+    a ready figure as it is, so a cached figure is only serialized.
+
+    Args:
+        figure (go.Figure): The figure.
+        use_container_width (bool): Stretch the chart to the width of its container.
+    """
+    st.plotly_chart(figure, use_container_width=use_container_width)
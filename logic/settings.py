@@ -1,61 +1,156 @@
 # settings.py
 
+import datetime
+import functools
+import re
 import streamlit as st
 
-def settings():
+# Months in which the snow effect is shown
+SNOW_MONTHS = (11, 12, 1, 2)
+
+# Use custom CSS to hide the Streamlit's default menu, footer, and header for cleaner UI.
+HIDE_ST_STYLE = """
+#MainMenu {visibility: hidden;}
+footer {visibility: hidden;}
+header {visibility: hidden;}
+"""
+
+CUSTOM_CSS = """
+/* Set the background color to a dark blue. */
+body {
+    background-color: #002b36;
+}
+
+/* Set the color and font weight of the headings. */
+h1, h2, h3, h4, h5, h6 {
+    color: #999;
+    font-weight: 500;
+    transition: color 0.3s;
+}
+
+/* Set the background color of the main content area to a gradient. */
+.stApp {
+    background: linear-gradient(200deg, #002b36 20%, #1e1e1e 90%);
+    border-radius: 10px;
+    box-shadow: 3px 3px 20px rgba(0, 0, 0, 0.3);
+    padding: 50px;
+}
+
+/* Set the style of the buttons. */
+.stButton>button {
+    background-color: #6a2336;
+    color: #FFF;
+    border: none;
+    border-radius: 12px;
+}
+
+/* Change the button color on hover. */
+.stButton>button:hover {
+    background-color: #5E0000;
+}
+"""
+
+def minify(css: str) -> str:
     """
-    Set up the Streamlit page with custom CSS styles and hide unwanted components.
+    Strip the comments and the whitespace a browser does not need from a stylesheet.
+
+    Args:
+        css (str): The stylesheet.
+
+    Returns:
+        str: The same rules on a single line.
     """
-    # Set basic configurations for the Streamlit page.
-    page_title = "Expense Tracker"
-    st.set_page_config(page_title=page_title,)
-    st.title(f"{page_title} ")
+    css = re.sub(r'/\*.*?\*/', '', css, flags=re.S)
+    css = re.sub(r'\s+', ' ', css)
+    return re.sub(r'\s*([{};:,>])\s*', r'\1', css).replace(';}', '}').strip()
 
-    # Use custom CSS to hide the Streamlit's default menu, footer, and header for cleaner UI.
-    hide_st_style = """
-    <style>
-    #MainMenu {visibility: hidden;}
-    footer {visibility: hidden;}
-    header {visibility: hidden;}
-    </style>
-    """
-    st.markdown(hide_st_style, unsafe_allow_html=True)
-
-    # Insert your CSS style
-    custom_css = """
-    <style>
-        /* Set the background color to a dark blue. */
-        body {
-            background-color: #002b36;
-        }
+@functools.lru_cache(maxsize=None)
+def page_style() -> str:
+    """
+    The page stylesheet as one minified style block, built once per process.
+    """
+    return f"<style>{minify(HIDE_ST_STYLE + CUSTOM_CSS)}</style>"
 
-        /* Set the color and font weight of the headings. */
-        h1, h2, h3, h4, h5, h6 {
-            color: #999;
-            font-weight: 500;
-            transition: color 0.3s;
-        }
+def every(period: int, css) -> str:
+    """
+    One rule per residue of the snowflake position modulo ``period``.
 
-        /* Set the background color of the main content area to a gradient. */
-        .stApp {
-            background: linear-gradient(200deg, #002b36 20%, #1e1e1e 90%);
-            border-radius: 10px;
-            box-shadow: 3px 3px 20px rgba(0, 0, 0, 0.3);
-            padding: 50px;
-        }
+    Args:
+        period (int): How often the declarations repeat.
+        css (callable): Maps a position to the declarations of every flake sharing its residue.
 
-        /* Set the style of the buttons. */
-        .stButton>button {
-            background-color: #6a2336;
-            color: #FFF;
-            border: none;
-            border-radius: 12px;
+    Returns:
+        str: The ``.snowflake:nth-child(<period>n+<residue>)`` rules.
+    """
+    return ''.join(f'.snowflake:nth-child({period}n+{i}){{{css(i)}}}' for i in range(1, period + 1))
+
+@functools.lru_cache(maxsize=None)
+def snow_html(flakes: int = 150, animations: int = 50) -> str:
+    """
+    The snowfall stylesheet and markup, built once per process.
+
+    Each flake's opacity, size, fall animation, position and duration repeat every 6,
+    4, 50 and 7 flakes, so they are set by a handful of nth-child(An+B) rules instead
+    of one full rule per flake. Only the start offset is set per flake.
+
+    Args:
+        flakes (int): The number of snowflakes.
+        animations (int): The number of distinct fall animations.
+
+    Returns:
+        str: The style block followed by the snowfall container.
+    """
+    keyframes = ''.join(
+        f'@keyframes fall-{i}{{from{{transform:translate({(i % 5) * 20 - 50}vw,-10px) rotate(0deg)}}'
+        f'to{{transform:translate({((i % 7) - 3) * 15}vw,110vh) rotate({i * 360}deg)}}}}'
+        for i in range(animations))
+    rules = (
+        every(6, lambda i: f'opacity:{0.4 + (i % 6) * 0.1:.1f}')
+        + every(4, lambda i: f'width:{1 + i % 4}px;height:{1 + i % 4}px')
+        + every(animations, lambda i: f'left:{(i * 2) % 100}vw;animation-name:fall-{i % animations}')
+        + every(7, lambda i: f'animation-duration:{5 + i % 7}s')
+        + ''.join(f'.snowflake:nth-child({i}){{animation-delay:-{i * 0.2:.1f}s}}' for i in range(1, flakes + 1))
+    )
+    base = minify("""
+        .snowflake {
+            position: fixed;
+            background: white;
+            border-radius: 50%;
+            pointer-events: none;
+            animation-timing-function: linear;
+            animation-iteration-count: infinite;
         }
 
-        /* Change the button color on hover. */
-        .stButton>button:hover {
-            background-color: #5E0000;
+        .snowfall {
+            position: fixed;
+            top: 0;
+            left: 0;
+            width: 100vw;
+            height: 100vh;
+            z-index: 9999;
+            pointer-events: none;
         }
-    </style>
+    """)
+    flake = '<div class="snowflake"></div>'
+    return f'<style>{keyframes}{base}{rules}</style><div class="snowfall">{flake * flakes}</div>'
+
+def snow():
+    """
+    Let it snow in the winter months.
+
+    The markup is shared by every session, so sessions keep no copy of it.
     """
-    st.markdown(custom_css, unsafe_allow_html=True)
+    if datetime.datetime.now().month in SNOW_MONTHS:
+        st.markdown(snow_html(), unsafe_allow_html=True)
+
+def settings():
+    """
+    Set up the Streamlit page with custom CSS styles and hide unwanted components.
+    """
+    # Set basic configurations for the Streamlit page.
+    page_title = "Expense Tracker"
+    st.set_page_config(page_title=page_title,)
+    st.title(f"{page_title} ")
+
+    # Insert the prebuilt styles in a single block
+    st.markdown(page_style(), unsafe_allow_html=True)
@@ -0,0 +1,361 @@
+# sqlite_storage.py
+
+import json
+import itertools
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from logic.util import *
+from logic.storage import Storage, DuplicateError, ACCOUNT_FIELDS
+from logic.metrics import increment
+from logic import querylog
+
+# Idempotency keys of journaled saves are kept this long after being applied
+APPLIED_KEY_RETENTION_SECONDS = 7 * 24 * 3600
+
+# The tables of logic/migrations.py at their latest version, without the line items and
+# rollups: totals are computed from the periods themselves
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS ExpenseTrackerDetails (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    username TEXT NOT NULL,
+    period TEXT NOT NULL,
+    period_key INTEGER,
+    incomes TEXT NOT NULL,
+    expenses TEXT NOT NULL,
+    comment TEXT,
+    UNIQUE (username, period)
+);
+CREATE INDEX IF NOT EXISTS idx_details_user_period_key ON ExpenseTrackerDetails (username, period_key);
+-- Keyset pagination of iter_periods, without it every batch sorts the whole history of the user
+CREATE INDEX IF NOT EXISTS idx_details_user_id ON ExpenseTrackerDetails (username, id);
+CREATE TABLE IF NOT EXISTS ExpenseTrackerAuth (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    email TEXT NOT NULL UNIQUE COLLATE NOCASE,
+    username TEXT NOT NULL UNIQUE COLLATE NOCASE,
+    password TEXT NOT NULL,
+    date_joined TEXT
+);
+CREATE TABLE IF NOT EXISTS ExpenseTrackerAccounts (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    username TEXT NOT NULL,
+    name TEXT NOT NULL,
+    principal REAL,
+    rate REAL NOT NULL DEFAULT 0,
+    term_months INTEGER,
+    payment REAL,
+    opening_paid REAL NOT NULL DEFAULT 0,
+    position INTEGER NOT NULL DEFAULT 0,
+    UNIQUE (username, name)
+);
+CREATE TABLE IF NOT EXISTS ExpenseTrackerPayments (
+    account_id INTEGER NOT NULL REFERENCES ExpenseTrackerAccounts (id) ON DELETE CASCADE,
+    year INTEGER NOT NULL,
+    month INTEGER NOT NULL,
+    amount REAL NOT NULL DEFAULT 0,
+    PRIMARY KEY (account_id, year, month)
+);
+CREATE TABLE IF NOT EXISTS ExpenseTrackerAccountYears (
+    account_id INTEGER NOT NULL REFERENCES ExpenseTrackerAccounts (id) ON DELETE CASCADE,
+    year INTEGER NOT NULL,
+    opening_paid REAL NOT NULL DEFAULT 0,
+    PRIMARY KEY (account_id, year)
+);
+CREATE TABLE IF NOT EXISTS ExpenseTrackerInstallments (
+    username TEXT NOT NULL,
+    year INTEGER NOT NULL,
+    month INTEGER NOT NULL,
+    Months TEXT NOT NULL,
+    Salary REAL NOT NULL DEFAULT 0,
+    MyCut REAL NOT NULL DEFAULT 0,
+    PRIMARY KEY (username, year, month)
+);
+CREATE TABLE IF NOT EXISTS ExpenseTrackerAppliedWrites (
+    write_key TEXT PRIMARY KEY,
+    applied_at REAL NOT NULL
+);
+'''
+
+# Same result as the CONCAT_WS of the MySQL backend: both parts joined by a blank line, empty parts skipped
+APPEND_COMMENT = ("COALESCE(NULLIF(comment, '') || char(10) || char(10) || NULLIF(excluded.comment, ''), "
+                  "NULLIF(comment, ''), excluded.comment)")
+
+
+class TracedCursor(sqlite3.Cursor):
+    """
+    A cursor that reports the statements of a transaction to logic/querylog.py, with
+    the rows they changed.
+    """
+
+    def execute(self, sql, parameters=()):
+        started = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            querylog.record(sql, time.perf_counter() - started, max(self.rowcount, 0), 'sqlite')
+
+    def executemany(self, sql, seq_of_parameters):
+        started = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            querylog.record(sql, time.perf_counter() - started, max(self.rowcount, 0), 'sqlite')
+
+
+class SQLiteStorage(Storage):
+    """
+    A single-file backend for single-node deployments.
+
+    One connection in WAL mode is shared by every thread and guarded by a lock, so
+    writes are serialized while readers in other processes are not blocked. The
+    schema is created on first use.
+
+    Args:
+        path (str): The database file, ":memory:" for a throwaway database.
+    """
+
+    def __init__(self, path: str = STORAGE_PATH):
+        self.path = path
+        if path != ':memory:':
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._connection = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        increment('connections_opened_total', backend='sqlite')
+        self._lock = threading.RLock()
+        with self._lock:
+            self._connection.execute('PRAGMA journal_mode=WAL')
+            self._connection.execute('PRAGMA foreign_keys=ON')
+            self._connection.executescript(SCHEMA)
+
+    @contextmanager
+    def _transaction(self):
+        """
+        Hold the lock and run the block in a transaction, yielding a cursor.
+        """
+        with self._lock:
+            cursor = self._connection.cursor(TracedCursor)
+            cursor.execute('BEGIN IMMEDIATE')
+            try:
+                yield cursor
+            except BaseException:
+                cursor.execute('ROLLBACK')
+                raise
+            cursor.execute('COMMIT')
+
+    def _query(self, query: str, params=()) -> list:
+        """
+        Run a read query under the lock and fetch every row.
+        """
+        with self._lock:
+            started = time.perf_counter()
+            rows = self._connection.execute(query, params).fetchall()
+        querylog.record(query, time.perf_counter() - started, len(rows), 'sqlite')
+        return rows
+
+    def _dicts(self, query: str, params=()) -> list:
+        """
+        Run a read query under the lock and fetch every row as a dictionary.
+        """
+        with self._lock:
+            started = time.perf_counter()
+            cursor = self._connection.execute(query, params)
+            rows = cursor.fetchall()
+        querylog.record(query, time.perf_counter() - started, len(rows), 'sqlite')
+        columns = [column[0] for column in cursor.description]
+        return [dict(zip(columns, row)) for row in rows]
+
+    @staticmethod
+    def _upsert_period(cursor, username, period, incomes, expenses, comment, append_comment=False) -> None:
+        comment_update = APPEND_COMMENT if append_comment else 'excluded.comment'
+        cursor.execute(f'''
+            INSERT INTO ExpenseTrackerDetails (username, period, period_key, incomes, expenses, comment)
+            VALUES (?, ?, ?, ?, ?, ?)
+            ON CONFLICT (username, period) DO UPDATE SET
+                incomes = excluded.incomes, expenses = excluded.expenses, comment = {comment_update}
+        ''', (username, period, period_key(period), json.dumps(incomes), json.dumps(expenses), comment or ''))
+
+    # Periods
+
+    def iter_periods(self, username, batch_size=STREAM_BATCH_SIZE):
+        # Page by id, so the lock is released between batches while the caller consumes them
+        last_id = 0
+        while True:
+            rows = self._query('SELECT id, period, incomes, expenses, comment FROM ExpenseTrackerDetails '
+                               'WHERE username = ? AND id > ? ORDER BY id LIMIT ?', (username, last_id, batch_size))
+            if not rows:
+                return
+            yield from rows
+            last_id = rows[-1][0]
+
+    def list_periods(self, username):
+        rows = self._query('SELECT period FROM ExpenseTrackerDetails WHERE username = ? ORDER BY period_key, id',
+                           (username,))
+        return [row[0] for row in rows]
+
+    def get_period(self, username, period):
+        rows = self._query('SELECT incomes, expenses, comment FROM ExpenseTrackerDetails '
+                           'WHERE username = ? AND period = ?', (username, period))
+        return rows[0] if rows else None
+
+    def save_periods(self, username, entries, chunk_size=BULK_CHUNK_SIZE):
+        entries = iter(entries)
+        count = 0
+        with self._transaction() as cursor:
+            while True:
+                chunk = list(itertools.islice(entries, chunk_size))
+                if not chunk:
+                    return count
+                for item in chunk:
+                    self._upsert_period(cursor, username, item['period'], item['incomes'], item['expenses'],
+                                        item.get('comment') or '')
+                count += len(chunk)
+
+    def upsert_period(self, username, period, incomes, expenses, comment, append_comment=False):
+        with self._transaction() as cursor:
+            self._upsert_period(cursor, username, period, incomes, expenses, comment, append_comment)
+
+    def apply_writes(self, entries):
+        with self._transaction() as cursor:
+            for entry in entries:
+                # A key that is already recorded was applied by an earlier attempt
+                cursor.execute('INSERT OR IGNORE INTO ExpenseTrackerAppliedWrites (write_key, applied_at) VALUES (?, ?)',
+                               (entry['key'], time.time()))
+                if cursor.rowcount:
+                    self._upsert_period(cursor, entry['username'], entry['period'], entry['incomes'],
+                                        entry['expenses'], entry['comment'], entry['append_comment'])
+            cursor.execute('DELETE FROM ExpenseTrackerAppliedWrites WHERE applied_at < ?',
+                           (time.time() - APPLIED_KEY_RETENTION_SECONDS,))
+
+    def update_period(self, username, period, incomes, expenses):
+        with self._transaction() as cursor:
+            cursor.execute('UPDATE ExpenseTrackerDetails SET incomes = ?, expenses = ? WHERE username = ? AND period = ?',
+                           (json.dumps(incomes), json.dumps(expenses), username, period))
+            return bool(cursor.rowcount)
+
+    def update_comment(self, username, period, comment):
+        with self._transaction() as cursor:
+            cursor.execute('UPDATE ExpenseTrackerDetails SET comment = ? WHERE username = ? AND period = ?',
+                           (comment, username, period))
+
+    def clear_periods(self, username):
+        with self._transaction() as cursor:
+            cursor.execute('DELETE FROM ExpenseTrackerDetails WHERE username = ?', (username,))
+
+    def periods_between(self, username, start_key, end_key):
+        rows = self._query('SELECT period FROM ExpenseTrackerDetails '
+                           'WHERE username = ? AND period_key BETWEEN ? AND ? ORDER BY period_key',
+                           (username, start_key, end_key))
+        return [row[0] for row in rows]
+
+    # Users
+
+    def insert_user(self, email, username, password, date_joined):
+        try:
+            with self._transaction() as cursor:
+                cursor.execute('INSERT INTO ExpenseTrackerAuth (email, username, password, date_joined) '
+                               'VALUES (?, ?, ?, ?)', (email, username, password, date_joined))
+        except sqlite3.IntegrityError as error:
+            raise DuplicateError(str(error)) from error
+
+    def fetch_users(self):
+        return self._dicts('SELECT * FROM ExpenseTrackerAuth')
+
+    def get_user(self, username):
+        users = self._dicts('SELECT id, email, username, password FROM ExpenseTrackerAuth WHERE username = ? LIMIT 1',
+                            (username,))
+        return users[0] if users else None
+
+    def find_taken(self, email, username):
+        return self._query('SELECT email, username FROM ExpenseTrackerAuth WHERE email = ? OR username = ? LIMIT 2',
+                           (email, username))
+
+    # Instalments
+
+    def load_accounts(self, username, year):
+        fields = ', '.join(f'accounts.{field}' for field in ACCOUNT_FIELDS)
+        return self._dicts(f'''
+            SELECT accounts.id, {fields},
+                COALESCE(years.opening_paid, accounts.opening_paid + COALESCE((
+                    SELECT SUM(payments.amount) FROM ExpenseTrackerPayments payments
+                    WHERE payments.account_id = accounts.id AND payments.year < ?
+                ), 0)) AS carried
+            FROM ExpenseTrackerAccounts accounts
+            LEFT JOIN ExpenseTrackerAccountYears years ON years.account_id = accounts.id AND years.year = ?
+            WHERE accounts.username = ? ORDER BY accounts.position, accounts.id
+        ''', (year, year, username))
+
+    def load_years(self, username):
+        rows = self._query('''
+            SELECT year FROM ExpenseTrackerInstallments WHERE username = ?
+            UNION
+            SELECT payments.year FROM ExpenseTrackerPayments payments
+            JOIN ExpenseTrackerAccounts accounts ON accounts.id = payments.account_id
+            WHERE accounts.username = ?
+        ''', (username, username))
+        return {row[0] for row in rows}
+
+    def save_accounts(self, username, rows):
+        columns = ['id', 'username'] + ACCOUNT_FIELDS + ['position']
+        updates = ', '.join(f'{column} = excluded.{column}' for column in columns[2:])
+        kept = [int(row['id']) for row in rows if row.get('id') is not None]
+        with self._transaction() as cursor:
+            # Payments of removed accounts go with them through the foreign key
+            cursor.execute(f"DELETE FROM ExpenseTrackerAccounts WHERE username = ? "
+                           f"AND id NOT IN ({', '.join(['?'] * len(kept))})", [username] + kept)
+            cursor.executemany(f'''
+                INSERT INTO ExpenseTrackerAccounts ({', '.join(columns)}) VALUES ({', '.join(['?'] * len(columns))})
+                ON CONFLICT (id) DO UPDATE SET {updates}
+            ''', [[row.get('id'), username] + [row[field] for field in ACCOUNT_FIELDS] + [position]
+                  for position, row in enumerate(rows)])
+
+    def load_instalments(self, username, year):
+        payments = self._query('''
+            SELECT payments.account_id, payments.month, payments.amount
+            FROM ExpenseTrackerPayments payments
+            JOIN ExpenseTrackerAccounts accounts ON accounts.id = payments.account_id
+            WHERE accounts.username = ? AND payments.year = ?
+        ''', (username, year))
+        salaries = self._query('SELECT Months, Salary FROM ExpenseTrackerInstallments WHERE username = ? AND year = ?',
+                               (username, year))
+        return payments, salaries
+
+    def save_instalments(self, username, year, account_ids, payments, months):
+        with self._transaction() as cursor:
+            if payments:
+                cursor.executemany('''
+                    INSERT INTO ExpenseTrackerPayments (account_id, year, month, amount) VALUES (?, ?, ?, ?)
+                    ON CONFLICT (account_id, year, month) DO UPDATE SET amount = excluded.amount
+                ''', [(account_id, year, month, amount) for account_id, month, amount in payments])
+                cursor.execute(f"DELETE FROM ExpenseTrackerAccountYears "
+                               f"WHERE account_id IN ({', '.join(['?'] * len(account_ids))}) AND year > ?",
+                               list(account_ids) + [year])
+            cursor.executemany('''
+                INSERT INTO ExpenseTrackerInstallments (username, year, month, Months, Salary, MyCut)
+                VALUES (?, ?, ?, ?, ?, ?)
+                ON CONFLICT (username, year, month) DO UPDATE SET Salary = excluded.Salary, MyCut = excluded.MyCut
+            ''', [(username, year, month, MONTHS[month - 1], salary, my_cut) for month, salary, my_cut in months])
+
+    def rollover(self, year, username=None):
+        # The WHERE clause is required before ON CONFLICT in an INSERT ... SELECT
+        where, params = ('WHERE accounts.username = ?', [username]) if username else ('WHERE 1', [])
+        with self._transaction() as cursor:
+            cursor.execute(f'''
+                INSERT INTO ExpenseTrackerAccountYears (account_id, year, opening_paid)
+                SELECT accounts.id, ?,
+                    COALESCE(years.opening_paid, accounts.opening_paid + COALESCE(earlier.amount, 0))
+                    + COALESCE(paid.amount, 0)
+                FROM ExpenseTrackerAccounts accounts
+                LEFT JOIN ExpenseTrackerAccountYears years ON years.account_id = accounts.id AND years.year = ?
+                LEFT JOIN (
+                    SELECT account_id, SUM(amount) AS amount FROM ExpenseTrackerPayments
+                    WHERE year = ? GROUP BY account_id
+                ) paid ON paid.account_id = accounts.id
+                LEFT JOIN (
+                    SELECT account_id, SUM(amount) AS amount FROM ExpenseTrackerPayments
+                    WHERE year < ? GROUP BY account_id
+                ) earlier ON earlier.account_id = accounts.id
+                {where}
+                ON CONFLICT (account_id, year) DO UPDATE SET opening_paid = excluded.opening_paid
+            ''', [year + 1, year, year, year] + params)
+            return cursor.rowcount
@@ -0,0 +1,345 @@
+# storage.py
+
+import importlib
+import json
+import threading
+from abc import ABC, abstractmethod
+from collections import defaultdict
+from logic.util import *
+from logic.rollups import rollup_deltas, YEAR_TOTAL
+from logic.metrics import InstrumentedStorage
+
+# Account settings shown and edited on the tracker page
+ACCOUNT_FIELDS = ['name', 'principal', 'rate', 'term_months', 'payment', 'opening_paid']
+
+# Backend name: (module, class)
+BACKENDS = {
+    'mysql': ('logic.mysql_storage', 'MySQLStorage'),
+    'sqlite': ('logic.sqlite_storage', 'SQLiteStorage'),
+    'memory': ('logic.memory_storage', 'MemoryStorage'),
+}
+
+
+class DuplicateError(ValueError):
+    """
+    Raised when a write would break a unique key, e.g. registering a taken username.
+    """
+
+
+class Storage(ABC):
+    """
+    The persistence interface behind the query helpers of database.py, authenticator.py,
+    tracker.py and rollover.py.
+
+    Helpers resolve the user, cache and journal, then call a backend method with an
+    explicit username. Backends never see the Streamlit session. Incomes and expenses
+    are passed in as dictionaries and come back as the JSON text they are stored as,
+    so LazyPeriod can defer decoding on every backend.
+
+    The totals, rollups and range queries have portable implementations here that
+    scan ``iter_periods``. Backends with an indexed or aggregated equivalent override them.
+    """
+
+    # Periods
+
+    @abstractmethod
+    def iter_periods(self, username: str, batch_size: int = STREAM_BATCH_SIZE):
+        """
+        Stream the periods of a user.
+
+        Args:
+            username (str): The owner of the periods.
+            batch_size (int): The number of rows fetched at a time.
+
+        Yields:
+            tuple: (id, period, incomes JSON, expenses JSON, comment) rows.
+        """
+
+    def list_periods(self, username: str) -> list:
+        """
+        List the period names of a user, in date order: unparseable names first, then by
+        period_key, ties in insertion order.
+        """
+        rows = [(row[0], row[1]) for row in self.iter_periods(username)]
+        rows.sort(key=lambda row: (period_key(row[1]) is not None, period_key(row[1]) or 0, row[0]))
+        return [period for _, period in rows]
+
+    @abstractmethod
+    def get_period(self, username: str, period: str):
+        """
+        Fetch one period.
+
+        Returns:
+            tuple or None: (incomes JSON, expenses JSON, comment), or None if it does not exist.
+        """
+
+    @abstractmethod
+    def save_periods(self, username: str, entries, chunk_size: int = BULK_CHUNK_SIZE) -> int:
+        """
+        Upsert many periods in one transaction.
+
+        Args:
+            username (str): The owner of the periods.
+            entries (iterable): Dictionaries with period, incomes, expenses and comment keys.
+            chunk_size (int): The number of rows written per statement.
+
+        Returns:
+            int: The number of entries written.
+        """
+
+    @abstractmethod
+    def upsert_period(self, username: str, period: str, incomes: dict, expenses: dict, comment: str,
+                      append_comment: bool = False) -> None:
+        """
+        Insert or update one period. With ``append_comment`` the comment is appended to
+        the stored one, separated by a blank line and skipping empty parts.
+        """
+
+    @abstractmethod
+    def apply_writes(self, entries) -> None:
+        """
+        Apply journaled saves in one transaction, each idempotency key at most once.
+
+        Args:
+            entries (list): Entries from Journal.batch, oldest first.
+        """
+
+    @abstractmethod
+    def update_period(self, username: str, period: str, incomes: dict, expenses: dict) -> bool:
+        """
+        Replace the incomes and expenses of an existing period.
+
+        Returns:
+            bool: Whether the period exists.
+        """
+
+    @abstractmethod
+    def update_comment(self, username: str, period: str, comment: str) -> None:
+        """
+        Replace the comment of a period.
+        """
+
+    @abstractmethod
+    def clear_periods(self, username: str) -> None:
+        """
+        Delete every period of a user.
+        """
+
+    def _line_items(self, username: str, periods=None):
+        """
+        Yield the (period, kind, category, amount) line items of a user's periods.
+        """
+        periods = None if periods is None else set(periods)
+        for _, period, incomes, expenses, _ in self.iter_periods(username):
+            if periods is not None and period not in periods:
+                continue
+            for kind, values in (('income', incomes), ('expense', expenses)):
+                for category, amount in json.loads(values).items():
+                    yield period, kind, category, float(amount or 0)
+
+    def period_totals(self, username: str, period: str) -> dict:
+        """
+        Total the incomes and expenses of one period.
+
+        Returns:
+            dict: {"income": float, "expense": float}
+        """
+        totals = {'income': 0.0, 'expense': 0.0}
+        for _, kind, _, amount in self._line_items(username, [period]):
+            totals[kind] += amount
+        return totals
+
+    def totals_by_period(self, username: str) -> dict:
+        """
+        Total the incomes and expenses of every period.
+
+        Returns:
+            dict: Maps each period to {"income": float, "expense": float}.
+        """
+        totals = {}
+        for period, kind, _, amount in self._line_items(username):
+            totals.setdefault(period, {'income': 0.0, 'expense': 0.0})[kind] += amount
+        return totals
+
+    def category_totals(self, username: str, kind: str, periods=None, categories=None) -> dict:
+        """
+        Sum each category of a kind across periods.
+
+        Args:
+            username (str): The owner of the periods.
+            kind (str): Either "income" or "expense".
+            periods (list, optional): Only include these periods.
+            categories (list, optional): Only include these categories.
+
+        Returns:
+            dict: Maps each category to its total.
+        """
+        categories = None if categories is None else set(categories)
+        totals = defaultdict(float)
+        for _, item_kind, category, amount in self._line_items(username, periods):
+            if item_kind == kind and (categories is None or category in categories):
+                totals[category] += amount
+        return dict(totals)
+
+    def rollup_rows(self, username: str, year: int = None) -> list:
+        """
+        Read the monthly or yearly rollups of a user.
+
+        Args:
+            username (str): The owner of the periods.
+            year (int, optional): Return the months of this year, by default one row per year.
+
+        Returns:
+            list: (year, month, kind, category, amount) rows ordered by year and month.
+        """
+        deltas = rollup_deltas(username, [], self._line_items(username))
+        rows = [(row_year, month, kind, category, amount)
+                for (_, row_year, month, kind, category), amount in deltas.items()
+                if (month == YEAR_TOTAL if year is None else row_year == year and month != YEAR_TOTAL)]
+        return sorted(rows, key=lambda row: (row[0], row[1]))
+
+    def periods_between(self, username: str, start_key: int, end_key: int) -> list:
+        """
+        List the periods whose period_key lies between two keys, inclusive, in date order.
+        """
+        return [period for period in self.list_periods(username)
+                if period_key(period) is not None and start_key <= period_key(period) <= end_key]
+
+    # Users
+
+    @abstractmethod
+    def insert_user(self, email: str, username: str, password: str, date_joined: str) -> None:
+        """
+        Add a user.
+
+        Raises:
+            DuplicateError: If the email or the username is taken, compared case-insensitively.
+        """
+
+    @abstractmethod
+    def fetch_users(self) -> list:
+        """
+        List every user as a dictionary with id, email, username, password and date_joined.
+        """
+
+    @abstractmethod
+    def get_user(self, username: str):
+        """
+        Look up one user by username.
+
+        Returns:
+            dict or None: The id, email, username and password, or None.
+        """
+
+    @abstractmethod
+    def find_taken(self, email: str, username: str) -> list:
+        """
+        Find the users holding an email or a username.
+
+        Returns:
+            list: (email, username) pairs, at most two.
+        """
+
+    # Instalments
+
+    @abstractmethod
+    def load_accounts(self, username: str, year: int) -> list:
+        """
+        List the accounts of a user in display order, with their id, ACCOUNT_FIELDS and
+        "carried": the opening balance of the year, or the amount paid before tracking
+        plus every payment of the earlier years.
+        """
+
+    @abstractmethod
+    def load_years(self, username: str) -> set:
+        """
+        Collect the years with salaries or payments of a user.
+        """
+
+    @abstractmethod
+    def save_accounts(self, username: str, rows: list) -> None:
+        """
+        Replace the accounts of a user in one transaction.
+
+        Args:
+            username (str): The owner of the accounts.
+            rows (list): Dictionaries with an id (None for new accounts) and ACCOUNT_FIELDS,
+                in display order. Accounts missing from the list are deleted with their payments.
+        """
+
+    @abstractmethod
+    def load_instalments(self, username: str, year: int) -> tuple:
+        """
+        Read one year of payments and salaries of a user.
+
+        Returns:
+            tuple: (account_id, month, amount) payments and (month name, salary) rows.
+        """
+
+    @abstractmethod
+    def save_instalments(self, username: str, year: int, account_ids: list, payments: list, months: list) -> None:
+        """
+        Upsert payments and monthly salaries in one transaction, dropping the opening
+        balances of later years.
+
+        Args:
+            username (str): The owner of the accounts.
+            year (int): The year written.
+            account_ids (list): The ids of every account of the grid.
+            payments (list): (account_id, month, amount) rows, months numbered from 1.
+            months (list): (month, salary, my_cut) rows, months numbered from 1.
+        """
+
+    @abstractmethod
+    def rollover(self, year: int, username: str = None) -> int:
+        """
+        Write the opening balances of ``year + 1`` for every account, or one user's.
+
+        Returns:
+            int: The number of accounts rolled over.
+        """
+
+    # Schema
+
+    def ensure_schema(self) -> None:
+        """
+        Create or upgrade the tables this backend needs.
+        """
+
+
+_storage = None
+_storage_lock = threading.Lock()
+
+
+def get_storage() -> Storage:
+    """
+    Returns the process-wide storage backend selected by STORAGE_BACKEND, creating it on first use.
+
+    Every call made through it is timed and counted by logic/metrics.py.
+
+    Returns:
+        Storage: The shared backend.
+
+    Raises:
+        ValueError: If STORAGE_BACKEND names an unknown backend.
+    """
+    global _storage
+    if _storage is None:
+        with _storage_lock:
+            if _storage is None:
+                if STORAGE_BACKEND not in BACKENDS:
+                    raise ValueError(f'Unknown STORAGE_BACKEND {STORAGE_BACKEND!r}, use one of {", ".join(BACKENDS)}')
+                # Only the selected backend and its driver are imported
+                module, name = BACKENDS[STORAGE_BACKEND]
+                _storage = InstrumentedStorage(getattr(importlib.import_module(module), name)())
+    return _storage
+
+def set_storage(storage: Storage) -> None:
+    """
+    Replace the process-wide backend, e.g. with a MemoryStorage in a benchmark.
+
+    The backend is used as given, its calls are not recorded by logic/metrics.py.
+    """
+    global _storage
+    with _storage_lock:
+        _storage = storage
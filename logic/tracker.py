@@ -1,8 +1,13 @@
 import streamlit as st
 import pandas as pd
-import base64
-import pymysql
+import numpy as np
 from logic.util import *
+from logic.storage import get_storage, ACCOUNT_FIELDS
+from logic.database import current_user
+from logic.instalments import InstalmentGrid
+from logic.loans import LoanBook
+from logic.rollover import rollover
+from logic.export import export_widget
 import datetime
 
 def table() -> pd.DataFrame:
@@ -15,276 +20,354 @@ def table() -> pd.DataFrame:
     pd.DataFrame
         An empty table with the specified columns and months as index.
     """
-    months = ['January', 'February', 'March', 'April', 'May', 'June', 'July',
-              'August', 'September', 'October', 'November', 'December']
-    return pd.DataFrame({'Months': months, 'ING': 0, 'CEC': 0, 'Orange': 0, 'Salary': 0, 'MyCut': 0})
+    return InstalmentGrid().to_frame()
 
-def database_connection() -> pymysql.Connection:
+def load_accounts(username: str = None, year: int = None) -> list:
     """
-    Connects to the database and returns a database connection object.
+    Loads the instalment accounts of a user, in display order.
 
-    Raises:
-        pymysql.Error: If there is an error connecting to the database.
+    Each account also carries the amount repaid before the given year: the opening
+    balance written by the rollover when there is one, otherwise the amount paid
+    before tracking plus every payment of the earlier years.
+
+    Parameters
+    ----------
+    username : str, optional
+        The owner of the accounts, defaults to the logged in user.
+    year : int, optional
+        The year shown, defaults to the current year.
+
+    Returns
+    -------
+    list
+        One dictionary per account with its id, ACCOUNT_FIELDS and "carried".
     """
-    connection = None
-    try:
-        connection = pymysql.connect(
-            # Database connection parameters
-            host=HOST,
-            user=USER,
-            password=PASSWORD,
-            port=int(PORT),
-            database=DATABASE,
-        )
-        print(f'Connected to database: {connection} ')
-    except pymysql.Error as e:
-        # Print error message if there is an error connecting to the database
-        print(f'Error connecting to database: {e}')
-        # Raise the exception so it can be handled by the caller
-        raise
-
-    return connection
-
-def load_data() -> dict:
+    year = year or datetime.date.today().year
+    return get_storage().load_accounts(current_user(username), year)
+
+def load_years(username: str = None) -> list:
     """
-    Loads the data from the database and returns it in a dictionary.
+    Lists the years with instalments, plus the current and the next year.
 
-    The keys of the dictionary are in the format "ING_January_checkbox", and the
-    values are the corresponding values from the database.
+    Parameters
+    ----------
+    username : str, optional
+        The owner of the instalments, defaults to the logged in user.
 
     Returns
     -------
-    dict
-        A dictionary with the data from the database.
+    list
+        The years in ascending order.
     """
-    connection = database_connection()
-    try:
-        with connection.cursor() as cursor:
-            # Select all data from the ExpenseTrackerInstallments table
-            sql = "SELECT * FROM ExpenseTrackerInstallments"
-            cursor.execute(sql)
-            # Fetch all the results
-            results = cursor.fetchall()
-
-            # Initialize an empty dictionary to store the data
-            data = {}
-            # Iterate over the months
-            for row in results:
-                # Get the month from the row
-                month = row[1]
-                # Add the data for each month to the dictionary
-                data[f"ING_{month}_checkbox"] = bool(row[2])
-                data[f"ING_{month}_input"] = float(row[2])
-                data[f"CEC_{month}_checkbox"] = bool(row[3])
-                data[f"CEC_{month}_input"] = float(row[3])
-                data[f"Orange_{month}_checkbox"] = bool(row[4])
-                data[f"Orange_{month}_input"] = float(row[4])
-                data[f"Salary_{month}_input"] = float(row[5])
-            # Return the dictionary
-            return data
-    finally:
-        # Close the connection
-        connection.close()
-
-def save_data(data):
+    years = get_storage().load_years(current_user(username))
+    current = datetime.date.today().year
+    return sorted(years | {current, current + 1})
+
+def save_accounts(frame: pd.DataFrame, username: str = None) -> int:
     """
-    Saves the data to the database.
+    Replaces the accounts of a user with the rows of an edited accounts table.
 
-    The data is a dictionary with the keys in the format "ING_January_checkbox", and the
-    values are the corresponding values from the database.
+    Rows keep their id, so renaming an account keeps its payments. Rows without an
+    id are new accounts, and accounts missing from the table are deleted together
+    with their payments. Everything runs in one transaction.
 
     Parameters
     ----------
-    data : dict
-        The dictionary with the data to be saved.
+    frame : pd.DataFrame
+        The accounts table, with an id column and ACCOUNT_FIELDS.
+    username : str, optional
+        The owner of the accounts, defaults to the logged in user.
 
     Returns
     -------
-    None
+    int
+        The number of accounts kept.
     """
-    connection = database_connection()
-    try:
-        with connection.cursor() as cursor:
-            # Iterate over the months
-            for month in ['January', 'February', 'March', 'April', 'May', 'June', 'July',
-                          'August', 'September', 'October', 'November', 'December']:
-                # Get the data for the current month
-                ing = data.get(f"ING_{month}_input", 0)
-                cec = data.get(f"CEC_{month}_input", 0)
-                orange = data.get(f"Orange_{month}_input", 0)
-                salary = data.get(f"Salary_{month}_input", 0)
-                my_cut = salary - (ing + cec + orange)
-
-                # Update the data in the database
-                sql = """
-                UPDATE ExpenseTrackerInstallments
-                SET ING = %s, CEC = %s, Orange = %s, Salary = %s, MyCut = %s
-                WHERE Months = %s
-                """
-                cursor.execute(sql, (ing, cec, orange, salary, my_cut, month))
-
-                # Check if the row for the current month exists
-                cursor.execute("SELECT * FROM ExpenseTrackerInstallments WHERE Months = %s", month)
-                results = cursor.fetchone()
-                if results is None:
-                    # Insert the data if the row does not exist
-                    sql = """
-                    INSERT INTO ExpenseTrackerInstallments (Months, ING, CEC, Orange, Salary, MyCut)
-                    VALUES (%s, %s, %s, %s, %s, %s)
-                    """
-                    cursor.execute(sql, (month, ing, cec, orange, salary, my_cut))
-        connection.commit()
-    finally:
-        connection.close()
-
-def get_table_download_link(df):
+    # Empty cells come back from the editor as NaN, store them as NULL
+    frame = frame[frame['name'].fillna('').astype(str).str.strip() != '']
+    rows = frame.astype(object).where(frame.notna(), None)
+    rows = [row._asdict() for row in rows.itertuples(index=False)]
+    get_storage().save_accounts(current_user(username), rows)
+    return len(rows)
+
+def load_data(accounts: list = None, year: int = None, username: str = None) -> InstalmentGrid:
     """
-    Generate a link allowing the user to download the given dataframe as a CSV file.
+    Loads one year of instalments of every account and the salaries into an InstalmentGrid.
+
+    Both queries read a single (user, year) range of their table's key.
 
     Parameters
     ----------
-    df : pandas.DataFrame
-        The dataframe to export.
+    accounts : list, optional
+        The accounts returned by load_accounts, loaded when omitted.
+    year : int, optional
+        The year to load, defaults to the current year.
+    username : str, optional
+        The owner of the accounts, defaults to the logged in user.
 
     Returns
     -------
-    str
-        A link with the download attribute set to "data.csv", which will allow the user
-        to download the dataframe as a CSV file.
+    InstalmentGrid
+        The amounts of every account and the salary, one row per month.
+    """
+    username = current_user(username)
+    year = year or datetime.date.today().year
+    if accounts is None:
+        accounts = load_accounts(username, year)
+    # Select the payments of every account of the user in that year, and the salary of every month
+    payments, salaries = get_storage().load_instalments(username, year)
+    return InstalmentGrid.from_payments(accounts, payments, salaries, year)
+
+def save_data(grid: InstalmentGrid, previous: InstalmentGrid = None, username: str = None):
     """
-    # Convert the dataframe to a CSV string
-    csv = df.to_csv(index=False)
+    Saves the grid to the database.
 
-    # Encode the string as base64
-    b64 = base64.b64encode(csv.encode()).decode()
+    Only the months that differ from ``previous`` are written: one multi-row upsert
+    for their payments and one for their salary and MyCut, in a single transaction,
+    so a rerun without changes costs no database round trip at all. Opening balances
+    rolled over into later years are dropped, later years then recompute them from
+    the payments until the next rollover.
 
-    # Generate the link
-    href = f'<a href="data:file/csv;base64,{b64}" download="data.csv">Download CSV</a>'
+    Parameters
+    ----------
+    grid : InstalmentGrid
+        The grid to be saved, loaded by load_data.
+    previous : InstalmentGrid, optional
+        The grid returned by load_data before the widgets changed it.
+    username : str, optional
+        The owner of the accounts, defaults to the logged in user.
 
-    # Return the link
-    return href
+    Returns
+    -------
+    list
+        The months that were written.
+    """
+    changed = grid.changed(previous)
+    if not len(changed):
+        return []
+
+    # Build every changed payment and month row in one pass over the arrays
+    payments = []
+    for month, amounts in zip(changed.tolist(), grid.amounts[changed].tolist()):
+        for account_id, amount in zip(grid.ids, amounts):
+            payments.append((account_id, month + 1, amount))
+    months = []
+    for month, salary, my_cut in zip(changed.tolist(), grid.salary[changed].tolist(), grid.my_cut()[changed].tolist()):
+        months.append((month + 1, salary, my_cut))
+
+    get_storage().save_instalments(current_user(username), grid.year, grid.ids, payments, months)
+    return [MONTHS[month] for month in changed]
+
+def render_cells(grid: InstalmentGrid, loaded: InstalmentGrid):
+    """
+    Displays the instalments as one checkbox and one number input per cell,
+    writing every widget value straight into the grid.
+
+    Parameters
+    ----------
+    grid : InstalmentGrid
+        The grid receiving the widget values.
+    loaded : InstalmentGrid
+        The grid returned by load_data, used for the initial widget values.
+    """
+    # Display the months and column names
+    header = ['Months'] + grid.columns + ['MyCut']
+    header_columns = st.columns(len(header))
+    st.write("---")
+    header_columns[0].write(f'##### {grid.year}')
+    for col_index, col_name in enumerate(header[1:], start=1):
+        header_columns[col_index].write(col_name)
+
+    # Display a checkbox and a number input for each cell, writing straight into the grid
+    my_cut_cells = []
+    for i, month in enumerate(MONTHS):
+        cols = st.columns(len(header))
+        cols[0].write(f"{month}")
+        st.divider()
+
+        for j, col in enumerate(grid.columns):
+            with cols[j + 1]:
+                # Keys include the year, so switching years never carries widget values over
+                checkbox_key = f"{col}_{month}_{grid.year}_checkbox"
+                input_key = f"{col}_{month}_{grid.year}_input"
+                grid.mask[i, j] = st.checkbox("", key=checkbox_key, value=bool(loaded.mask[i, j]))
+                grid.values[i, j] = st.number_input("RON", key=input_key, value=float(loaded.values[i, j]), step=0.1)
+
+        # The "MyCut" cell is filled in once every row is known
+        my_cut_cells.append(cols[-1])
+
+    # Calculate every "MyCut" value in one pass and display it
+    for cell, month, my_cut in zip(my_cut_cells, MONTHS, grid.my_cut().tolist()):
+        with cell:
+            st.write("**RON**")
+            st.number_input("", value=my_cut, step=0.1, key=f"MyCut_{month}_{grid.year}")
+
+def render_grid(grid: InstalmentGrid, loaded: InstalmentGrid, username: str = None):
+    """
+    Displays the instalments as a single editable table.
+
+    The editor returns the whole edited table at once, which is applied to the grid
+    in one step. Changed months are saved right away and the page is rerun, so the
+    MyCut column shown by the editor is never stale.
+
+    Parameters
+    ----------
+    grid : InstalmentGrid
+        The grid receiving the edits.
+    loaded : InstalmentGrid
+        The grid returned by load_data, displayed by the editor.
+    username : str, optional
+        The owner of the accounts, defaults to the logged in user.
+    """
+    st.markdown(f'##### {grid.year}')
+    column_config = {col: st.column_config.NumberColumn(col, min_value=0.0, step=0.1, format="%.2f RON")
+                     for col in grid.columns + ['MyCut']}
+    edited = st.data_editor(loaded.to_frame(), key=f"instalments_editor_{grid.year}", hide_index=True,
+                            use_container_width=True, disabled=['Months', 'MyCut'], column_config=column_config)
+    if len(grid.apply(edited)):
+        save_data(grid, previous=loaded, username=username)
+        st.rerun()
+
+def render_accounts(accounts: list):
+    """
+    Displays the accounts of the tracker in an editable table, saved on request.
+
+    Parameters
+    ----------
+    accounts : list
+        The accounts returned by load_accounts.
+    """
+    with st.expander("Accounts"):
+        frame = pd.DataFrame(accounts, columns=['id'] + ACCOUNT_FIELDS)
+        frame[ACCOUNT_FIELDS[1:]] = frame[ACCOUNT_FIELDS[1:]].astype(float)
+        money = dict(min_value=0.0, step=0.1, format="%.2f RON")
+        column_config = {
+            'id': None,
+            'name': st.column_config.TextColumn("Account", required=True, max_chars=64),
+            'principal': st.column_config.NumberColumn("Loan Total", **money),
+            'rate': st.column_config.NumberColumn("Rate %", min_value=0.0, step=0.01, format="%.2f"),
+            'term_months': st.column_config.NumberColumn("Term (Months)", min_value=0, step=1),
+            'payment': st.column_config.NumberColumn("Instalment", **money),
+            'opening_paid': st.column_config.NumberColumn("Paid Before", **money),
+        }
+        edited = st.data_editor(frame, key="accounts_editor", num_rows="dynamic", hide_index=True,
+                                use_container_width=True, column_config=column_config)
+        st.caption("Accounts without a loan total are tracked without a projection. "
+                   "Removing an account deletes its instalments.")
+        if st.button("Save Accounts"):
+            save_accounts(edited)
+            st.rerun()
+
+def render_loans(grid: InstalmentGrid, accounts: list):
+    """
+    Displays the balances of every loan and projects when each one is repaid.
+
+    Parameters
+    ----------
+    grid : InstalmentGrid
+        The instalments of this year.
+    accounts : list
+        The accounts returned by load_accounts, in the grid's column order.
+    """
+    # Project every loan at once from the amounts paid so far
+    book = LoanBook.from_accounts(accounts, grid.totals(), grid.amounts)
+    if not len(book):
+        return
+    added = grid.totals()[[grid.index(name) for name in book.names]]
+
+    # Display the current and remaining balance for each account
+    col1, col2, col3 = st.columns(3)
+
+    with col1:
+        st.markdown("## Current")
+        for account, value in zip(book.names, book.paid.tolist()):
+            st.number_input(f"{account} Current", min_value=0.0, step=0.1, value=value, key=f"{account} - Current")
+        st.markdown("---")
+
+    with col2:
+        st.markdown("## Added")
+        for account, value in zip(book.names, added.tolist()):
+            st.number_input(f"{account} Added", min_value=0.0, step=0.1, value=value, key=f"{account} - Total Added")
+        st.markdown("---")
+
+    with col3:
+        st.markdown("## Remaining")
+        for account, value in zip(book.names, book.remaining().tolist()):
+            st.number_input(f"{account} Remaining", min_value=0.0, step=0.1, value=value, key=f"{account} - Total Remaining")
+        st.markdown("---")
+
+    # Display the maximum balance for each account
+    st.markdown("## Max Funds")
+    for account, value in zip(book.names, book.principal.tolist()):
+        st.number_input(f"{account} Funds", min_value=0.0, step=0.1, value=value, key=f"{account} - Total")
+    st.markdown("---")
+
+    # Project the balances from next month on, or from the January after a past year
+    today = datetime.date.today()
+    year, month = today.year + today.month // 12, today.month % 12 + 1
+    if grid.year < today.year:
+        year, month = grid.year + 1, 1
+    st.markdown("## Projection")
+    st.dataframe(book.to_frame(year, month), hide_index=True, use_container_width=True)
+    left = book.payoff_months()
+    horizon = int(left[np.isfinite(left)].max(initial=0)) or 12
+    balances = book.balances(horizon)
+    st.line_chart(pd.DataFrame(balances.T, columns=book.names))
+    st.markdown("---")
 
 def f_instalments():
     """
     Function to display the installments table, allowing the user to input values
     and download the table as a CSV file.
 
-    The function also displays the total added, current, and remaining balance for
-    each of the two accounts.
+    The table is shown either as one widget per cell or as a single table editor,
+    see INSTALMENTS_LAYOUT. The accounts come from the database, and the function
+    also displays the current and remaining balance and the repayment projection
+    of every account that is a loan.
     """
     try:
-        data = load_data()
-        dataframe = table()
-
         st.markdown("## Installments")
         st.markdown("---")
 
-        total_ing = 0.0
-        total_cec = 0.0
-
-        # Display the months and column names
-        header_columns = st.columns(len(dataframe.columns))
-        st.write("---")
-        current_year = datetime.datetime.now().year
-        header_columns[0].write(f'##### {current_year}')
-        for col_index, col_name in enumerate(dataframe.columns[1:], start=1):
-            header_columns[col_index].write(col_name)
-
-        # Iterate over the dataframe rows
-        for i, row in dataframe.iterrows():
-            cols = st.columns(len(dataframe.columns))
-            month = row['Months']
-            cols[0].write(f"{month}")
-            st.divider()
-
-            ing_value = cec_value = orange_value = salary_value = 0.0
-
-            # Iterate over the columns, displaying a checkbox and a number input
-            # for each column
-            for j, col in enumerate(dataframe.columns[1:-1]):
-                col_widget = cols[j + 1]
-
-                with col_widget:
-                    checkbox_key = f"{col}_{month}_checkbox"
-                    input_key = f"{col}_{month}_input"
-
-                    checkbox_value = st.checkbox("", key=checkbox_key, value=data.get(checkbox_key, False))
-                    if col == "Salary":
-                        salary_value = float(data.get(input_key, 0.0))
-                        input_value = st.number_input("RON", key=input_key, value=salary_value, step=0.1)
-                    else:
-                        input_value = st.number_input("RON", key=input_key, value=float(data.get(input_key, 0.0)), step=0.1)
-
-                    data[checkbox_key] = checkbox_value
-                    data[input_key] = input_value
-                    dataframe.at[i, col] = input_value
-
-                    if col == "ING":
-                        ing_value = input_value
-                    elif col == "CEC":
-                        cec_value = input_value
-                    elif col == "Orange":
-                        orange_value = input_value
-
-            # Calculate the "MyCut" value
-            my_cut = salary_value - (ing_value + cec_value + orange_value)
-            dataframe.at[i, "MyCut"] = my_cut
-
-            # Display the "MyCut" value
-            with cols[-1]:
-                st.write("**RON**")
-                st.number_input("", value=my_cut, step=0.1, key=f"MyCut_{month}")
-
-            # Sum up the total added values
-            total_ing += ing_value
-            total_cec += cec_value
-
-        # Add a download button
-        if st.button("Download"):
-            st.markdown(get_table_download_link(dataframe), unsafe_allow_html=True)
-
-        # Calculate the remaining balance for each account
-        all_ing = 13529.00
-        all_cec = 38660.00
-
-        current_ing = 3699.81 + total_ing
-        current_cec = 594.35 + total_cec
-
-        remaining_ing = all_ing - current_ing
-        remaining_cec = all_cec - current_cec
-
-        # Display the current and remaining balance for each account
-        col1, col2, col3 = st.columns(3)
-
-        with col1:
-            st.markdown("## Current")
-            st.number_input("ING Current", min_value=0.0, step=0.1, value=current_ing, key="ING - Current")
-            st.number_input("CEC Current", min_value=0.0, step=0.1, value=current_cec, key="CEC - Current")
-            st.markdown("---")
-
-        with col2:
-            st.markdown("## Added")
-            st.number_input("ING Added", min_value=0.0, step=0.1, value=total_ing, key="ING - Total Added")
-            st.number_input("CEC Added", min_value=0.0, step=0.1, value=total_cec, key="CEC - Total Added")
-            st.markdown("---")
-
-        with col3:
-            st.markdown("## Remaining")
-            st.number_input("ING Remaining", min_value=0.0, step=0.1, value=remaining_ing, key="ING - Total Remaining")
-            st.number_input("CEC Remaining", min_value=0.0, step=0.1, value=remaining_cec, key="CEC - Total Remaining")
-            st.markdown("---")
-
-        # Display the maximum balance for each account
-        st.markdown("## Max Funds")
-        st.number_input("ING Funds", min_value=0.0, step=0.1, value=all_ing, key="ING - Total")
-        st.number_input("CEC Funds", min_value=0.0, step=0.1, value=all_cec, key="CEC - Total")
-        st.markdown("---")
-
-        # Save the data
-        save_data(data)
-
-        # Return the dataframe
-        return dataframe
+        # Only the selected year of the logged in user is read, every year keeps its own rows
+        username = current_user()
+        years = load_years(username)
+        year_column, rollover_column = st.columns([3, 1])
+        year = year_column.selectbox("Year", years, index=years.index(datetime.date.today().year),
+                                     key="instalments_year")
+        with rollover_column:
+            st.write("")
+            if st.button(f"Roll Over to {year + 1}", help="Carry the balances of every account into the next year"):
+                count = rollover(year, username)
+                st.success(f"Carried {count} accounts into {year + 1}")
+
+        # Keep what was loaded, only the months the widgets change are written back
+        accounts = load_accounts(username, year)
+        loaded = load_data(accounts, year, username)
+        grid = loaded.copy()
+        render_accounts(accounts)
+
+        # Let the user switch between the per-cell widgets and the table editor
+        layouts = ["Cells", "Grid"]
+        default = layouts.index("Grid") if INSTALMENTS_LAYOUT == "grid" else 0
+        layout = st.radio("Layout", layouts, index=default, horizontal=True, key="instalments_layout")
+
+        if layout == "Grid":
+            render_grid(grid, loaded, username)
+        else:
+            render_cells(grid, loaded)
+
+        # Export the table on request, the file is only written once "Prepare" is pressed
+        export_widget("Installments", lambda: [grid.to_frame()], key=f"instalments_export_{grid.year}",
+                      file_name=f"installments_{grid.year}")
+
+        render_loans(grid, accounts)
+
+        # Save the months that changed, an idle rerun writes nothing
+        save_data(grid, previous=loaded, username=username)
+
+        # Return the table
+        return grid.to_frame()
 
     except Exception as e:
         st.error(f"Error: {e}")
@@ -0,0 +1,251 @@
+# transfer.py
+
+import argparse
+import csv
+import json
+import os
+from logic.util import *
+from logic.database import save_all_data, iter_all_data
+from logic.tracker import load_data, save_data
+
+
+def iter_json_array(fp, chunk_size: int = 65536):
+    """
+    Stream the elements of a top-level JSON array without loading the whole file.
+
+    Args:
+        fp: A text file object positioned at the start of the array.
+        chunk_size (int): The number of characters read at a time.
+
+    Yields:
+        The decoded array elements, one at a time.
+
+    Raises:
+        ValueError: If the file is not a well-formed JSON array.
+    """
+    decoder = json.JSONDecoder()
+    buffer = ''
+    while not buffer:
+        chunk = fp.read(chunk_size)
+        if not chunk:
+            break
+        buffer = chunk.lstrip()
+    if not buffer.startswith('['):
+        raise ValueError('Expected a JSON array')
+    buffer = buffer[1:]
+    eof = False
+    while True:
+        buffer = buffer.lstrip().lstrip(',').lstrip()
+        if buffer.startswith(']'):
+            return
+        if buffer:
+            try:
+                item, end = decoder.raw_decode(buffer)
+            except json.JSONDecodeError:
+                # The element may continue in the next chunk
+                if eof:
+                    raise ValueError('Malformed JSON array')
+            else:
+                # A number running to the end of the buffer may continue in the next chunk
+                if end < len(buffer) or eof:
+                    yield item
+                    buffer = buffer[end:]
+                    continue
+        more = fp.read(chunk_size)
+        if not more:
+            if eof or not buffer:
+                raise ValueError('Unterminated JSON array')
+            eof = True
+        buffer += more
+
+def normalize_period(item: dict) -> dict:
+    """
+    Normalize a period record read from a file.
+
+    Keys are matched case-insensitively, so both the "Period"/"Incomes" layout of
+    data.json and the lower-case layout of the database helpers are accepted. In CSV
+    files the incomes and expenses columns hold JSON objects.
+
+    Args:
+        item (dict): The raw record.
+
+    Returns:
+        dict: A dictionary with period, incomes, expenses and comment keys.
+    """
+    item = {key.lower(): value for key, value in item.items()}
+    incomes = item.get('incomes') or {}
+    expenses = item.get('expenses') or {}
+    return {
+        'period': item['period'],
+        'incomes': json.loads(incomes) if isinstance(incomes, str) else incomes,
+        'expenses': json.loads(expenses) if isinstance(expenses, str) else expenses,
+        'comment': item.get('comment') or '',
+    }
+
+def read_periods(path: str):
+    """
+    Stream period records from a JSON array or CSV file.
+
+    Args:
+        path (str): The file to read, ``.csv`` files are read as CSV and anything else as JSON.
+
+    Yields:
+        dict: Normalized period records.
+    """
+    with open(path, newline='', encoding='utf-8') as fp:
+        records = csv.DictReader(fp) if path.endswith('.csv') else iter_json_array(fp)
+        for record in records:
+            yield normalize_period(record)
+
+def write_periods(path: str, periods) -> int:
+    """
+    Stream period records to a JSON array or CSV file.
+
+    JSON files use the same layout as data.json. Records are written as they arrive,
+    so the whole history never has to be held in memory.
+
+    Args:
+        path (str): The file to write, ``.csv`` files are written as CSV and anything else as JSON.
+        periods (iterable): Mappings with period, incomes, expenses and comment keys.
+
+    Returns:
+        int: The number of records written.
+    """
+    count = 0
+    # Write to a temporary file first, so a failed export never truncates the old one
+    temporary = f'{path}.tmp'
+    with open(temporary, 'w', newline='', encoding='utf-8') as fp:
+        if path.endswith('.csv'):
+            writer = csv.writer(fp)
+            writer.writerow(['period', 'incomes', 'expenses', 'comment'])
+            for entry in periods:
+                writer.writerow([entry['period'], json.dumps(entry['incomes']),
+                                 json.dumps(entry['expenses']), entry['comment'] or ''])
+                count += 1
+        else:
+            fp.write('[')
+            for entry in periods:
+                if count:
+                    fp.write(', ')
+                json.dump({'Period': entry['period'], 'Incomes': entry['incomes'],
+                           'Expenses': entry['expenses'], 'Comment': entry['comment'] or ''}, fp)
+                count += 1
+            fp.write(']')
+    os.replace(temporary, path)
+    return count
+
+def import_periods(path: str = FILE_NAME, username: str = OWNER, chunk_size: int = BULK_CHUNK_SIZE) -> int:
+    """
+    Bulk load periods from a file into the database.
+
+    The file is streamed into chunked multi-row upserts inside one transaction.
+
+    Args:
+        path (str): The JSON or CSV file to import, defaults to data.json.
+        username (str): The owner of the imported periods.
+        chunk_size (int): The number of rows per INSERT statement.
+
+    Returns:
+        int: The number of periods imported.
+    """
+    return save_all_data(read_periods(path), username=username, chunk_size=chunk_size)
+
+def export_periods(path: str = FILE_NAME, username: str = OWNER) -> int:
+    """
+    Stream every period of a user from the database into a file.
+
+    Args:
+        path (str): The JSON or CSV file to write, defaults to data.json.
+        username (str): The owner of the exported periods.
+
+    Returns:
+        int: The number of periods exported.
+    """
+    return write_periods(path, iter_all_data(lazy=True, username=username))
+
+def import_instalments(path: str = INSTALMENTS_PATH, year: int = None, username: str = None) -> int:
+    """
+    Load one year of the instalments table from a JSON array or CSV file.
+
+    Columns are matched to the existing accounts by name, columns of unknown
+    accounts are ignored and only the months that change are written.
+
+    Args:
+        path (str): The file to read, defaults to instalments.json.
+        year (int, optional): The year the file holds, defaults to the current year.
+        username (str, optional): The owner of the accounts, defaults to the logged in user.
+
+    Returns:
+        int: The number of months imported.
+    """
+    previous = load_data(year=year, username=username)
+    grid = previous.copy()
+    count = 0
+    with open(path, newline='', encoding='utf-8') as fp:
+        records = csv.DictReader(fp) if path.endswith('.csv') else iter_json_array(fp)
+        for record in records:
+            month = MONTHS.index(record['Months'])
+            for column in grid.columns:
+                if record.get(column) not in (None, ''):
+                    grid.values[month, grid.index(column)] = float(record[column])
+            count += 1
+    save_data(grid, previous, username)
+    return count
+
+def export_instalments(path: str = INSTALMENTS_DOWNLOAD, year: int = None, username: str = None) -> int:
+    """
+    Write one year of the instalments table to a JSON array or CSV file.
+
+    Args:
+        path (str): The file to write, defaults to instalments.csv.
+        year (int, optional): The year to export, defaults to the current year.
+        username (str, optional): The owner of the accounts, defaults to the logged in user.
+
+    Returns:
+        int: The number of months exported.
+    """
+    grid = load_data(year=year, username=username)
+    columns = ['Months'] + grid.columns
+    rows = [dict(zip(columns, [month] + values)) for month, values in zip(MONTHS, grid.values.tolist())]
+    temporary = f'{path}.tmp'
+    with open(temporary, 'w', newline='', encoding='utf-8') as fp:
+        if path.endswith('.csv'):
+            writer = csv.DictWriter(fp, fieldnames=columns)
+            writer.writeheader()
+            writer.writerows(rows)
+        else:
+            json.dump(rows, fp)
+    os.replace(temporary, path)
+    return len(rows)
+
+
+def main() -> None:
+    """
+    Command line entry point: ``python -m logic.transfer {import,export} [options]``.
+    """
+    parser = argparse.ArgumentParser(description='Bulk import and export expense tracker data.')
+    parser.add_argument('action', choices=['import', 'export'])
+    parser.add_argument('--kind', choices=['periods', 'instalments'], default='periods')
+    parser.add_argument('--file', help='JSON or CSV file, defaults to data.json or the instalments files')
+    parser.add_argument('--user', default=OWNER, help='owner of the periods or instalments')
+    parser.add_argument('--chunk-size', type=int, default=BULK_CHUNK_SIZE, help='rows per INSERT statement')
+    parser.add_argument('--year', type=int, help='year of the instalments, defaults to the current year')
+    args = parser.parse_args()
+
+    if args.kind == 'periods':
+        path = args.file or FILE_NAME
+        if args.action == 'import':
+            count = import_periods(path, args.user, args.chunk_size)
+        else:
+            count = export_periods(path, args.user)
+    elif args.action == 'import':
+        path = args.file or INSTALMENTS_PATH
+        count = import_instalments(path, args.year, args.user)
+    else:
+        path = args.file or INSTALMENTS_DOWNLOAD
+        count = export_instalments(path, args.year, args.user)
+    print(f'{args.action.capitalize()}ed {count} {args.kind} ({path})')
+
+
+if __name__ == '__main__':
+    main()
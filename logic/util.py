@@ -13,6 +13,8 @@ FILE_NAME = os.path.join(SCRIPT_DIR, 'data.json')
 HASHED_FILE = os.path.join(SCRIPT_DIR, 'hashed_pw.pkl')
 INSTALMENTS_PATH = os.path.join(SCRIPT_DIR, 'instalments.json')
 INSTALMENTS_DOWNLOAD = os.path.join(SCRIPT_DIR, 'instalments.csv')
+MONTHS = ['January', 'February', 'March', 'April', 'May', 'June', 'July',
+          'August', 'September', 'October', 'November', 'December']
 
 def get_json_file_path() -> str:
     """
@@ -24,15 +26,102 @@ def get_json_file_path() -> str:
     # Return the path to the JSON file
     return FILE_NAME
 
+def parse_period(period: str):
+    """
+    Split a period such as "January 2025" into its year and month.
+
+    Args:
+        period (str): The period name built by the Data-Entry form.
+
+    Returns:
+        tuple[int, int] or None: The (year, month) pair, or None if the period is not a
+        month name followed by a year.
+    """
+    parts = str(period).split()
+    if len(parts) != 2 or parts[0].capitalize() not in MONTHS or not parts[1].isdigit():
+        return None
+    return int(parts[1]), MONTHS.index(parts[0].capitalize()) + 1
+
+def period_key(period):
+    """
+    Convert a period into its sortable integer key, e.g. "January 2025" -> 202501.
+
+    Args:
+        period (str, tuple or int): A period name, a (year, month) pair or an existing key.
+
+    Returns:
+        int or None: year * 100 + month, or None if the period cannot be parsed.
+    """
+    if isinstance(period, int):
+        return period
+    if isinstance(period, tuple):
+        year, month = period
+        return year * 100 + month
+    parsed = parse_period(period)
+    return parsed[0] * 100 + parsed[1] if parsed else None
+
 
 dotenv_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.env')
 load_dotenv(dotenv_path, override=True)
 
 
 HOST = os.getenv('HOST')
-print(f'HOST IS: {HOST}')
 DATABASE = os.getenv('DATABASE')
 USER = os.getenv('USER')
 PASSWORD = os.getenv('PASSWORD')
 PORT = os.getenv('PORT')
-KEY = os.getenv('KEY')
\ No newline at end of file
+KEY = os.getenv('KEY')
+
+# Connection pool settings shared by every database helper
+POOL_SIZE = int(os.getenv('POOL_SIZE', 5))
+POOL_TIMEOUT = float(os.getenv('POOL_TIMEOUT', 10))
+POOL_IDLE_TIMEOUT = float(os.getenv('POOL_IDLE_TIMEOUT', 300))
+POOL_PING_INTERVAL = float(os.getenv('POOL_PING_INTERVAL', 30))
+
+# Apply pending schema migrations at startup, disable to require `python -m logic.migrations`
+AUTO_MIGRATE = os.getenv('AUTO_MIGRATE', '1').lower() not in ('0', 'false', 'no')
+
+# The account that owns the tracker page and any rows created before data was kept per user
+OWNER = os.getenv('OWNER', 'cosmint')
+
+# Process-wide read-through cache for period lookups
+CACHE_SIZE = int(os.getenv('CACHE_SIZE', 1024))
+CACHE_TTL = float(os.getenv('CACHE_TTL', 300))
+
+# Rows fetched per round trip when streaming periods with a server-side cursor
+STREAM_BATCH_SIZE = int(os.getenv('STREAM_BATCH_SIZE', 500))
+
+# Rows written per multi-row INSERT by the bulk import
+BULK_CHUNK_SIZE = int(os.getenv('BULK_CHUNK_SIZE', 1000))
+
+# Default layout of the instalments page: "cells" for one widget per cell or "grid" for a single table editor
+INSTALMENTS_LAYOUT = os.getenv('INSTALMENTS_LAYOUT', 'cells').lower()
+
+# Serialized Sankey figures kept in memory, keyed by the content they show
+FIGURE_CACHE_SIZE = int(os.getenv('FIGURE_CACHE_SIZE', 64))
+
+# Local data files live here, outside the source tree, unless their own paths are set
+DATA_DIR = os.getenv('DATA_DIR', os.path.join(Path.home(), '.expense_tracker'))
+
+# Journal Data-Entry saves to a local SQLite file and write them to MySQL from a background thread
+WRITE_BEHIND = os.getenv('WRITE_BEHIND', '0').lower() in ('1', 'true', 'yes')
+JOURNAL_PATH = os.getenv('JOURNAL_PATH', os.path.join(DATA_DIR, 'journal.db'))
+JOURNAL_BATCH_SIZE = int(os.getenv('JOURNAL_BATCH_SIZE', 100))
+JOURNAL_FLUSH_INTERVAL = float(os.getenv('JOURNAL_FLUSH_INTERVAL', 1))
+JOURNAL_MAX_BACKOFF = float(os.getenv('JOURNAL_MAX_BACKOFF', 60))
+JOURNAL_MAX_ATTEMPTS = int(os.getenv('JOURNAL_MAX_ATTEMPTS', 5))
+
+# Storage backend behind the query helpers: "mysql", "sqlite" (a single file at STORAGE_PATH) or "memory"
+STORAGE_BACKEND = os.getenv('STORAGE_BACKEND', 'mysql').lower()
+STORAGE_PATH = os.getenv('STORAGE_PATH', os.path.join(DATA_DIR, 'expense_tracker.db'))
+
+# Prometheus text file rewritten after every rerun, empty to disable, and the sidebar debug panel
+METRICS_PATH = os.getenv('METRICS_PATH', '')
+METRICS_PANEL = os.getenv('METRICS_PANEL', '0').lower() in ('1', 'true', 'yes')
+
+# Statements slower than SLOW_QUERY_MS (negative to disable) are appended by fingerprint to SLOW_QUERY_LOG
+# with their call site, or logged as warnings when it is empty, and up to QUERY_FINGERPRINTS query shapes
+# are aggregated in memory
+SLOW_QUERY_MS = float(os.getenv('SLOW_QUERY_MS', 200))
+SLOW_QUERY_LOG = os.getenv('SLOW_QUERY_LOG', '')
+QUERY_FINGERPRINTS = int(os.getenv('QUERY_FINGERPRINTS', 500))
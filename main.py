@@ -2,8 +2,9 @@
 
 import streamlit as st
 from logic.settings import *
-from logic.app import *
 from logic.authenticator import *
+from logic.migrations import ensure_schema
+from logic.metrics import rerun, section, debug_panel
 
 def main():
     """
@@ -12,7 +13,12 @@ def main():
     Handles the user's choice between the login, register, and app sections.
     """
     # Configure the page with title and icon
-    settings()
+    with section('settings'):
+        settings()
+
+    # Bring the database schema up to date, only the first run in the process does any work
+    with section('ensure_schema'):
+        ensure_schema()
 
     # Check if the mode is set in the session state, if not, set it to login
     if 'mode' not in st.session_state:
@@ -35,9 +41,12 @@ def main():
             # If the form is submitted, check the login credentials
             if submitted:
                 if validate_username(username):
-                    if username in get_usernames():
-                        if check_login(username, password):
-                            st.session_state['username'] = username  # Save username in session state
+                    with section('login'):
+                        user = get_user(username)  # One indexed lookup for the whole login
+                        verified = user and verify_password(user, password)
+                    if user:
+                        if verified:
+                            st.session_state['username'] = user['username']  # Save the stored spelling, the lookup ignores case
                             st.session_state['mode'] = 'app'  # Login successful
                             st.rerun()
                         else:
@@ -56,11 +65,18 @@ def main():
 
     # Display the registration form
     if st.session_state['mode'] == 'register':
-        register()
+        with section('register'):
+            register()
 
     # If the mode is set to app, run the main application
     if st.session_state['mode'] == 'app':
-        og_app()
+        # The app pages load after login, so the login form does not wait for them
+        with section('app'):
+            from logic.app import og_app
+            og_app()
 
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    # Time the whole rerun, then show where it went when METRICS_PANEL is set
+    with rerun():
+        main()
+        debug_panel()
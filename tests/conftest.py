@@ -0,0 +1,22 @@
+# conftest.py
+
+import os
+import sys
+import pytest
+
+# The logic package is imported from the repository root, as streamlit run main.py does
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from logic.memory_storage import MemoryStorage
+from logic.sqlite_storage import SQLiteStorage
+
+
+@pytest.fixture(params=['memory', 'sqlite'])
+def storage(request, tmp_path):
+    """
+    A fresh, empty backend: every test using it runs once on MemoryStorage and once on
+    SQLiteStorage.
+    """
+    if request.param == 'memory':
+        return MemoryStorage()
+    return SQLiteStorage(str(tmp_path / 'expense_tracker.db'))
@@ -0,0 +1,105 @@
+# test_cache.py
+
+import pytest
+from logic import cache as cache_module
+from logic import database
+from logic import storage as storage_module
+from logic.cache import LRUCache, MISSING
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(cache_module, 'time', clock)
+    return clock
+
+@pytest.fixture
+def cached(storage, monkeypatch):
+    """
+    The database helpers reading from a fresh backend through an empty cache.
+    """
+    monkeypatch.setattr(storage_module, '_storage', storage)
+    monkeypatch.setattr(database, '_cache', LRUCache(16, ttl=0))
+    monkeypatch.setattr(database, 'WRITE_BEHIND', False)
+    return storage
+
+
+def test_least_recently_used_entry_is_evicted(clock):
+    cache = LRUCache(2, ttl=0)
+    cache.set('a', 1)
+    cache.set('b', 2)
+    cache.get('a')
+    cache.set('c', 3)
+    assert cache.get('b') is MISSING
+    assert (cache.get('a'), cache.get('c')) == (1, 3)
+
+def test_entries_expire_after_the_ttl(clock):
+    cache = LRUCache(2, ttl=60)
+    cache.set('a', None)
+    clock.now += 59
+    assert cache.get('a') is None
+    clock.now += 2
+    assert cache.get('a') is MISSING
+    assert len(cache) == 0
+
+def test_values_read_before_an_invalidation_are_dropped(clock):
+    cache = LRUCache(2, ttl=0)
+    generation = cache.generation
+    # A writer changes the row while the reader is still loading it
+    cache.invalidate('a')
+    cache.set('a', 'stale', generation)
+    assert cache.get('a') is MISSING
+    cache.set('a', 'fresh', cache.generation)
+    assert cache.get('a') == 'fresh'
+
+def test_invalidate_where_only_drops_matching_keys(clock):
+    cache = LRUCache(4, ttl=0)
+    cache.set(('periods', 'alice'), [])
+    cache.set(('periods', 'bob'), [])
+    cache.invalidate_where(lambda key: key[1] == 'alice')
+    assert cache.get(('periods', 'alice')) is MISSING
+    assert cache.get(('periods', 'bob')) == []
+
+
+def test_repeat_reads_are_served_from_the_cache(cached):
+    database.insert_period('March 2025', {'Salary': 3000}, {}, '', username='alice')
+    assert database.get_period('March 2025', username='alice')['incomes'] == {'Salary': 3000}
+    # A change behind the helpers' back is not seen until the entry is invalidated
+    cached.update_period('alice', 'March 2025', {'Salary': 1}, {})
+    assert database.get_period('March 2025', username='alice')['incomes'] == {'Salary': 3000}
+    assert database._cache.hits == 1
+
+def test_writes_invalidate_the_period_and_the_period_list(cached):
+    database.insert_period('March 2025', {'Salary': 3000}, {}, '', username='alice')
+    assert database.get_all_periods(username='alice') == ['March 2025']
+    database.get_period('March 2025', username='alice')
+
+    database.insert_period('April 2025', {'Salary': 3100}, {}, '', username='alice')
+    database.update_period('March 2025', {'Salary': 3200}, {}, username='alice')
+    database.update_comment('March 2025', 'raise', username='alice')
+    assert database.get_all_periods(username='alice') == ['March 2025', 'April 2025']
+    assert database.get_period('March 2025', username='alice') == {
+        'incomes': {'Salary': 3200}, 'expenses': {}, 'comment': 'raise'}
+
+def test_clearing_a_user_keeps_other_users_cached(cached):
+    database.insert_period('March 2025', {'Salary': 3000}, {}, '', username='alice')
+    database.insert_period('March 2025', {'Salary': 2000}, {}, '', username='bob')
+    database.get_all_periods(username='alice')
+    database.get_all_periods(username='bob')
+
+    database.clear_data(username='alice')
+    assert database.get_all_periods(username='alice') == []
+    assert database._cache.get(('periods', 'bob')) == ['March 2025']
+
+def test_callers_cannot_change_the_cached_details(cached):
+    database.insert_period('March 2025', {'Salary': 3000}, {}, '', username='alice')
+    database.get_period('March 2025', username='alice')['incomes']['Salary'] = 0
+    assert database.get_period('March 2025', username='alice')['incomes'] == {'Salary': 3000}
@@ -0,0 +1,78 @@
+# test_export.py
+
+import os
+import time
+import pandas as pd
+import pytest
+from logic import export
+from logic.export import chunked_frames, export_file, remove_export, sweep_exports
+
+COLUMNS = ['period', 'incomes', 'expenses', 'comment']
+ROWS = [(f'Period {i}', '{"Salary": 3000}', '{}', '') for i in range(7)]
+
+
+@pytest.fixture(autouse=True)
+def export_dir(tmp_path, monkeypatch):
+    """
+    Exports written to a private directory and tracked in a fresh set.
+    """
+    directory = tmp_path / 'exports'
+    monkeypatch.setattr(export, 'EXPORT_DIR', str(directory))
+    monkeypatch.setattr(export, '_prepared', set())
+    return directory
+
+
+def test_rows_are_grouped_into_chunks():
+    frames = list(chunked_frames(iter(ROWS), COLUMNS, chunk_size=3))
+    assert [len(frame) for frame in frames] == [3, 3, 1]
+    assert list(frames[0].columns) == COLUMNS
+
+def test_prepared_csv_holds_every_row(export_dir):
+    path, count = export_file(chunked_frames(ROWS, COLUMNS, chunk_size=3), 'CSV')
+    assert count == 7
+    assert os.path.dirname(path) == str(export_dir)
+    assert path.endswith('.csv')
+    assert pd.read_csv(path, keep_default_na=False).values.tolist() == [list(row) for row in ROWS]
+    assert export._prepared == {path}
+
+def test_a_failed_export_leaves_no_file(export_dir):
+    def frames():
+        yield from chunked_frames(ROWS[:3], COLUMNS)
+        raise RuntimeError('database went away')
+
+    with pytest.raises(RuntimeError):
+        export_file(frames(), 'CSV')
+    assert list(export_dir.iterdir()) == []
+    assert export._prepared == set()
+
+def test_removing_an_export_twice_is_harmless():
+    path, _ = export_file(chunked_frames(ROWS, COLUMNS), 'CSV')
+    remove_export(path)
+    remove_export(path)
+    assert not os.path.exists(path)
+    assert export._prepared == set()
+
+def test_sweep_only_removes_old_exports(export_dir):
+    old, _ = export_file(chunked_frames(ROWS, COLUMNS), 'CSV')
+    new, _ = export_file(chunked_frames(ROWS, COLUMNS), 'CSV')
+    an_hour_ago = time.time() - 3601
+    os.utime(old, (an_hour_ago, an_hour_ago))
+    sweep_exports(max_age=3600)
+    assert not os.path.exists(old)
+    assert os.path.exists(new)
+    assert export._prepared == {new}
+
+def test_sweep_without_an_export_directory():
+    sweep_exports()
+
+def test_exports_left_at_exit_are_removed():
+    paths = [export_file(chunked_frames(ROWS, COLUMNS), 'CSV')[0] for _ in range(2)]
+    export._remove_prepared()
+    assert not any(os.path.exists(path) for path in paths)
+    assert export._prepared == set()
+
+def test_parquet_export():
+    pytest.importorskip('pyarrow')
+    path, count = export_file(chunked_frames(ROWS, COLUMNS, chunk_size=3), 'Parquet')
+    assert count == 7
+    assert pd.read_parquet(path)['period'].tolist() == [row[0] for row in ROWS]
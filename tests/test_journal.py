@@ -0,0 +1,87 @@
+# test_journal.py
+
+import json
+import pymysql
+import pytest
+from logic.journal import Journal, WriteBehind, RejectedWrite
+
+
+@pytest.fixture
+def journal(tmp_path):
+    journal = Journal(str(tmp_path / 'journal.db'), max_attempts=2)
+    yield journal
+    journal.close()
+
+def details(storage, username, period):
+    incomes, expenses, comment = storage.get_period(username, period)
+    return json.loads(incomes), json.loads(expenses), comment
+
+
+def test_appending_a_key_twice_records_one_save(journal):
+    journal.append('alice', 'March 2025', {'Salary': 3000}, {}, 'first', key='k1')
+    journal.append('alice', 'March 2025', {'Salary': 9999}, {}, 'again', key='k1')
+    assert [entry['incomes'] for entry in journal.pending('alice')] == [{'Salary': 3000}]
+
+def test_pending_saves_survive_a_restart(tmp_path, storage):
+    path = str(tmp_path / 'journal.db')
+    journal = Journal(path)
+    journal.append('alice', 'March 2025', {'Salary': 3000}, {'Rent': 1200}, 'saved before the crash')
+    journal.close()
+
+    # A new process finds the save and writes it
+    journal = Journal(path)
+    writer = WriteBehind(journal, storage.apply_writes)
+    assert writer.flush_once() == 1
+    assert details(storage, 'alice', 'March 2025') == ({'Salary': 3000}, {'Rent': 1200}, 'saved before the crash')
+    assert journal.counts() == {'pending': 0, 'dead': 0}
+    journal.close()
+
+def test_saves_are_replayed_oldest_first(journal, storage):
+    journal.append('alice', 'March 2025', {'Salary': 3000}, {}, 'one', append_comment=True)
+    journal.append('alice', 'March 2025', {'Salary': 3100}, {}, 'two', append_comment=True)
+    WriteBehind(journal, storage.apply_writes).drain()
+    assert details(storage, 'alice', 'March 2025') == ({'Salary': 3100}, {}, 'one\n\ntwo')
+
+def test_a_replayed_batch_is_applied_once(journal, storage):
+    journal.append('alice', 'March 2025', {'Salary': 3000}, {}, 'note', append_comment=True)
+    batch = journal.batch(10)
+    storage.apply_writes(batch)
+    # The commit went through but its acknowledgement was lost, so the batch is sent again
+    storage.apply_writes(batch)
+    assert details(storage, 'alice', 'March 2025') == ({'Salary': 3000}, {}, 'note')
+
+def test_unreachable_database_keeps_the_batch(journal):
+    def flush(entries):
+        raise pymysql.OperationalError(2003, "Can't connect")
+
+    journal.append('alice', 'March 2025', {'Salary': 3000}, {}, '')
+    with pytest.raises(pymysql.OperationalError):
+        WriteBehind(journal, flush).flush_once()
+    # Outages do not count as rejections
+    assert journal.counts() == {'pending': 1, 'dead': 0}
+    assert journal.batch(10)[0]['attempts'] == 0
+
+def test_rejected_entries_do_not_hold_back_the_others(journal, storage):
+    def flush(entries):
+        if any(entry['period'] == 'Bad 2025' for entry in entries):
+            raise ValueError('rejected')
+        storage.apply_writes(entries)
+
+    journal.append('alice', 'Bad 2025', {}, {}, '')
+    journal.append('alice', 'March 2025', {'Salary': 3000}, {}, '')
+    writer = WriteBehind(journal, flush)
+    assert writer.flush_once() == 1
+    assert storage.get_period('alice', 'March 2025') is not None
+
+    # The second rejection sets the entry aside, and it is listed for the user
+    with pytest.raises(RejectedWrite):
+        writer.flush_once()
+    assert journal.counts() == {'pending': 0, 'dead': 1}
+    rejected = journal.rejected('alice')
+    assert [entry['period'] for entry in rejected] == ['Bad 2025']
+    assert 'rejected' in rejected[0]['last_error']
+    assert writer.flush_once() == 0
+
+    writer.retry([rejected[0]['key']])
+    assert journal.counts() == {'pending': 1, 'dead': 0}
+    assert journal.batch(10)[0]['attempts'] == 0
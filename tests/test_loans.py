@@ -0,0 +1,74 @@
+# test_loans.py
+
+import numpy as np
+import pytest
+from logic.loans import LoanBook, annuity_payment
+
+
+def schedule(balance, rate, payment, months):
+    """
+    The balance after each instalment, one month at a time.
+    """
+    balances = [balance]
+    for _ in range(months):
+        balance = max(balance * (1 + rate / 1200) - payment, 0)
+        balances.append(balance)
+    return balances
+
+def account(name, principal, rate=0.0, term_months=None, payment=None, opening_paid=0.0):
+    return dict(id=None, name=name, principal=principal, rate=rate, term_months=term_months,
+                payment=payment, opening_paid=opening_paid)
+
+
+def test_annuity_repays_the_principal_over_its_term():
+    payment = annuity_payment([12000, 12000, 12000], [0, 12, 12], [12, 12, 0])
+    assert payment[0] == pytest.approx(1000)
+    assert payment[1] == pytest.approx(1066.1854, abs=1e-4)
+    assert np.isnan(payment[2])
+    assert schedule(12000, 12, payment[1], 12)[-1] == pytest.approx(0, abs=1e-6)
+
+def test_balances_match_a_month_by_month_schedule():
+    book = LoanBook(['Car', 'Phone'], [12000, 600], [6, 0], [500, 50], [2000, 100])
+    balances = book.balances(30)
+    assert balances.shape == (2, 31)
+    np.testing.assert_allclose(balances[0], schedule(10000, 6, 500, 30), atol=1e-6)
+    np.testing.assert_allclose(balances[1], schedule(500, 0, 50, 30), atol=1e-6)
+
+def test_interest_sums_the_interest_of_every_month():
+    book = LoanBook(['Car'], [12000], [6], [500], [2000])
+    expected = sum(balance * 0.005 for balance in schedule(10000, 6, 500, 24)[:-1])
+    assert book.interest(24)[0] == pytest.approx(expected)
+
+def test_payoff_months_and_dates():
+    payment = annuity_payment(12000, 12, 12)
+    book = LoanBook(['Even', 'Interest', 'Paid', 'Never'],
+                    [12000, 12000, 500, 12000], [0, 12, 5, 12], [1000, payment, 100, 120], [0, 0, 500, 0])
+    np.testing.assert_array_equal(book.payoff_months(), [12, 12, 0, np.inf])
+    # The next instalment is due in March 2025, so twelve of them end in February 2026
+    assert book.payoff_dates(2025, 3) == ['February 2026', 'February 2026', 'Paid', None]
+
+def test_from_accounts_falls_back_to_the_annuity_then_to_observed_payments():
+    accounts = [
+        account('Stored', 1200, payment=150.0),
+        account('Annuity', 1200, term_months=12),
+        account('Observed', 1200),
+        account('Savings', None),
+    ]
+    observed = np.zeros((12, 4))
+    observed[0, 2], observed[1, 2] = 80, 120
+    book = LoanBook.from_accounts(accounts, [0, 0, 200, 50], observed)
+    assert book.names == ['Stored', 'Annuity', 'Observed']
+    np.testing.assert_allclose(book.payment, [150, 100, 100])
+    np.testing.assert_allclose(book.remaining(), [1200, 1200, 1000])
+
+def test_from_accounts_prefers_the_carried_balance():
+    accounts = [dict(account('Car', 1000, payment=100.0, opening_paid=100.0), carried=400.0)]
+    book = LoanBook.from_accounts(accounts, [50])
+    assert book.paid.tolist() == [450]
+
+def test_summary_table():
+    book = LoanBook(['Car', 'Never'], [1200, 1200], [0, 12], [100, 5], [0, 0])
+    frame = book.to_frame(2025, 1)
+    assert frame['Payoff'].tolist() == ['December 2025', None]
+    assert frame['Instalments Left'].tolist()[0] == 12
+    assert np.isnan(frame['Instalments Left'].tolist()[1])
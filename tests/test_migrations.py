@@ -0,0 +1,54 @@
+# test_migrations.py
+
+import os
+import pytest
+import pymysql
+from logic.util import HOST, USER, PASSWORD, PORT
+from logic.migrations import _v1_baseline, _v3_unique_periods, _v8_unique_months, index_exists
+
+# The duplicate removal of the migrations is MySQL SQL, so they run against a real
+# server. Every table of TEST_MYSQL_DATABASE is dropped, never point it at a real database.
+TEST_DATABASE = os.getenv('TEST_MYSQL_DATABASE')
+
+pytestmark = pytest.mark.skipif(not TEST_DATABASE, reason='TEST_MYSQL_DATABASE is not set')
+
+
+@pytest.fixture
+def cursor():
+    connection = pymysql.connect(host=HOST, user=USER, password=PASSWORD, port=int(PORT or 3306),
+                                 database=TEST_DATABASE, autocommit=True)
+    cursor = connection.cursor()
+    for table in ('ExpenseTrackerDetails', 'ExpenseTrackerAuth', 'ExpenseTrackerInstallments'):
+        cursor.execute(f'DROP TABLE IF EXISTS {table}')
+    _v1_baseline(cursor)
+    yield cursor
+    connection.close()
+
+
+def test_v3_keeps_the_newest_copy_of_each_period(cursor):
+    rows = [('March 2025', '{"Salary": 1}'), ('April 2025', '{"Salary": 2}'),
+            ('March 2025', '{"Salary": 3}'), ('March 2025', '{"Salary": 4}')]
+    cursor.executemany("INSERT INTO ExpenseTrackerDetails (period, incomes, expenses, comment) "
+                       "VALUES (%s, %s, '{}', '')", rows)
+    _v3_unique_periods(cursor)
+
+    cursor.execute('SELECT period, incomes FROM ExpenseTrackerDetails ORDER BY id')
+    assert [(period, incomes.replace(' ', '')) for period, incomes in cursor.fetchall()] == [
+        ('April 2025', '{"Salary":2}'), ('March 2025', '{"Salary":4}')]
+    assert index_exists(cursor, 'ExpenseTrackerDetails', 'uq_details_period')
+    assert not index_exists(cursor, 'ExpenseTrackerDetails', 'idx_details_period')
+    # Running it again changes nothing
+    _v3_unique_periods(cursor)
+    cursor.execute('SELECT COUNT(*) FROM ExpenseTrackerDetails')
+    assert cursor.fetchone()[0] == 2
+
+def test_v8_keeps_the_newest_row_of_each_month(cursor):
+    rows = [('January', 10), ('February', 20), ('January', 30)]
+    cursor.executemany('INSERT INTO ExpenseTrackerInstallments (Months, ING) VALUES (%s, %s)', rows)
+    _v8_unique_months(cursor)
+
+    cursor.execute('SELECT Months, ING FROM ExpenseTrackerInstallments ORDER BY id')
+    assert [(month, float(amount)) for month, amount in cursor.fetchall()] == [('February', 20), ('January', 30)]
+    assert index_exists(cursor, 'ExpenseTrackerInstallments', 'uq_installments_months')
+    with pytest.raises(pymysql.IntegrityError):
+        cursor.execute("INSERT INTO ExpenseTrackerInstallments (Months) VALUES ('January')")
@@ -0,0 +1,55 @@
+# test_periods.py
+
+import json
+import pytest
+from logic.util import parse_period, period_key
+
+
+def save(storage, username, *periods):
+    storage.save_periods(username, [{'period': period, 'incomes': {'Salary': 1}, 'expenses': {}} for period in periods])
+
+
+@pytest.mark.parametrize('period, key', [
+    ('January 2025', 202501),
+    ('december 2024', 202412),
+    ((2025, 7), 202507),
+    (202503, 202503),
+    ('Holiday', None),
+    ('March', None),
+    ('Marc 2025', None),
+])
+def test_period_key(period, key):
+    assert period_key(period) == key
+
+def test_keys_sort_in_date_order():
+    periods = ['January 2025', 'December 2024', 'February 2024', 'November 2024']
+    assert sorted(periods, key=period_key) == ['February 2024', 'November 2024', 'December 2024', 'January 2025']
+    assert parse_period('November 2024') == (2024, 11)
+
+def test_periods_are_listed_in_date_order(storage):
+    save(storage, 'alice', 'March 2025', 'Holiday', 'December 2024', 'January 2025')
+    assert storage.list_periods('alice') == ['Holiday', 'December 2024', 'January 2025', 'March 2025']
+
+def test_range_is_inclusive_and_crosses_years(storage):
+    save(storage, 'alice', 'October 2024', 'November 2024', 'December 2024', 'January 2025', 'February 2025',
+         'Holiday')
+    assert storage.periods_between('alice', 202411, 202501) == ['November 2024', 'December 2024', 'January 2025']
+    assert storage.periods_between('alice', 202412, 202412) == ['December 2024']
+    assert storage.periods_between('alice', 202503, 202512) == []
+
+def test_range_only_returns_the_users_periods(storage):
+    save(storage, 'alice', 'January 2025')
+    save(storage, 'bob', 'February 2025')
+    assert storage.periods_between('alice', 202401, 202512) == ['January 2025']
+
+def test_a_period_repeated_in_one_import_keeps_the_last_copy(storage):
+    entries = [
+        {'period': 'March 2025', 'incomes': {'Salary': 1000}, 'expenses': {'Rent': 500}, 'comment': 'first'},
+        {'period': 'April 2025', 'incomes': {'Salary': 2000}, 'expenses': {}},
+        {'period': 'March 2025', 'incomes': {'Salary': 3000}, 'expenses': {'Rent': 700}, 'comment': 'last'},
+    ]
+    storage.save_periods('alice', entries, chunk_size=10)
+    incomes, expenses, comment = storage.get_period('alice', 'March 2025')
+    assert (json.loads(incomes), json.loads(expenses), comment) == ({'Salary': 3000}, {'Rent': 700}, 'last')
+    assert storage.period_totals('alice', 'March 2025') == {'income': 3000, 'expense': 700}
+    assert storage.list_periods('alice') == ['March 2025', 'April 2025']
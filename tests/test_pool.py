@@ -0,0 +1,172 @@
+# test_pool.py
+
+import pymysql
+import pytest
+from logic import pool as pool_module
+from logic.pool import ConnectionPool, PoolTimeoutError
+
+
+class Clock:
+    """
+    Stands in for the time module so idleness can be advanced by hand.
+    """
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+    def perf_counter(self):
+        return self.now
+
+
+class FakeConnection:
+    def __init__(self, healthy=True):
+        self.open = True
+        self.healthy = healthy
+        self.pings = 0
+
+    def ping(self, reconnect=True):
+        self.pings += 1
+        if not self.healthy:
+            raise pymysql.OperationalError(2006, 'MySQL server has gone away')
+
+    def close(self):
+        self.open = False
+
+
+class FakePool(ConnectionPool):
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.connected = []
+
+    def _connect(self):
+        connection = FakeConnection()
+        self.connected.append(connection)
+        return connection
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(pool_module, 'time', clock)
+    return clock
+
+
+def test_released_connections_are_reused(clock):
+    pool = FakePool(size=2, timeout=0, idle_timeout=60, ping_interval=30)
+    with pool.connection() as first:
+        pass
+    with pool.connection() as second:
+        pass
+    assert second is first
+    assert pool.connected == [first]
+
+def test_checkout_times_out_when_the_pool_is_full(clock):
+    pool = FakePool(size=1, timeout=0, idle_timeout=60, ping_interval=30)
+    with pool.connection():
+        with pytest.raises(PoolTimeoutError):
+            pool.acquire()
+
+def test_recently_used_connections_are_not_pinged(clock):
+    pool = FakePool(size=1, timeout=0, idle_timeout=60, ping_interval=30)
+    with pool.connection() as connection:
+        pass
+    clock.now += 10
+    with pool.connection():
+        pass
+    assert connection.pings == 0
+
+def test_idle_connections_are_pinged_before_reuse(clock):
+    pool = FakePool(size=1, timeout=0, idle_timeout=60, ping_interval=30)
+    with pool.connection() as connection:
+        pass
+    clock.now += 45
+    with pool.connection() as again:
+        pass
+    assert again is connection
+    assert connection.pings == 1
+
+def test_failed_ping_replaces_the_connection(clock):
+    pool = FakePool(size=1, timeout=0, idle_timeout=60, ping_interval=30)
+    with pool.connection() as stale:
+        stale.healthy = False
+    clock.now += 45
+    with pool.connection() as fresh:
+        pass
+    assert fresh is not stale
+    assert not stale.open
+    assert pool._opened == 1
+
+def test_connections_idle_past_the_timeout_are_evicted(clock):
+    pool = FakePool(size=1, timeout=0, idle_timeout=60, ping_interval=30)
+    with pool.connection() as old:
+        pass
+    clock.now += 61
+    with pool.connection() as new:
+        pass
+    assert new is not old
+    assert not old.open
+    assert old.pings == 0
+    assert pool._opened == 1
+
+def test_network_errors_discard_the_connection(clock):
+    pool = FakePool(size=1, timeout=0, idle_timeout=60, ping_interval=30)
+    with pytest.raises(pymysql.OperationalError):
+        with pool.connection() as broken:
+            raise pymysql.OperationalError(2013, 'Lost connection to MySQL server')
+    assert not broken.open
+    with pool.connection() as connection:
+        pass
+    assert connection is not broken
+
+def test_failed_connect_frees_its_slot(clock):
+    class Unreachable(FakePool):
+        def _connect(self):
+            raise pymysql.OperationalError(2003, "Can't connect")
+
+    pool = Unreachable(size=1, timeout=0)
+    for _ in range(2):
+        with pytest.raises(pymysql.OperationalError) as error:
+            pool.acquire()
+        assert not isinstance(error.value, PoolTimeoutError)
+    assert pool._opened == 0
+
+def test_transaction_rolls_back_on_error(clock):
+    class TransactionalConnection(FakeConnection):
+        def __init__(self):
+            super().__init__()
+            self.calls = []
+
+        def begin(self):
+            self.calls.append('begin')
+
+        def commit(self):
+            self.calls.append('commit')
+
+        def rollback(self):
+            self.calls.append('rollback')
+
+    class TransactionalPool(FakePool):
+        def _connect(self):
+            connection = TransactionalConnection()
+            self.connected.append(connection)
+            return connection
+
+    pool = TransactionalPool(size=1, timeout=0)
+    with pool.transaction():
+        pass
+    with pytest.raises(ValueError):
+        with pool.transaction():
+            raise ValueError('bad row')
+    assert pool.connected[0].calls == ['begin', 'commit', 'begin', 'rollback']
+
+def test_closed_pool_refuses_checkouts(clock):
+    pool = FakePool(size=1, timeout=0)
+    with pool.connection() as connection:
+        pass
+    pool.close()
+    assert not connection.open
+    with pytest.raises(PoolTimeoutError):
+        pool.acquire()
@@ -0,0 +1,62 @@
+# test_querylog.py
+
+import json
+import logging
+import pytest
+from logic.querylog import QueryLog, fingerprint, summarize
+
+
+@pytest.mark.parametrize('statement, expected', [
+    ("SELECT * FROM t WHERE id IN (1, 2) AND name = 'x'", 'select * from t where id in (?+) and name = ?'),
+    ('SELECT * FROM t WHERE id IN (%s, %s, %s)', 'select * from t where id in (?+)'),
+    ('select  *\n from t -- trailing\n where a = %(a)s /* hint */', 'select * from t where a = ?'),
+    ("INSERT INTO t VALUES (1, 'a'), (2, 'b'), (3, 'c')", 'insert into t values (?+)...'),
+    ("UPDATE t SET x = 'it''s', y = -1.5e3, z = 0x1f WHERE col2 = ?", 'update t set x = ?, y = ?, z = ? where col2 = ?'),
+])
+def test_fingerprints(statement, expected):
+    assert fingerprint(statement) == expected
+
+def test_statements_with_different_values_share_a_fingerprint():
+    log = QueryLog(threshold_ms=-1, path='')
+    log.record("SELECT * FROM users WHERE email = 'alice@example.com'", 0.002, rows=1)
+    log.record(b"SELECT * FROM users WHERE email = 'bob@example.com'", 0.004, rows=0)
+    [stats] = log.top()
+    assert stats['fingerprint'] == 'select * from users where email = ?'
+    assert (stats['count'], stats['rows'], stats['slow']) == (2, 1, 0)
+    assert stats['total_s'] == pytest.approx(0.006)
+    assert stats['max_s'] == pytest.approx(0.004)
+    assert stats['mean_s'] == pytest.approx(0.003)
+
+def test_the_lightest_shape_makes_room_for_a_new_one():
+    log = QueryLog(threshold_ms=-1, path='', max_fingerprints=2)
+    log.record('SELECT a FROM t', 0.5)
+    log.record('SELECT b FROM t', 0.1)
+    log.record('SELECT c FROM t', 0.2)
+    assert [stats['fingerprint'] for stats in log.top()] == ['select a from t', 'select c from t']
+    assert [stats['fingerprint'] for stats in log.top(1, by='count')] == ['select a from t']
+    log.reset()
+    assert log.top() == []
+
+def test_slow_statements_are_logged_by_fingerprint_only(tmp_path):
+    path = tmp_path / 'slow.jsonl'
+    log = QueryLog(threshold_ms=100, path=str(path))
+    log.record("SELECT * FROM users WHERE email = 'alice@example.com'", 0.25, rows=1)
+    log.record("SELECT * FROM users WHERE email = 'bob@example.com'", 0.01, rows=1)
+
+    text = path.read_text()
+    assert 'alice' not in text
+    [entry] = [json.loads(line) for line in text.splitlines()]
+    assert entry['fingerprint'] == 'select * from users where email = ?'
+    assert (entry['ms'], entry['rows']) == (250.0, 1)
+    assert 'test_querylog.py' in entry['site']
+    assert log.top()[0]['slow'] == 1
+
+    [shape] = summarize(str(path))
+    assert (shape['fingerprint'], shape['count']) == ('select * from users where email = ?', 1)
+
+def test_slow_statements_are_warned_without_a_log_file(caplog):
+    log = QueryLog(threshold_ms=0, path='')
+    with caplog.at_level(logging.WARNING, logger='logic.querylog'):
+        log.record("DELETE FROM sessions WHERE token = 'secret'", 0.001)
+    assert 'delete from sessions where token = ?' in caplog.text
+    assert 'secret' not in caplog.text
@@ -0,0 +1,118 @@
+# test_rollups.py
+
+import pytest
+from logic.rollups import rollup_deltas, apply_rollup_deltas, YEAR_TOTAL, ALL_CATEGORIES
+
+
+class RollupTable:
+    """
+    Stands in for a cursor on ExpenseTrackerRollups, applying the upsert and the delete
+    of apply_rollup_deltas the way MySQL does, amounts being DECIMAL(16, 2).
+    """
+
+    def __init__(self):
+        self.rows = {}
+        self.statements = []
+
+    def execute(self, query, params):
+        statement = query.split()[0]
+        self.statements.append(statement)
+        if statement == 'INSERT':
+            for start in range(0, len(params), 6):
+                *key, amount = params[start:start + 6]
+                key = tuple(key)
+                self.rows[key] = round(self.rows.get(key, 0) + amount, 2)
+        elif statement == 'DELETE':
+            for start in range(0, len(params), 5):
+                key = tuple(params[start:start + 5])
+                if self.rows.get(key) == 0:
+                    del self.rows[key]
+
+
+def test_item_counts_towards_its_month_year_and_kind_totals():
+    deltas = rollup_deltas('alice', [], [('March 2025', 'expense', 'Rent', 500)])
+    assert deltas == {
+        ('alice', 2025, 3, 'expense', 'Rent'): 500,
+        ('alice', 2025, 3, 'expense', ALL_CATEGORIES): 500,
+        ('alice', 2025, YEAR_TOTAL, 'expense', 'Rent'): 500,
+        ('alice', 2025, YEAR_TOTAL, 'expense', ALL_CATEGORIES): 500,
+    }
+
+def test_replacing_items_only_writes_the_difference():
+    old = [('March 2025', 'expense', 'Rent', 500), ('March 2025', 'expense', 'Food', 200)]
+    new = [('March 2025', 'expense', 'Rent', 500), ('March 2025', 'expense', 'Food', 250)]
+    deltas = rollup_deltas('alice', old, new)
+    # Rent is unchanged and needs no write, Food and the totals move by 50
+    assert all(key[4] != 'Rent' for key in deltas)
+    assert set(deltas.values()) == {50}
+    assert len(deltas) == 4
+
+def test_moving_an_amount_between_categories_keeps_the_totals():
+    deltas = rollup_deltas('alice', [('March 2025', 'expense', 'Rent', 500)],
+                           [('March 2025', 'expense', 'Food', 500)])
+    assert deltas == {
+        ('alice', 2025, 3, 'expense', 'Rent'): -500,
+        ('alice', 2025, 3, 'expense', 'Food'): 500,
+        ('alice', 2025, YEAR_TOTAL, 'expense', 'Rent'): -500,
+        ('alice', 2025, YEAR_TOTAL, 'expense', 'Food'): 500,
+    }
+
+def test_float_noise_is_not_written():
+    old = [('March 2025', 'income', 'Salary', 0.1), ('March 2025', 'income', 'Salary', 0.2)]
+    new = [('March 2025', 'income', 'Salary', 0.3)]
+    assert rollup_deltas('alice', old, new) == {}
+
+def test_periods_that_are_not_months_are_skipped():
+    assert rollup_deltas('alice', [], [('Holiday', 'expense', 'Travel', 900)]) == {}
+
+def test_applied_deltas_match_a_rebuild():
+    history = [
+        [('January 2025', 'income', 'Salary', 3000), ('January 2025', 'expense', 'Rent', 1200.5)],
+        [('January 2025', 'income', 'Salary', 3100), ('January 2025', 'expense', 'Food', 310.25)],
+        [('January 2025', 'income', 'Salary', 3100), ('January 2025', 'expense', 'Food', 0.1),
+         ('January 2025', 'expense', 'Food', 0.2)],
+    ]
+    table = RollupTable()
+    current = []
+    for items in history:
+        apply_rollup_deltas(table, rollup_deltas('alice', current, items))
+        current = items
+    assert table.rows == pytest.approx(rollup_deltas('alice', [], current))
+
+def test_rows_reaching_zero_are_deleted():
+    table = RollupTable()
+    items = [('March 2025', 'expense', 'Rent', 500), ('March 2025', 'income', 'Salary', 3000)]
+    apply_rollup_deltas(table, rollup_deltas('alice', [], items))
+    # Deleting the period leaves no zero rows behind
+    apply_rollup_deltas(table, rollup_deltas('alice', items, []))
+    assert table.rows == {}
+
+def test_only_lowered_rows_are_checked_for_zero():
+    table = RollupTable()
+    apply_rollup_deltas(table, rollup_deltas('alice', [], [('March 2025', 'expense', 'Rent', 500)]))
+    assert table.statements == ['INSERT']
+    apply_rollup_deltas(table, {})
+    assert table.statements == ['INSERT']
+
+def test_backend_rollups_follow_updates_and_deletions(storage):
+    storage.save_periods('alice', [
+        {'period': 'January 2025', 'incomes': {'Salary': 3000}, 'expenses': {'Rent': 1200, 'Food': 300}},
+        {'period': 'February 2025', 'incomes': {'Salary': 3000}, 'expenses': {'Rent': 1200}},
+        {'period': 'March 2024', 'incomes': {'Salary': 2800}, 'expenses': {}},
+    ])
+    storage.update_period('alice', 'January 2025', {'Salary': 3000}, {'Rent': 1200})
+
+    months = storage.rollup_rows('alice', 2025)
+    assert [row[:2] for row in months] == sorted(row[:2] for row in months)
+    categories = {(month, kind, category): amount for _, month, kind, category, amount in months}
+    # Food was removed from January, and no row is left for it
+    assert (1, 'expense', 'Food') not in categories
+    assert categories[(1, 'expense', ALL_CATEGORIES)] == 1200
+    assert categories[(2, 'income', 'Salary')] == 3000
+
+    years = {(year, kind, category): amount for year, _, kind, category, amount in storage.rollup_rows('alice')}
+    assert years[(2025, 'income', ALL_CATEGORIES)] == 6000
+    assert years[(2024, 'income', 'Salary')] == 2800
+
+    storage.clear_periods('alice')
+    assert storage.rollup_rows('alice') == []
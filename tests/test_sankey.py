@@ -0,0 +1,56 @@
+# test_sankey.py
+
+import pytest
+from logic import sankey
+from logic.cache import LRUCache
+from logic.sankey import sankey_figure, sankey_key, sankey_spec
+
+
+@pytest.fixture(autouse=True)
+def figures(monkeypatch):
+    figures = LRUCache(4, ttl=0)
+    monkeypatch.setattr(sankey, '_figures', figures)
+    return figures
+
+
+def test_incomes_flow_through_total_income_into_expenses():
+    data = sankey_spec({'Salary': 3000, 'Bonus': 500}, {'Rent': 1200, 'Food': 400, 'Savings': 1900})['data'][0]
+    assert data['node']['label'] == ['Salary', 'Bonus', 'Total Income', 'Rent', 'Food', 'Savings']
+    assert data['link'] == {
+        'source': [0, 1, 2, 2, 2],
+        'target': [2, 2, 3, 4, 5],
+        'value': [3000, 500, 1200, 400, 1900],
+    }
+
+def test_an_expense_named_like_an_income_gets_its_own_node():
+    data = sankey_spec({'Savings': 100}, {'Savings': 100})['data'][0]
+    assert data['node']['label'] == ['Savings', 'Total Income', 'Savings']
+    assert (data['link']['source'], data['link']['target']) == ([0, 1], [1, 2])
+
+def test_empty_period():
+    data = sankey_spec({}, {})['data'][0]
+    assert data['node']['label'] == ['Total Income']
+    assert data['link'] == {'source': [], 'target': [], 'value': []}
+
+def test_key_changes_with_labels_amounts_and_order():
+    key = sankey_key({'Salary': 3000}, {'Rent': 1200, 'Food': 400})
+    assert key == sankey_key({'Salary': 3000}, {'Rent': 1200, 'Food': 400})
+    assert key != sankey_key({'Salary': 3000}, {'Food': 400, 'Rent': 1200})
+    assert key != sankey_key({'Salary': 3000}, {'Rent': 1200, 'Food': 401})
+    assert key != sankey_key({'Salary': 3000}, {'Rent': 1200, 'Fuel': 400})
+    # The same label moving from incomes to expenses is a different figure
+    assert sankey_key({'A': 1}, {}) != sankey_key({}, {'A': 1})
+
+def test_figures_are_built_once_per_content(monkeypatch):
+    built = []
+    build = sankey.build
+    monkeypatch.setattr(sankey, 'build', lambda spec: built.append(spec) or build(spec))
+
+    first = sankey_figure({'Salary': 3000}, {'Rent': 1200})
+    assert sankey_figure({'Salary': 3000}, {'Rent': 1200}) is first
+    assert len(built) == 1
+    assert list(first.data[0].node.label) == ['Salary', 'Total Income', 'Rent']
+
+    other = sankey_figure({'Salary': 3000}, {'Rent': 1300})
+    assert other is not first
+    assert len(built) == 2
@@ -0,0 +1,53 @@
+# test_tracker.py
+
+import datetime
+import pytest
+import streamlit as st
+from streamlit.testing.v1 import AppTest
+from logic import storage as storage_module
+from logic.memory_storage import MemoryStorage
+from logic.util import OWNER
+
+YEAR = datetime.date.today().year
+
+
+def page():
+    from logic.tracker import f_instalments
+    f_instalments()
+
+
+@pytest.fixture
+def store(monkeypatch):
+    """
+    A MemoryStorage behind get_storage, with one account of bob's.
+    """
+    store = MemoryStorage()
+    store.save_accounts('bob', [dict(id=None, name='Loan', principal=1000.0, rate=5.0, term_months=12,
+                                     payment=100.0, opening_paid=0.0)])
+    monkeypatch.setattr(storage_module, '_storage', store)
+    return store
+
+
+def test_grid_edits_are_saved_for_the_session_user(store, monkeypatch):
+    def data_editor(frame, **kwargs):
+        # The user types a January payment into the instalments table, the accounts table is left as is
+        if 'Months' in frame:
+            frame = frame.copy()
+            frame.loc[0, 'Loan'] = 150.0
+        return frame
+
+    reruns = []
+    monkeypatch.setattr(st, 'data_editor', data_editor)
+    # AppTest of this Streamlit version cannot follow a rerun requested by the first run
+    monkeypatch.setattr(st, 'rerun', lambda: reruns.append(True))
+    at = AppTest.from_function(page, default_timeout=30)
+    at.session_state['username'] = 'bob'
+    at.session_state['instalments_layout'] = 'Grid'
+    at.run()
+
+    assert not at.exception and not at.error
+    payments, _ = store.load_instalments('bob', YEAR)
+    assert [(month, amount) for _, month, amount in payments] == [(1, 150.0)]
+    assert reruns == [True]
+    # Nothing was written for anybody else
+    assert store.load_instalments(OWNER, YEAR) == ([], [])
@@ -0,0 +1,34 @@
+# test_transfer.py
+
+import io
+import json
+import pytest
+from logic.transfer import iter_json_array
+
+ITEMS = [
+    {'Period': 'March 2025', 'Incomes': {'Salary': 3000}, 'Expenses': {'Rent': 1200}, 'Comment': 'a, b ] c'},
+    {'Period': 'April 2025', 'Incomes': {}, 'Expenses': {}, 'Comment': ''},
+    12345,
+    'text',
+    [1, 2],
+]
+
+
+@pytest.mark.parametrize('chunk_size', [1, 2, 7, 65536])
+def test_elements_split_across_chunks_are_decoded(chunk_size):
+    text = json.dumps(ITEMS, indent=2)
+    assert list(iter_json_array(io.StringIO(text), chunk_size)) == ITEMS
+
+def test_empty_arrays_and_leading_whitespace():
+    assert list(iter_json_array(io.StringIO('\n\n  [ ]'), 1)) == []
+
+def test_elements_are_yielded_before_the_end_is_read():
+    items = iter_json_array(io.StringIO('[{"Period": "March 2025"}, {"Period": '), 4)
+    assert next(items) == {'Period': 'March 2025'}
+    with pytest.raises(ValueError):
+        next(items)
+
+@pytest.mark.parametrize('text', ['', '{"Period": "March 2025"}', '[1, 2', '[1, }]'])
+def test_malformed_files_are_rejected(text):
+    with pytest.raises(ValueError):
+        list(iter_json_array(io.StringIO(text), 3))